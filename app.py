@@ -11,10 +11,21 @@ from views.directory import view_producers, view_places
 from views.details import view_producer_detail, view_wine_detail, view_bottle_detail, view_place_detail, view_appellation_detail, view_tasting_detail, view_vineyard_detail
 from views.summary import view_summary
 from views.map import view_map
+from geo_utils import clear_geometry_caches, geometry_memory_usage
+from shared import clear_query_cache, migrate_schema
+import profiler
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="WineLib", layout="wide", page_icon="🍷")
 
+# --- SCHEMA ---
+# Pages query columns added by later migrations; bring an older database up to date first
+try:
+    migrate_schema()
+except Exception as e:
+    st.error(f"Could not upgrade the database schema: {e}\n\nRun `python migrations.py` and restart the app.")
+    st.stop()
+
 # --- ROUTING & STATE ---
 NAV_OPTIONS = ["Cellar", "Tasting Notes", "Summary", "Producers", "Places", "Map"]
 
@@ -65,11 +76,22 @@ if current_view not in NAV_OPTIONS:
 st.sidebar.divider()
 if st.sidebar.button("Clear Cache", use_container_width=True):
     st.cache_data.clear()
+    clear_query_cache()
+    clear_geometry_caches()
     st.rerun()
 
+geo_usage = geometry_memory_usage()
+if geo_usage:
+    geo_mb = sum(u["bytes"] for u in geo_usage) / 1e6
+    st.sidebar.caption(f"Geometry in memory: ~{geo_mb:,.0f} MB in {len(geo_usage)} lookups",
+                       help="\n\n".join(f"{u['source']}: {u['features']} features, ~{u['bytes'] / 1e6:,.1f} MB" for u in geo_usage))
+
 # Final current view for rendering
 current_view = st.query_params.get("page", st.session_state["page"])
 
+# Opt-in per-page query/latency recording (WINELIB_PROFILE=1, see profiler.py)
+profiler.start_page(current_view, params)
+
 # --- MASTER ROUTING ---
 if current_view == "Cellar":
     view_cellar()
@@ -152,3 +174,5 @@ elif current_view in ["Edit Tasting", "Edit_Tasting"]:
 elif current_view == "Edit Place":
     if st.button("Cancel"): navigate_to("Place Detail", {"id": params.get("id")})
     form_place(params.get("id"))
+
+profiler.render_panel(profiler.finish_page())
@@ -0,0 +1,91 @@
+"""
+Database connection settings and engine factory, shared by the app (shared.py) and the
+command line tools. Unlike shared.py this module does not import Streamlit, so CLI
+engines get the same pool settings and SQLite pragmas (WAL, busy timeout) as the app.
+
+Usage:
+    from database import DB_URL, make_engine
+    engine = make_engine(DB_URL)
+"""
+import os
+from sqlalchemy import create_engine, make_url, event
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# PostgreSQL via DB_URL env var (e.g. docker-compose), or SQLite by default
+DATA_DIR = os.path.join(CURRENT_DIR, "data")
+os.makedirs(DATA_DIR, exist_ok=True)
+
+DB_URL = os.getenv("DB_URL", f"sqlite:///{os.path.join(DATA_DIR, 'winelib.db')}")
+# Optional read-only replica for the list views (cellar, tastings); writes always use DB_URL
+DB_READ_URL = os.getenv("DB_READ_URL")
+
+# Engine profile. Every Streamlit session runs its script in its own thread, so the pool
+# bounds how many connections concurrent users can open.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30")) # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")) # 0 = no limit
+
+# SQLite performance mode, applied to every new connection. WAL lets pages keep reading
+# while a form commits; synchronous=NORMAL is durable with WAL (only the last commits can be
+# lost on power failure, never corrupted). Set SQLITE_PERFORMANCE=0 for SQLite's defaults.
+SQLITE_PERFORMANCE = os.getenv("SQLITE_PERFORMANCE", "1").lower() not in ("0", "false", "no")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "30")) # seconds a writer waits for the lock
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": -1024 * int(os.getenv("SQLITE_CACHE_MB", "64")), # negative = KiB, per connection
+    "mmap_size": 1024 * 1024 * int(os.getenv("SQLITE_MMAP_MB", "256")),
+    "temp_store": "MEMORY",
+}
+
+def _is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+def engine_options(url):
+    """
+    create_engine keyword arguments for a database URL, from the DB_* environment variables.
+    
+    Args:
+        url: Database URL
+        
+    Returns:
+        dict of create_engine arguments
+    """
+    if url.startswith("sqlite"):
+        options = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}}
+        if _is_sqlite_file(url):
+            # Connections move between script threads through the pool, one thread at a time
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        return options
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        # Reuse the most recent connection so idle ones beyond the load can time out server-side
+        "pool_use_lifo": True,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql"):
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def make_engine(url):
+    """create_engine with engine_options(url), plus the SQLite pragmas on file databases."""
+    new_engine = create_engine(url, **engine_options(url))
+    if SQLITE_PERFORMANCE and _is_sqlite_file(url):
+        event.listen(new_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
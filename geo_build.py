@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Build derived geo data for the WineLib maps.
+
+1. Simplification pyramid: every parquet file in data/geo/ (france.parquet,
+   *_pdo.parquet, us_avas_combined.parquet and vineyards/*.parquet) gets
+   zoom-dependent simplified copies written next to it, e.g.
+   france.parquet -> france.z6.parquet, france.z9.parquet, france.z12.parquet.
+
+2. Geometry store: all sources and levels compiled into one indexed SQLite file
+   (data/geo/geometries.sqlite) of WKB geometries keyed by source file and lookup
+   key (INAO id, PDO id, AVA id, vineyard id). geo_utils reads single rows from it
+   instead of loading whole country files into dictionaries. The app compiles sources
+   that are missing or changed on first use, so the store doubles as a persistent
+   cache that survives restarts and "Clear Cache".
+
+Usage:
+    python geo_build.py                # Build missing or outdated levels and store entries
+    python geo_build.py --force        # Rebuild everything
+    python geo_build.py --skip-store   # Pyramid only
+    python geo_build.py --sync-extents # Store appellation/vineyard bounds and centroids in the database
+
+This module does not import Streamlit, so its helpers are shared by geo_utils.
+"""
+import os
+import re
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import threading
+from collections.abc import Mapping
+
+# Ensure this directory is in sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+# --- Config ---
+GEO_DIR = os.path.join(CURRENT_DIR, "data", "geo")
+VINEYARD_GEO_DIR = os.path.join(GEO_DIR, "vineyards")
+
+# Pyramid levels, named by the zoom they are simplified for.
+# Zooms below the first level use the first level; FULL_RES_ZOOM and above use the source file.
+LOD_ZOOMS = (6, 9, 12)
+FULL_RES_ZOOM = 15
+VINEYARD_MIN_ZOOM = 11  # Vineyards are sub-pixel below this zoom: maps and tiles skip them
+
+_LOD_RE = re.compile(r"\.z\d+\.parquet$")
+
+STORE_PATH = os.path.join(GEO_DIR, "geometries.sqlite")
+STORE_VERSION = 1  # Bump when the store layout or key rules change; older stores are rebuilt
+STORE_AUTOBUILD = os.getenv("GEO_STORE_AUTOBUILD", "1") != "0"
+FULL_RES_LOD = 0  # lod value of full resolution rows in the store
+
+
+def simplify_tolerance(zoom):
+    """
+    Simplification tolerance (in degrees) that is visually lossless at a given zoom level:
+    half a screen pixel of a 256px web mercator tile.
+    """
+    return 360.0 / (256 * 2 ** int(zoom)) / 2
+
+
+def is_lod_path(path):
+    """True for pyramid files (e.g. france.z9.parquet) as opposed to source files."""
+    return bool(_LOD_RE.search(path))
+
+
+def lod_path(path, lod):
+    """Path of the pyramid level `lod` for a source parquet file."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.z{lod}{ext}"
+
+
+def pick_lod(zoom):
+    """Pyramid level for a zoom, or None when full resolution is needed (or zoom unknown)."""
+    if zoom is None or zoom >= FULL_RES_ZOOM:
+        return None
+    levels = [z for z in LOD_ZOOMS if z <= zoom]
+    return levels[-1] if levels else LOD_ZOOMS[0]
+
+
+def lod_source(path, zoom):
+    """
+    Returns the file to read for a source parquet at a given zoom: the matching
+    pyramid level if it has been built, otherwise the source itself.
+    """
+    lod = pick_lod(zoom)
+    if lod is not None:
+        candidate = lod_path(path, lod)
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def discover_sources():
+    """All source geometry parquet files under data/geo (pyramid levels excluded)."""
+    paths = []
+    for pattern in ["france.parquet", "*_pdo.parquet", "us_avas_combined.parquet"]:
+        paths.extend(glob.glob(os.path.join(GEO_DIR, pattern)))
+    paths.extend(glob.glob(os.path.join(VINEYARD_GEO_DIR, "*.parquet")))
+    return sorted(p for p in set(paths) if not is_lod_path(p))
+
+
+def build_pyramid(force=False):
+    """Writes every missing or outdated pyramid level for all source files."""
+    import geopandas as gpd
+
+    sources = discover_sources()
+    if not sources:
+        print(f"[WARN] No parquet files found in {GEO_DIR}")
+        return
+
+    print(f"[*] Building simplification pyramid for {len(sources)} files (levels: {', '.join(f'z{z}' for z in LOD_ZOOMS)})")
+    for src in sources:
+        src_mtime = os.path.getmtime(src)
+        todo = [z for z in LOD_ZOOMS
+                if force or not os.path.exists(lod_path(src, z)) or os.path.getmtime(lod_path(src, z)) < src_mtime]
+        name = os.path.relpath(src, GEO_DIR)
+        if not todo:
+            print(f"  [SKIP] {name}: up to date")
+            continue
+
+        start = time.time()
+        gdf = gpd.read_parquet(src)
+        src_size = os.path.getsize(src)
+        sizes = []
+        for z in todo:
+            out = lod_path(src, z)
+            level = gdf.copy()
+            level["geometry"] = level.geometry.simplify(simplify_tolerance(z), preserve_topology=True)
+            level.to_parquet(out)
+            sizes.append(f"z{z} {os.path.getsize(out) / src_size:.0%}")
+        print(f"  [OK] {name}: {', '.join(sizes)} of source size ({time.time() - start:.1f}s)")
+
+    print("\n[DONE] Pyramid built.")
+
+
+# --- GEOMETRY STORE ---
+def source_name(path):
+    """Store name of a source parquet file: its path relative to data/geo."""
+    return os.path.relpath(path, GEO_DIR).replace(os.sep, "/")
+
+
+def _normalize_key(value):
+    """Lookup keys are stored as text; integral floats (e.g. 1234.0) are stored as ints."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def source_keys(gdf, path):
+    """
+    Lookup keys for a source GeoDataFrame, matching the geo_utils loaders:
+    INAO id_app, PDO pdo_id/osm_id, "US-AVA-{ava_id}" and vineyard id/vineyard_id.
+    Returns a Series of text keys (None where a row has no key) or None if no key column exists.
+    """
+    name = os.path.basename(path)
+    if name == "france.parquet":
+        columns, prefix = ["id_app"], ""
+    elif name == "us_avas_combined.parquet":
+        columns, prefix = ["ava_id"], "US-AVA-"
+    elif name.endswith("_pdo.parquet"):
+        columns, prefix = ["pdo_id", "osm_id"], ""
+    else:
+        columns, prefix = ["id", "vineyard_id"], ""
+
+    column = next((c for c in columns if c in gdf.columns), None)
+    if column is None:
+        return None
+    values = gdf[column]
+    valid = values.notna() & (values.astype(str) != "")
+    return values.map(lambda v: prefix + _normalize_key(v)).where(valid, None)
+
+
+def _open_store_for_write():
+    """Opens the store for writing, (re)creating the schema when missing or of another version."""
+    con = sqlite3.connect(STORE_PATH, timeout=60)
+    con.execute("PRAGMA journal_mode=WAL")
+    if con.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+        con.executescript("DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS geometries;")
+    con.executescript(f"""
+        CREATE TABLE IF NOT EXISTS sources (
+            source TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            features INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS geometries (
+            source TEXT NOT NULL,
+            key TEXT NOT NULL,
+            lod INTEGER NOT NULL,
+            min_lng REAL, min_lat REAL, max_lng REAL, max_lat REAL,
+            wkb BLOB NOT NULL,
+            PRIMARY KEY (source, key, lod)
+        ) WITHOUT ROWID;
+        PRAGMA user_version = {STORE_VERSION};
+    """)
+    return con
+
+
+def _compile_source(con, path):
+    """
+    Writes one source file (full resolution + pyramid levels) to the store in a single
+    transaction. Rows without a key or with a null/empty geometry are skipped.
+    Returns the number of geometries, or None if the file has no key column.
+    """
+    import shapely
+    import geopandas as gpd
+
+    name = source_name(path)
+    mtime = os.path.getmtime(path)
+    gdf = gpd.read_parquet(path)
+    keys = source_keys(gdf, path)
+    if keys is None:
+        return None
+    geoms = gdf.geometry.values
+    valid = keys.notna().values & ~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)
+    gdf = gdf[valid]
+    keys = keys[valid].tolist()
+
+    rows = []
+    for lod in (FULL_RES_LOD,) + LOD_ZOOMS:
+        geoms = gdf.geometry if lod == FULL_RES_LOD else gdf.geometry.simplify(simplify_tolerance(lod), preserve_topology=True)
+        bounds = geoms.bounds.values.tolist()
+        blobs = shapely.to_wkb(geoms.values)
+        rows.extend((name, k, lod, *b, blob) for k, b, blob in zip(keys, bounds, blobs))
+
+    with con:
+        con.execute("DELETE FROM geometries WHERE source = ?", (name,))
+        con.executemany("INSERT OR REPLACE INTO geometries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        con.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (name, mtime, len(keys)))
+    return len(keys)
+
+
+def build_store(force=False):
+    """Compiles every source file (full resolution + pyramid levels) into the SQLite store."""
+    sources = discover_sources()
+    if not sources:
+        print(f"[WARN] No parquet files found in {GEO_DIR}")
+        return
+
+    con = _open_store_for_write()
+    try:
+        known = dict(con.execute("SELECT source, mtime FROM sources").fetchall())
+
+        print(f"[*] Compiling {len(sources)} files into {os.path.relpath(STORE_PATH, CURRENT_DIR)}")
+        for path in sources:
+            name = source_name(path)
+            if not force and known.get(name) == os.path.getmtime(path):
+                print(f"  [SKIP] {name}: up to date")
+                continue
+
+            start = time.time()
+            count = _compile_source(con, path)
+            if count is None:
+                print(f"  [WARN] {name}: no key column, skipping")
+                continue
+            print(f"  [OK] {name}: {count} geometries x {len(LOD_ZOOMS) + 1} levels ({time.time() - start:.1f}s)")
+
+        # Drop sources whose parquet file is gone
+        current = {source_name(p) for p in sources}
+        with con:
+            for name in set(known) - current:
+                con.execute("DELETE FROM geometries WHERE source = ?", (name,))
+                con.execute("DELETE FROM sources WHERE source = ?", (name,))
+    finally:
+        con.close()
+    _reset_store()
+
+    print("\n[DONE] Geometry store built.")
+
+
+def compile_sources(paths):
+    """
+    Compiles missing or outdated source files into the store on demand (used by the app
+    on a cold cache). Returns False if the store can't be written (e.g. read-only data dir)
+    or a source fails to compile; callers then read the parquet files. A failed source is
+    not retried until its file changes.
+    """
+    with _compile_lock:
+        store = get_store()
+        todo = [p for p in paths if os.path.exists(p) and (store is None or not store.is_fresh(p))]
+        if not todo:
+            return True
+        if any(_failed_sources.get(p) == os.path.getmtime(p) for p in todo):
+            return False
+        ok = True
+        try:
+            con = _open_store_for_write()
+            try:
+                for path in todo:
+                    try:
+                        _compile_source(con, path)
+                    except Exception as e:
+                        print(f"Error compiling {source_name(path)} into the geometry store: {e}")
+                        _failed_sources[path] = os.path.getmtime(path)
+                        ok = False
+            finally:
+                con.close()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error compiling geometry store: {e}")
+            return False
+        finally:
+            _reset_store()
+    return ok
+
+
+class GeometryStore:
+    """Read-only access to the compiled geometry store (one SQLite connection per thread)."""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        con = self._connection()
+        self.version = con.execute("PRAGMA user_version").fetchone()[0]
+        self.sources = dict(con.execute("SELECT source, mtime FROM sources").fetchall()) if self.version == STORE_VERSION else {}
+
+    def _connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.con = con
+        return con
+
+    def is_fresh(self, path):
+        """True if the source file is compiled and unchanged since the build."""
+        return os.path.exists(path) and self.sources.get(source_name(path)) == os.path.getmtime(path)
+
+    def fetch(self, sources, key, lod):
+        """WKB of key at lod; when several sources have the key, the last one wins."""
+        placeholders = ",".join("?" * len(sources))
+        rows = self._connection().execute(
+            f"SELECT source, wkb FROM geometries WHERE source IN ({placeholders}) AND key = ? AND lod = ?",
+            (*sources, key, lod)
+        ).fetchall()
+        if not rows:
+            return None
+        by_source = dict(rows)
+        return next(by_source[s] for s in reversed(sources) if s in by_source)
+
+    def keys(self, sources):
+        placeholders = ",".join("?" * len(sources))
+        return [r[0] for r in self._connection().execute(
+            f"SELECT DISTINCT key FROM geometries WHERE source IN ({placeholders}) AND lod = ?",
+            (*sources, FULL_RES_LOD)
+        )]
+
+
+class StoreLookup(Mapping):
+    """
+    Dictionary-like view over one or more compiled sources at one level of detail.
+    Geometries are read from the store on demand, so callers written against the
+    {key: geometry} dicts of the parquet loaders only pay for the keys they touch.
+    """
+
+    def __init__(self, store, paths, zoom=None):
+        self.store = store
+        self.sources = [source_name(p) for p in paths]
+        lod = pick_lod(zoom)
+        self.lod = FULL_RES_LOD if lod is None else lod
+        self._cache = {}
+        self._len = None
+
+    def __getitem__(self, key):
+        import shapely
+        key = _normalize_key(key)
+        if key not in self._cache:
+            blob = self.store.fetch(self.sources, key, self.lod)
+            self._cache[key] = shapely.from_wkb(blob) if blob is not None else None
+        if self._cache[key] is None:
+            raise KeyError(key)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self.store.keys(self.sources))
+
+    def __len__(self):
+        if self._len is None:
+            self._len = len(self.store.keys(self.sources))
+        return self._len
+
+    def __bool__(self):
+        return bool(self.sources)
+
+
+_store = None
+_store_stamp = None
+_store_lock = threading.Lock()
+_compile_lock = threading.Lock()
+_failed_sources = {} # path -> mtime of a source that failed to compile
+
+
+def _stamp():
+    # With WAL, writes land in the -wal file before the main file changes
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in (STORE_PATH, STORE_PATH + "-wal"))
+
+
+def _reset_store():
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def get_store():
+    """The compiled GeometryStore, reopened when the file is rebuilt, or None if not built."""
+    global _store, _store_stamp
+    if not os.path.exists(STORE_PATH):
+        return None
+    stamp = _stamp()
+    with _store_lock:
+        if _store is None or _store_stamp != stamp:
+            try:
+                store = GeometryStore(STORE_PATH)
+            except sqlite3.Error as e:
+                print(f"Error opening geometry store: {e}")
+                return None
+            if store.version != STORE_VERSION:
+                return None
+            _store, _store_stamp = store, stamp
+        return _store
+
+
+def store_lookup(paths, zoom=None):
+    """
+    StoreLookup over source parquet files. Sources missing from the store or changed
+    since they were compiled are compiled first (once, persisted across restarts) unless
+    GEO_STORE_AUTOBUILD=0. Returns None if the store can't serve them (callers then
+    fall back to reading parquet).
+    """
+    if not paths:
+        return None
+    store = get_store()
+    if store is None or not all(store.is_fresh(p) for p in paths):
+        if not STORE_AUTOBUILD or not all(os.path.exists(p) for p in paths) or not compile_sources(paths):
+            return None
+        store = get_store()
+        if store is None or not all(store.is_fresh(p) for p in paths):
+            return None
+    return StoreLookup(store, paths, zoom)
+
+
+def sync_extents():
+    """Stores the bounds/centroid of every appellation and vineyard geometry in the database."""
+    import shared
+    import geo_utils
+
+    print("[*] Syncing geometry extents (bounds/centroid) to the database")
+    start = time.time()
+    session = shared.get_session()
+    try:
+        found, cleared = geo_utils.sync_geometry_extents(session)
+    finally:
+        session.close()
+    print(f"  [OK] {found} extents stored, {cleared} without geometry ({time.time() - start:.1f}s)")
+    print("\n[DONE] Extents synced.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build derived WineLib geo data")
+    parser.add_argument("--force", action="store_true", help="Rebuild every pyramid level and store entry")
+    parser.add_argument("--skip-store", action="store_true", help="Only build the pyramid files")
+    parser.add_argument("--sync-extents", action="store_true", help="Only sync appellation/vineyard bounds and centroids to the database")
+    args = parser.parse_args()
+
+    if args.sync_extents:
+        sync_extents()
+        sys.exit(0)
+
+    build_pyramid(force=args.force)
+    if not args.skip_store:
+        print()
+        build_store(force=args.force)
@@ -4,6 +4,9 @@ import streamlit as st
 import geopandas as gpd
 import json
 import glob
+import time
+from types import MappingProxyType
+import shapely
 
 # Ensure this directory is in sys.path for local imports
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -11,8 +14,10 @@ if CURRENT_DIR not in sys.path:
     sys.path.insert(0, CURRENT_DIR)
 
 import shared
+import profiler
 
 from shared import get_region_name
+from geo_build import simplify_tolerance, lod_source, is_lod_path, pick_lod, store_lookup, LOD_ZOOMS, FULL_RES_ZOOM, VINEYARD_MIN_ZOOM
 
 # ISO to country name mapping (consistent across ETL and Streamlit)
 ISO_MAP = shared.ISO_MAP
@@ -24,6 +29,29 @@ if st.context.theme["type"] == "dark":
 if st.context.theme["type"] == "light":
     AVAILABLE_TILESETS.append("CartoDB positron")
 
+# Optional local vector tile endpoint (see tile_server.py). Set TILE_SERVER_PORT to enable it;
+# it listens on TILE_SERVER_HOST (default 127.0.0.1, local connections only).
+# TILE_SERVER_URL overrides the address browsers use to reach it (e.g. behind a proxy).
+TILE_SERVER_PORT = os.getenv("TILE_SERVER_PORT")
+TILE_SERVER_HOST = os.getenv("TILE_SERVER_HOST") or "127.0.0.1"
+TILE_SERVER_URL = os.getenv("TILE_SERVER_URL") or (f"http://localhost:{TILE_SERVER_PORT}" if TILE_SERVER_PORT else None)
+
+def render_map(folium_map, **kwargs):
+    """
+    st_folium, counting the map's HTML in the page profile when profiling is enabled.
+    
+    Args:
+        folium_map: folium.Map to render
+        **kwargs: st_folium arguments (height, width, key, returned_objects...)
+        
+    Returns:
+        st_folium's return value
+    """
+    from streamlit_folium import st_folium
+    if profiler.ENABLED:
+        profiler.add_html("map", folium_map.get_root().render())
+    return st_folium(folium_map, **kwargs)
+
 def add_tile_layers(folium_map):
     """
     Add multiple tile layers to a folium map for user selection.
@@ -61,34 +89,96 @@ def add_tile_layers(folium_map):
     folium.LayerControl(collapsed=False).add_to(folium_map)
     return folium_map
 
-@st.cache_data
-def get_inao_data():
-    """Load French INAO parquet data."""
+# --- GEOMETRY SOURCES ---
+# Parquet fallbacks (when the geometry store can't serve a source) are loaded once per
+# process with st.cache_resource and shared by reference as read-only mappings, instead
+# of st.cache_data copying every polygon on each call. Store-backed lookups (StoreLookup)
+# only hold the rows a call reads and are dropped with it; what stays in memory on that
+# path is the spatial indexes. Memory use of both is tracked per source.
+_source_usage = {}
+
+# Tile URL version: changes when the in-memory geometry does (new process, "Clear Cache"),
+# so browsers don't keep serving tiles they cached from an older index
+_tiles_version = time.time_ns()
+
+def _record_usage(key, source, geoms, start):
+    """Records the approximate size of geometries kept in memory under a source label."""
+    values = [g for g in geoms if g is not None]
+    coords = int(shapely.get_num_coordinates(values).sum()) if values else 0
+    _source_usage[key] = {
+        "source": source,
+        "features": len(values),
+        # Approximation: 16 bytes per coordinate pair plus per-object overhead
+        "bytes": coords * 16 + len(values) * 200,
+        "load_s": round(time.time() - start, 3),
+    }
+
+def _geometry_resource(geoms, paths, start):
+    """Freezes a loaded {key: geometry} dict into a shared read-only mapping and records its size."""
+    if not geoms:
+        return MappingProxyType(geoms)
+    source = ", ".join(os.path.relpath(p, os.path.join(CURRENT_DIR, "data", "geo")) for p in paths)
+    _record_usage(tuple(paths), source, geoms.values(), start)
+    return MappingProxyType(geoms)
+
+def geometry_memory_usage():
+    """Geometry held in memory (parquet lookups and spatial indexes): list of {source, features, bytes, load_s}, largest first."""
+    return sorted(_source_usage.values(), key=lambda u: u["bytes"], reverse=True)
+
+def clear_geometry_caches():
+    """Drops the shared geometry lookups and the spatial index (the on-disk store is kept)."""
+    global _tiles_version
+    for loader in (_load_inao_data, _load_country_pdo_data, _load_vineyard_files, _load_ava_data):
+        loader.clear()
+    _source_usage.clear()
+    get_spatial_index.clear()
+    get_geometry_names.clear()
+    _tiles_version = time.time_ns()
+
+def get_inao_data(zoom=None):
+    """
+    Load French INAO geometries: from the compiled geometry store if built,
+    otherwise from parquet (the simplification pyramid level for zoom, if built).
+    """
     path = os.path.join(CURRENT_DIR, "data", "geo", "france.parquet")
+    lookup = store_lookup([path], zoom)
+    if lookup is not None:
+        return lookup
+    return _load_inao_data(lod_source(path, zoom))
+
+@st.cache_resource
+def _load_inao_data(path):
+    start = time.time()
     if os.path.exists(path):
         try:
             gdf = gpd.read_parquet(path)
             if 'id_app' in gdf.columns:
-               return gdf.set_index('id_app')['geometry'].to_dict()
+               return _geometry_resource(gdf.set_index('id_app')['geometry'].to_dict(), [path], start)
         except: pass
-    return {}
+    return _geometry_resource({}, [path], start)
 
-@st.cache_data
-def get_country_pdo_data(country_iso):
+def get_country_pdo_data(country_iso, zoom=None):
     """Load country-specific PDO geometries from app_data/geo/{country}_pdo.parquet"""
     country_name = ISO_MAP.get(country_iso.upper(), country_iso.lower())
     path = os.path.join(CURRENT_DIR, "data", "geo", f"{country_name}_pdo.parquet")
-    
+    lookup = store_lookup([path], zoom)
+    if lookup is not None:
+        return lookup
+    return _load_country_pdo_data(lod_source(path, zoom))
+
+@st.cache_resource
+def _load_country_pdo_data(path):
+    start = time.time()
     if os.path.exists(path):
         try:
             gdf = gpd.read_parquet(path)
             # Match on pdo_id (or osm_id if pdo_id is missing, depending on ETL version)
             if 'pdo_id' in gdf.columns:
-                return gdf.set_index('pdo_id')['geometry'].to_dict()
+                return _geometry_resource(gdf.set_index('pdo_id')['geometry'].to_dict(), [path], start)
             elif 'osm_id' in gdf.columns:
-                return gdf.set_index('osm_id')['geometry'].to_dict()
+                return _geometry_resource(gdf.set_index('osm_id')['geometry'].to_dict(), [path], start)
         except: pass
-    return {}
+    return _geometry_resource({}, [path], start)
 
 def get_vineyard_geo_paths(region, appellation_name=None):
     """
@@ -106,7 +196,7 @@ def get_vineyard_geo_paths(region, appellation_name=None):
     if region:
         safe_name = region.lower().replace(" ", "_").replace("/", "_")
         path_pattern = os.path.join(base_path, f"{safe_name}_*.parquet")
-        paths.extend(glob.glob(path_pattern))
+        paths.extend(p for p in glob.glob(path_pattern) if not is_lod_path(p))
     
     # 2. Burgundy Premier Crus
     # Include if explicitly requested OR broad load (appellation_name is None)
@@ -118,8 +208,7 @@ def get_vineyard_geo_paths(region, appellation_name=None):
 
     return list(set(paths))
 
-@st.cache_data
-def get_vineyard_data(region_name, appellation_name=None):
+def get_vineyard_data(region_name, appellation_name=None, zoom=None):
     """Loads all relevant vineyard geometries for a region."""
     if not region_name:
         return {}
@@ -127,7 +216,14 @@ def get_vineyard_data(region_name, appellation_name=None):
     files = get_vineyard_geo_paths(region_name, appellation_name)
     if not files:
         return {}
-    
+    lookup = store_lookup(sorted(files), zoom)
+    if lookup is not None:
+        return lookup
+    return _load_vineyard_files(tuple(sorted(lod_source(f, zoom) for f in files)))
+
+@st.cache_resource
+def _load_vineyard_files(files):
+    start = time.time()
     combined_geoms = {}
     for f in files:
         try:
@@ -138,132 +234,193 @@ def get_vineyard_data(region_name, appellation_name=None):
                 combined_geoms.update(gdf.set_index('vineyard_id')['geometry'].to_dict())
         except: pass
             
-    return combined_geoms
+    return _geometry_resource(combined_geoms, files, start)
 
-@st.cache_data
-def get_ava_data():
+def get_ava_data(zoom=None):
     """Load US AVA parquet data."""
     # Robust path construction
     path = os.path.join(CURRENT_DIR, "data", "geo", "us_avas_combined.parquet")
+    lookup = store_lookup([path], zoom)
+    if lookup is not None:
+        return lookup
+    return _load_ava_data(lod_source(path, zoom))
+
+@st.cache_resource
+def _load_ava_data(path):
+    start = time.time()
     if os.path.exists(path):
         try:
             gdf = gpd.read_parquet(path)
             # Create a lookup map. 
             # We need to map our constructed pdo_id back to geometry.
             # Our pdo_id format is "US-AVA-{ava_id}"
-            
-            lookup = {}
-            for _, row in gdf.iterrows():
-                try:
-                    aid = row.get('ava_id')
-                    if aid:
-                         pid = f"US-AVA-{str(aid)}"
-                         lookup[pid] = row['geometry']
-                except: pass
-            return lookup
+            if 'ava_id' in gdf.columns:
+                gdf = gdf[gdf['ava_id'].notna() & (gdf['ava_id'].astype(str) != "")]
+                return _geometry_resource(dict(zip("US-AVA-" + gdf['ava_id'].astype(str), gdf.geometry)), [path], start)
         except Exception as e:
             print(f"Error loading AVA data: {e}")
             pass
-    return {}
+    return _geometry_resource({}, [path], start)
 
-def resolve_app_geometry(app, inao_lookup=None, pdo_lookups=None, ava_lookup=None):
-    """Resolves appellation geometry from various sources (INAO, PDO, AVA, DB)."""
-    
+def _is_us_app(app):
+    return bool(app.pdo_id and app.region_obj and app.region_obj.country in ["United States", "USA"])
+
+def _is_france_app(app):
+    # Robust France check: DB country field is "France", or name is "France", or pdo_id contains -FR-
+    region = get_region_name(app)
     pdo_id = getattr(app, 'pdo_id', '') or ''
+    return bool((app.region_obj and app.region_obj.country == "France") or
+                (region and region.lower() == "france") or
+                (pdo_id and '-FR-' in pdo_id.upper()))
+
+def _pdo_country(app):
+    """ISO code of a non-France PDO id (e.g. "PDO-IT-A1234" -> "IT"), or None."""
+    parts = (app.pdo_id or '').split('-')
+    if len(parts) >= 2 and parts[1] not in ("FR", "AVA"): # Skip FR and our custom AVA
+        return parts[1]
+    return None
+
+def resolve_app_geometries(apps, inao_lookup=None, pdo_lookups=None, ava_lookup=None, zoom=None):
+    """
+    Resolves the geometries of many appellations, loading each source once.
+    
+    Sources are tried in order (US AVA, France INAO, country PDO, DB GeoJSON) and
+    each appellation takes the first that has it, as in resolve_app_geometry.
+    
+    Args:
+        apps: Appellation objects
+        inao_lookup, ava_lookup: Optional preloaded lookups
+        pdo_lookups: Optional dict of ISO code -> lookup, filled as countries are loaded
+        zoom: Map zoom, selects the simplification pyramid level
+        
+    Returns:
+        dict of Appellation.id -> geometry (dict or Shapely geometry); unresolved ids are omitted
+    """
+    result = {}
+    pending = list(apps)
     
     # 0. US AVAs
-    # Simplified logic: If country is US and we have a PDO ID, look it up.
-    if app.pdo_id and app.region_obj and app.region_obj.country in ["United States", "USA"]:
+    # The pdo_id stored in DB is like "US-AVA-temecula_valley", as are the ava_lookup keys
+    candidates = [a for a in pending if _is_us_app(a)]
+    if candidates:
         if ava_lookup is None:
-            ava_lookup = get_ava_data()
-        
-        # The pdo_id stored in DB is like "US-AVA-temecula_valley"
-        # The ava_lookup keys are also "US-AVA-temecula_valley"
-        if app.pdo_id in ava_lookup:
-            return ava_lookup[app.pdo_id]
-
-
+            ava_lookup = get_ava_data(zoom)
+        for app in candidates:
+            val = ava_lookup.get(app.pdo_id)
+            if val is not None:
+                result[app.id] = val
+        pending = [a for a in pending if a.id not in result]
+    
     # 1. France INAO
-    # Only load IF region is in France or it has an inao_id / FR pdo_id
-    if app.inao_id:
-        region = get_region_name(app)
-        
-        # Robust France check: DB country field is "France", or name is "France", or pdo_id contains -FR-
-        is_france = (app.region_obj and app.region_obj.country == "France") or \
-                    (region and region.lower() == "france") or \
-                    (pdo_id and '-FR-' in pdo_id.upper())
-        
-        if is_france:
-            if inao_lookup is None:
-                inao_lookup = get_inao_data()
-            
+    candidates = [a for a in pending if a.inao_id and _is_france_app(a)]
+    if candidates:
+        if inao_lookup is None:
+            inao_lookup = get_inao_data(zoom)
+        for app in candidates:
             # Type safety: inao_id might be int in DB but str in parquet index
             val = inao_lookup.get(app.inao_id)
             if val is None:
                 val = inao_lookup.get(str(app.inao_id))
-            
             if val is not None:
-                return val
+                result[app.id] = val
+        pending = [a for a in pending if a.id not in result]
+    
+    # 2. Non-France PDO, one lookup per country
+    by_country = {}
+    for app in pending:
+        iso = _pdo_country(app)
+        if iso:
+            by_country.setdefault(iso, []).append(app)
+    if pdo_lookups is None:
+        pdo_lookups = {}
+    for iso, country_apps in by_country.items():
+        if iso not in pdo_lookups:
+            pdo_lookups[iso] = get_country_pdo_data(iso, zoom)
+        lookup = pdo_lookups[iso]
+        for app in country_apps:
+            val = lookup.get(app.pdo_id)
+            if val is not None:
+                result[app.id] = val
+    pending = [a for a in pending if a.id not in result]
     
-    # 2. Non-France PDO
-    if app.pdo_id:
-        try:
-            parts = app.pdo_id.split('-')
-            if len(parts) >= 2:
-                iso = parts[1]
-                if iso != "FR" and iso != "AVA": # Skip FR and our custom AVA
-                    if pdo_lookups is not None:
-                        if iso not in pdo_lookups:
-                            pdo_lookups[iso] = get_country_pdo_data(iso)
-                        lookup = pdo_lookups[iso]
-                    else:
-                        lookup = get_country_pdo_data(iso)
-                    
-                    if app.pdo_id in lookup:
-                        return lookup[app.pdo_id]
-        except: pass
-        
     # 3. Fallback to GeoJSON in DB
-    if app.geojson:
-        try:
-            return json.loads(app.geojson)
-        except: pass
-    return None
+    for app in pending:
+        if app.geojson:
+            try:
+                result[app.id] = json.loads(app.geojson)
+            except: pass
+    return result
+
+def resolve_app_geometry(app, inao_lookup=None, pdo_lookups=None, ava_lookup=None, zoom=None):
+    """
+    Resolves appellation geometry from various sources (INAO, PDO, AVA, DB).
+    With a zoom, parquet geometries come from the matching simplification pyramid level.
+    """
+    return resolve_app_geometries([app], inao_lookup, pdo_lookups, ava_lookup, zoom).get(app.id)
 
-def resolve_vine_geometry(vineyard, region_name=None, appellation_name=None, field_lookup=None):
-    """Resolves vineyard geometry from various sources (Parquet, DB)."""
-    # 1. Parquet
-    if vineyard.vineyard_id:
-        if not region_name:
-            region_name = get_region_name(vineyard)
-            
-        if field_lookup is None and region_name:
-            field_lookup = get_vineyard_data(region_name, appellation_name)
+def resolve_vine_geometries(vines, region_name=None, appellation_name=None, field_lookups=None, zoom=None):
+    """
+    Resolves the geometries of many vineyards, loading the parquet files of each region once.
+    
+    Args:
+        vines: Vineyard objects
+        region_name: Optional region for all vineyards (default: each vineyard's region)
+        appellation_name: Optional appellation narrowing the files loaded (e.g. Burgundy Premier Crus)
+        field_lookups: Optional dict of region name -> lookup, filled as regions are loaded
+        zoom: Map zoom, selects the simplification pyramid level
         
-        if field_lookup and vineyard.vineyard_id in field_lookup:
-            return field_lookup[vineyard.vineyard_id]
+    Returns:
+        dict of Vineyard.id -> geometry (dict or Shapely geometry); unresolved ids are omitted
+    """
+    result = {}
+    
+    # 1. Parquet, one lookup per region
+    by_region = {}
+    for v in vines:
+        if v.vineyard_id:
+            by_region.setdefault(region_name or get_region_name(v), []).append(v)
+    if field_lookups is None:
+        field_lookups = {}
+    for name, region_vines in by_region.items():
+        if name not in field_lookups:
+            field_lookups[name] = get_vineyard_data(name, appellation_name, zoom)
+        lookup = field_lookups[name]
+        if not lookup:
+            continue
+        for v in region_vines:
+            val = lookup.get(v.vineyard_id)
+            if val is not None:
+                result[v.id] = val
     
     # 2. DB Fallback
-    if vineyard.geojson:
-        try:
-            return json.loads(vineyard.geojson)
-        except: pass
-    return None
+    for v in vines:
+        if v.id not in result and v.geojson:
+            try:
+                result[v.id] = json.loads(v.geojson)
+            except: pass
+    return result
+
+def resolve_vine_geometry(vineyard, region_name=None, appellation_name=None, field_lookup=None, zoom=None):
+    """Resolves vineyard geometry from various sources (Parquet, DB)."""
+    if not region_name:
+        region_name = get_region_name(vineyard)
+    field_lookups = {region_name: field_lookup} if field_lookup is not None else None
+    return resolve_vine_geometries([vineyard], region_name, appellation_name, field_lookups, zoom).get(vineyard.id)
 
 
-from shapely.geometry import shape
+from shapely.geometry import shape, box, Point
+from shapely.strtree import STRtree
 
-def get_geometry_bounds(geo):
+def geometry_to_shape(geo):
     """
-    Returns bounds [[min_lat, min_lng], [max_lat, max_lng]] for a geometry.
-    Compatible with folium.fit_bounds().
+    Converts a resolved geometry (GeoJSON dict or Shapely geometry) to a Shapely geometry.
+    FeatureCollections are merged with unary_union.
     Returns None if geometry is invalid or empty.
     """
     if not geo:
         return None
         
     try:
-        # Convert to Shapely Geometry
         geom = None
         if isinstance(geo, dict):
             type_ = geo.get('type')
@@ -285,15 +442,242 @@ def get_geometry_bounds(geo):
         elif hasattr(geo, 'geom_type'):
             geom = geo
             
-        if geom and not geom.is_empty:
-             minx, miny, maxx, maxy = geom.bounds
-             return [[miny, minx], [maxy, maxx]]  # [[min_lat, min_lng], [max_lat, max_lng]]
-             
+        if geom is not None and not geom.is_empty:
+            return geom
     except Exception:
         pass
     
     return None
 
+def get_geometry_bounds(geo):
+    """
+    Returns bounds [[min_lat, min_lng], [max_lat, max_lng]] for a geometry.
+    Compatible with folium.fit_bounds().
+    Returns None if geometry is invalid or empty.
+    """
+    geom = geometry_to_shape(geo)
+    if geom is None:
+        return None
+    minx, miny, maxx, maxy = geom.bounds
+    return [[miny, minx], [maxy, maxx]]  # [[min_lat, min_lng], [max_lat, max_lng]]
+
+
+def zoom_for_bounds(bounds):
+    """
+    Estimates a folium zoom level that fits bounds [[min_lat, min_lng], [max_lat, max_lng]].
+    Useful where fit_bounds can't be used (e.g. st_folium with a controlled center/zoom).
+    """
+    import math
+    (min_lat, min_lng), (max_lat, max_lng) = bounds
+    max_diff = max(max_lat - min_lat, max_lng - min_lng, 0.01)
+    zoom = int(math.log2(360 / max_diff))
+    return max(2, min(zoom, 15))
+
+def resolve_for_map(resolve, obj, **kwargs):
+    """
+    Resolves a geometry at the simplification level a map fitted to it will display.
+    
+    Args:
+        resolve: resolve_app_geometry or resolve_vine_geometry
+        obj: Appellation or Vineyard object
+        **kwargs: extra arguments for the resolver (e.g. region_name)
+        
+    Returns:
+        The resolved geometry (dict or Shapely geometry) or None
+    """
+    with profiler.timed("geometry"):
+        return _resolve_for_map(resolve, obj, **kwargs)
+
+def _resolve_for_map(resolve, obj, **kwargs):
+    bounds = getattr(obj, 'bounds', None)
+    if bounds:
+        return resolve(obj, zoom=zoom_for_bounds(bounds), **kwargs)
+
+    coarse = resolve(obj, zoom=LOD_ZOOMS[0], **kwargs)
+    bounds = get_geometry_bounds(coarse)
+    if not bounds:
+        return coarse
+    zoom = zoom_for_bounds(bounds)
+    if pick_lod(zoom) == LOD_ZOOMS[0]:
+        return coarse
+    return resolve(obj, zoom=zoom, **kwargs)
+
+def resolve_many_for_map(resolve_many, objs, **kwargs):
+    """
+    Batch version of resolve_for_map: objects are grouped by the simplification level
+    their map will display and each level is resolved with one resolve_many call.
+    
+    Args:
+        resolve_many: resolve_app_geometries or resolve_vine_geometries
+        objs: Appellation or Vineyard objects
+        **kwargs: extra arguments for the resolver (not preloaded lookups, levels differ)
+        
+    Returns:
+        dict of id -> geometry (dict or Shapely geometry)
+    """
+    with profiler.timed("geometry"):
+        return _resolve_many_for_map(resolve_many, objs, **kwargs)
+
+def _resolve_many_for_map(resolve_many, objs, **kwargs):
+    def level_zoom(zoom):
+        return pick_lod(zoom) or FULL_RES_ZOOM
+
+    result = {}
+    levels = {}
+    unknown = []
+    for obj in objs:
+        bounds = getattr(obj, 'bounds', None)
+        if bounds:
+            levels.setdefault(level_zoom(zoom_for_bounds(bounds)), []).append(obj)
+        else:
+            unknown.append(obj)
+
+    # Without stored bounds, resolve coarse first and refine where the map zooms in further
+    if unknown:
+        coarse = resolve_many(unknown, zoom=LOD_ZOOMS[0], **kwargs)
+        for obj in unknown:
+            geom = coarse.get(obj.id)
+            bounds = get_geometry_bounds(geom) if geom is not None else None
+            zoom = zoom_for_bounds(bounds) if bounds else LOD_ZOOMS[0]
+            if pick_lod(zoom) == LOD_ZOOMS[0]:
+                if geom is not None:
+                    result[obj.id] = geom
+            else:
+                levels.setdefault(level_zoom(zoom), []).append(obj)
+
+    for zoom, group in levels.items():
+        result.update(resolve_many(group, zoom=zoom, **kwargs))
+    return result
+
+# --- SPATIAL INDEX ---
+class SpatialIndex:
+    """
+    STRtree over all appellation and vineyard geometries, keyed by database id.
+    
+    Query results are lists of (kind, id) tuples where kind is "Appellation"
+    or "Vineyard" and id is Appellation.id / Vineyard.id.
+    """
+    def __init__(self, entries):
+        """
+        Args:
+            entries: iterable of (kind, id, shapely geometry)
+        """
+        self.keys = []
+        self.geoms = []
+        for kind, obj_id, geom in entries:
+            if geom is None or geom.is_empty:
+                continue
+            self.keys.append((kind, obj_id))
+            self.geoms.append(geom)
+        self._positions = {k: i for i, k in enumerate(self.keys)}
+        self.tree = STRtree(self.geoms) if self.geoms else None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def geometry(self, kind, obj_id):
+        """Returns the indexed Shapely geometry for an appellation/vineyard id, or None."""
+        pos = self._positions.get((kind, obj_id))
+        return self.geoms[pos] if pos is not None else None
+
+    def query_intersects(self, geom, kind=None):
+        """Returns (kind, id) of every indexed geometry intersecting geom."""
+        if self.tree is None or geom is None:
+            return []
+        hits = sorted(self.tree.query(geom, predicate="intersects"))
+        keys = [self.keys[i] for i in hits]
+        if kind:
+            keys = [k for k in keys if k[0] == kind]
+        return keys
+
+    def query_bbox(self, min_lng, min_lat, max_lng, max_lat, kind=None):
+        """Returns (kind, id) of every indexed geometry intersecting the bounding box."""
+        return self.query_intersects(box(min_lng, min_lat, max_lng, max_lat), kind=kind)
+
+    def query_point(self, lng, lat, kind=None):
+        """Returns (kind, id) of every indexed geometry containing the point."""
+        return self.query_intersects(Point(lng, lat), kind=kind)
+
+
+def build_spatial_index(session, zoom=None):
+    """
+    Builds a SpatialIndex from every geometry source: france.parquet, the *_pdo.parquet
+    files, us_avas_combined.parquet, data/geo/vineyards/*.parquet and DB GeoJSON fallbacks.
+    
+    Args:
+        session: SQLAlchemy session
+        zoom: Map zoom whose simplification level to index (default: full resolution)
+    """
+    from sqlalchemy import or_
+    from sqlalchemy.orm import joinedload
+    from shared import Appellation, Vineyard
+
+    entries = []
+
+    # 1. Appellations (each source file is loaded once)
+    apps = session.query(Appellation).options(joinedload(Appellation.region_obj)).filter(
+        or_(Appellation.geojson.isnot(None), Appellation.inao_id.isnot(None), Appellation.pdo_id.isnot(None))
+    ).all()
+    geoms = resolve_app_geometries(apps, zoom=zoom)
+    for app in apps:
+        entries.append(("Appellation", app.id, geometry_to_shape(geoms.get(app.id))))
+
+    # 2. Vineyards (one lookup per region, including Burgundy Premier Crus)
+    vines = session.query(Vineyard).options(joinedload(Vineyard.region_obj)).filter(
+        or_(Vineyard.geojson.isnot(None), Vineyard.vineyard_id.isnot(None))
+    ).all()
+    geoms = resolve_vine_geometries(vines, zoom=zoom)
+    for v in vines:
+        entries.append(("Vineyard", v.id, geometry_to_shape(geoms.get(v.id))))
+
+    return SpatialIndex(entries)
+
+def sync_geometry_extents(session):
+    """
+    Stores the bounds/centroid of every resolved Appellation and Vineyard geometry
+    in their extent columns (see models.GeoExtentMixin).
+    
+    Returns:
+        tuple: (number of objects with an extent, number cleared)
+    """
+    from shared import Appellation, Vineyard
+
+    index = build_spatial_index(session)
+    found = cleared = 0
+    for kind, model in (("Appellation", Appellation), ("Vineyard", Vineyard)):
+        for obj in session.query(model).all():
+            geom = index.geometry(kind, obj.id)
+            obj.set_extent(geom)
+            if geom is not None and not geom.is_empty:
+                found += 1
+            else:
+                cleared += 1
+    session.commit()
+    return found, cleared
+
+@st.cache_resource
+def get_spatial_index(lod=None):
+    """
+    Process-wide SpatialIndex, built once and shared by reference across sessions.
+    
+    Args:
+        lod: Simplification level (one of LOD_ZOOMS) to index, default full resolution
+    """
+    start = time.time()
+    session = shared.get_session()
+    try:
+        index = build_spatial_index(session, zoom=lod)
+    finally:
+        session.close()
+    _record_usage(("spatial index", lod), f"spatial index ({f'z{lod}' if lod else 'full resolution'})", index.geoms, start)
+    return index
+
+def get_tile_index(zoom):
+    """SpatialIndex with the simplification level matching a map zoom (pick_lod)."""
+    lod = pick_lod(zoom)
+    # No argument for full resolution, so it shares the cached index the map pages use
+    return get_spatial_index(lod) if lod else get_spatial_index()
+
 
 def create_place_map(place):
     """
@@ -330,7 +714,7 @@ def create_place_map(place):
         return None
 
 
-def create_appellation_map(appellation, geo_data, color="#c27ba0"):
+def create_appellation_map(appellation, geo_data, color="#c27ba0", bounds=None):
     """
     Create a folium map for an appellation.
     
@@ -338,6 +722,7 @@ def create_appellation_map(appellation, geo_data, color="#c27ba0"):
         appellation: Appellation object with name attribute
         geo_data: GeoJSON geometry data (dict or Shapely geometry)
         color: Hex color for the polygon/marker (default: purple)
+        bounds: Optional precomputed bounds (appellation.bounds), skips geometry work
         
     Returns:
         folium.Map object or None if geometry is invalid
@@ -348,7 +733,7 @@ def create_appellation_map(appellation, geo_data, color="#c27ba0"):
     import folium
     
     try:
-        bounds = get_geometry_bounds(geo_data)
+        bounds = bounds or get_geometry_bounds(geo_data)
         
         if bounds:      
             min_lat, min_lng = bounds[0]
@@ -394,13 +779,14 @@ def create_appellation_map(appellation, geo_data, color="#c27ba0"):
         return None
 
 
-def create_vineyard_map(vineyard, geo_data):
+def create_vineyard_map(vineyard, geo_data, bounds=None):
     """
     Create a folium map for a vineyard.
     
     Args:
         vineyard: Vineyard object with name attribute
         geo_data: GeoJSON geometry data (dict or Shapely geometry)
+        bounds: Optional precomputed bounds (vineyard.bounds), skips geometry work
         
     Returns:
         folium.Map object or None if geometry is invalid
@@ -411,7 +797,7 @@ def create_vineyard_map(vineyard, geo_data):
     import folium
     
     try:
-        bounds = get_geometry_bounds(geo_data)
+        bounds = bounds or get_geometry_bounds(geo_data)
         
         if bounds:
             min_lat, min_lng = bounds[0]
@@ -458,7 +844,8 @@ def create_wine_combined_map(wine, appellation_geo=None, vineyard_geo=None):
             "geo": appellation_geo,
             "name": wine.appellation.name if wine.appellation else "Appellation",
             "type": "Appellation",
-            "color": "#c27ba0"
+            "color": "#c27ba0",
+            "bounds": wine.appellation.bounds if wine.appellation else None
         })
     
     # Add vineyard if available
@@ -467,7 +854,8 @@ def create_wine_combined_map(wine, appellation_geo=None, vineyard_geo=None):
             "geo": vineyard_geo,
             "name": wine.vineyard.name if wine.vineyard else "Vineyard",
             "type": "Vineyard",
-            "color": "#228b22"
+            "color": "#228b22",
+            "bounds": wine.vineyard.bounds if wine.vineyard else None
         })
     
     if not targets:
@@ -476,7 +864,7 @@ def create_wine_combined_map(wine, appellation_geo=None, vineyard_geo=None):
     try:
         # Use first geometry for initial center
         primary = targets[0]
-        bounds = get_geometry_bounds(primary['geo'])
+        bounds = primary['bounds'] or get_geometry_bounds(primary['geo'])
         
         if bounds:
             min_lat, min_lng = bounds[0]
@@ -519,3 +907,65 @@ def create_wine_combined_map(wine, appellation_geo=None, vineyard_geo=None):
         print(f"Error in create_wine_combined_map: {e}")
         traceback.print_exc()
         return None, ""
+
+
+@st.cache_resource
+def get_geometry_names():
+    """Returns {"Appellation": {id: name}, "Vineyard": {id: name}} for labelling index hits."""
+    from shared import Appellation, Vineyard
+    session = shared.get_session()
+    try:
+        return {
+            "Appellation": dict(session.query(Appellation.id, Appellation.name).all()),
+            "Vineyard": dict(session.query(Vineyard.id, Vineyard.name).all()),
+        }
+    finally:
+        session.close()
+
+@st.cache_resource
+def start_tile_server():
+    """
+    Starts the vector tile endpoint once per process if TILE_SERVER_PORT is set.
+    Returns the tile URL template, or None if tiles are disabled or unavailable.
+    """
+    if not TILE_SERVER_PORT:
+        return None
+    try:
+        import tile_server
+        # Getters, not values: tiles follow the index after "Clear Cache" or new geo data
+        renderer = tile_server.TileRenderer(get_tile_index, get_geometry_names)
+        tile_server.serve(renderer, host=TILE_SERVER_HOST, port=int(TILE_SERVER_PORT))
+    except ImportError as e:
+        print(f"Vector tiles disabled, missing dependency: {e}")
+        return None
+    except OSError as e:
+        print(f"Vector tiles disabled, could not bind port {TILE_SERVER_PORT}: {e}")
+        return None
+    return TILE_SERVER_URL.rstrip("/") + "/tiles/{z}/{x}/{y}.pbf"
+
+def add_vector_tile_layers(folium_map, color="#c27ba0", show=True):
+    """
+    Adds every appellation and vineyard as a single vector tile layer, if the tile
+    endpoint is enabled. Call BEFORE add_tile_layers so it appears in the layer control.
+    
+    Args:
+        folium_map: folium.Map object
+        color: Hex color for appellation polygons
+        show: Whether the layer is visible when the map opens
+        
+    Returns:
+        True if the layer was added
+    """
+    url = start_tile_server()
+    if not url:
+        return False
+    
+    from folium.plugins import VectorGridProtobuf
+    options = {
+        "vectorTileLayerStyles": {
+            "appellations": {"fill": True, "fillColor": color, "fillOpacity": 0.2, "color": color, "weight": 1},
+            "vineyards": {"fill": True, "fillColor": "#228b22", "fillOpacity": 0.4, "color": "#228b22", "weight": 1},
+        }
+    }
+    VectorGridProtobuf(f"{url}?v={_tiles_version}", name="All Appellations & Vineyards", options=options, show=show).add_to(folium_map)
+    return True
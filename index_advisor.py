@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Replay the SQL statements recorded by profiler.py under EXPLAIN and flag full table scans.
+
+Record some page renders first (run the app with WINELIB_PROFILE=1 and open the pages),
+then run against the same database:
+
+Usage:
+    python index_advisor.py                     # all pages in data/profile.jsonl
+    python index_advisor.py --page "Cellar"     # one page
+    python index_advisor.py --min-rows 0 -v     # include small tables, print the plans
+"""
+import os
+import sys
+import json
+import argparse
+from sqlalchemy import inspect, text
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from database import DB_URL, make_engine
+LOG_PATH = os.getenv("WINELIB_PROFILE_LOG", os.path.join(CURRENT_DIR, "data", "profile.jsonl"))
+
+
+def load_statements(path, page=None):
+    """
+    Distinct statements per page from a profile log.
+
+    Returns:
+        dict of page -> {sql: params}
+    """
+    pages = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if page and entry["page"] != page:
+                continue
+            statements = pages.setdefault(entry["page"], {})
+            for s in entry.get("statements", []):
+                statements.setdefault(s["sql"], s.get("params"))
+    return pages
+
+
+def _bind(params):
+    # JSON turned tuples into lists; the DBAPI wants a tuple (qmark) or a dict (pyformat)
+    if params is None:
+        return ()
+    return params if isinstance(params, dict) else tuple(params)
+
+
+def full_scans(conn, sql, params, tables):
+    """
+    Tables read by a full scan in the statement's plan.
+
+    Returns:
+        (list of scanned table names, plan lines)
+    """
+    if conn.dialect.name == "sqlite":
+        plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", _bind(params))]
+        # "SCAN cellar" is a full scan; "SCAN cellar USING INDEX ..." walks an index
+        scanned = [line.split()[1] for line in plan if line.startswith("SCAN ") and " USING " not in line]
+        return [t for t in scanned if t in tables], plan
+
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", _bind(params)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scanned, lines = [], []
+    def walk(node, depth=0):
+        lines.append("  " * depth + node["Node Type"] + (f" on {node['Relation Name']}" if "Relation Name" in node else ""))
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in tables:
+            scanned.append(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child, depth + 1)
+    walk(plan[0]["Plan"])
+    return scanned, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag full table scans in the queries recorded by the page profiler")
+    parser.add_argument("--log", default=LOG_PATH, help="Profile log (JSON lines) written with WINELIB_PROFILE=1")
+    parser.add_argument("--page", help="Only this page (e.g. \"Appellation Detail\")")
+    parser.add_argument("--min-rows", type=int, default=500, help="Ignore scans of tables smaller than this")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the plan of each flagged statement")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"[SKIP] No profile log at {args.log}")
+        print("       Run the app with WINELIB_PROFILE=1 and open the pages to analyze first.")
+        sys.exit(0)
+
+    pages = load_statements(args.log, args.page)
+    if not pages:
+        print(f"[SKIP] No statements recorded{' for ' + args.page if args.page else ''} in {args.log}")
+        sys.exit(0)
+
+    engine = make_engine(DB_URL)
+    print(f"[*] Replaying {sum(len(s) for s in pages.values())} statements from {args.log} on {engine.url.render_as_string(hide_password=True)}")
+    with engine.connect() as conn:
+        tables = {}
+        for name in inspect(conn).get_table_names():
+            rows = conn.execute(text(f'SELECT COUNT(*) FROM "{name}"')).scalar()
+            if rows >= args.min_rows:
+                tables[name] = rows
+
+        flagged = {}
+        for page, statements in sorted(pages.items()):
+            findings = []
+            for sql, params in statements.items():
+                if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                try:
+                    scanned, plan = full_scans(conn, sql, params, tables)
+                except Exception as e:
+                    # PostgreSQL aborts the transaction on error; start a new one for the next statement
+                    conn.rollback()
+                    print(f"  [WARN] {page}: could not explain statement: {e}")
+                    continue
+                if scanned:
+                    findings.append((sorted(set(scanned)), sql, plan))
+            if not findings:
+                print(f"\n[OK] {page}: no full scans ({len(statements)} statements)")
+                continue
+            print(f"\n[SCAN] {page}: {len(findings)} of {len(statements)} statements")
+            for scanned, sql, plan in findings:
+                for table in scanned:
+                    flagged.setdefault(table, set()).add(page)
+                print(f"  - {', '.join(f'{t} ({tables[t]:,} rows)' for t in scanned)}: {' '.join(sql.split())[:140]}")
+                if args.verbose:
+                    for line in plan:
+                        print(f"      {line}")
+
+    if flagged:
+        print("\nFull scans by table:")
+        for table, scanned_pages in sorted(flagged.items(), key=lambda t: -tables[t[0]]):
+            print(f"  {table} ({tables[table]:,} rows): {', '.join(sorted(scanned_pages))}")
+        print("\n[DONE] Check the WHERE/JOIN columns of these statements for a missing index.")
+    else:
+        print(f"\n[DONE] No full scans of tables with at least {args.min_rows:,} rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,15 +8,20 @@ varietals, vineyards) from bundled CSV files.
 Usage:
     python init_db.py          # Create tables + seed reference data
     python init_db.py --skip-seed   # Create tables only
+    python init_db.py --sync --dry-run   # Report what an updated seed release would change
+    python init_db.py --sync   # Apply updated seed CSVs to an existing database
 
-This script only runs when using SQLite. For PostgreSQL, manage your 
-database schema separately.
+This script only runs when using SQLite. For PostgreSQL, create and upgrade
+the schema with `python migrations.py` (which init_db also runs).
 """
 import os
+import io
 import sys
 import csv
+import time
+import hashlib
 import argparse
-from datetime import date as date_type, datetime
+import pandas as pd
 
 # Ensure this directory is in sys.path
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -24,34 +29,43 @@ if CURRENT_DIR not in sys.path:
     sys.path.insert(0, CURRENT_DIR)
 
 from models import Base, Region, Appellation, Varietal, Vineyard
-from sqlalchemy import create_engine, Integer, Float, Date
-from sqlalchemy.orm import sessionmaker
+from migrations import migrate
+from database import DATA_DIR, DB_URL, make_engine
+from sqlalchemy import inspect, select, delete, update, func, text, Integer, Float, Date
 
 # --- Config ---
-DATA_DIR = os.path.join(CURRENT_DIR, "data")
 SEED_DIR = os.path.join(DATA_DIR, "seed")
-DB_URL = os.getenv("DB_URL", f"sqlite:///{os.path.join(DATA_DIR, 'winelib.db')}")
+SEED_CHUNK_SIZE = 2000 # CSV rows read and inserted at a time
+SYNC_BATCH_SIZE = 500 # rows per upsert/delete statement in --sync
+SEED_TABLES = [("regions.csv", Region), ("appellations.csv", Appellation), ("varietals.csv", Varietal), ("vineyards.csv", Vineyard)]
 
 
-def init_db(seed=True):
-    """Create tables and optionally seed reference data."""
+def init_db(seed=True, sync=False, dry_run=False):
+    """
+    Create tables and optionally seed reference data.
+    
+    Args:
+        seed: Load the seed CSVs into empty tables
+        sync: Apply the seed CSVs to tables that already have rows (inserts, updates, deletes)
+        dry_run: With sync, only report the changes
+    """
     
     # Safety check: only auto-run on SQLite
     if not DB_URL.startswith("sqlite"):
         print(f"[WARN] DB_URL points to a non-SQLite database: {DB_URL}")
         print("       init_db is designed for fresh SQLite setups only.")
+        print("       To create or upgrade the schema only, run: python migrations.py")
         print("       If you really want to initialize this database, set FORCE_INIT=1")
         if not os.getenv("FORCE_INIT"):
             sys.exit(1)
     
     os.makedirs(DATA_DIR, exist_ok=True)
     
-    connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-    engine = create_engine(DB_URL, connect_args=connect_args)
+    engine = make_engine(DB_URL)
     
-    # Create all tables
+    # Create tables / apply pending schema migrations
     print(f"[*] Creating tables in: {DB_URL}")
-    Base.metadata.create_all(engine)
+    migrate(engine)
     print("[OK] Tables created successfully.")
     
     if not seed:
@@ -63,98 +77,272 @@ def init_db(seed=True):
         print("       Run without seed data or add CSV files to data/seed/")
         return
     
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    if sync:
+        sync_seed(engine, dry_run=dry_run)
+        return
     
+    # One transaction: a failed seed leaves no partially loaded table behind
     try:
-        _seed_table(session, "regions.csv", Region)
-        _seed_table(session, "appellations.csv", Appellation)
-        _seed_table(session, "varietals.csv", Varietal)
-        _seed_table(session, "vineyards.csv", Vineyard)
-        session.commit()
+        with engine.begin() as conn:
+            for csv_filename, model_class in SEED_TABLES:
+                _seed_table(conn, csv_filename, model_class)
         print("\n[DONE] Database initialized successfully!")
     except Exception as e:
-        session.rollback()
         print(f"\n[ERROR] Error seeding data: {e}")
         raise
-    finally:
-        session.close()
 
 
-def _coerce_value(value, column):
-    """Convert a CSV string value to the appropriate Python type for a column."""
-    if value == "" or value is None:
-        return None
-    
+def _coerce_column(values, column):
+    """
+    Convert a column of CSV strings to the column's Python type (vectorized).
+    Empty or unparseable values become None.
+    """
     col_type = type(column.type)
     
-    if col_type is Integer or issubclass(col_type, Integer):
+    if issubclass(col_type, Integer):
         # Handle float-like strings (e.g. "80.0") by converting via float first
-        try:
-            return int(float(value))
-        except (ValueError, TypeError):
-            return None
+        numbers = pd.to_numeric(values, errors="coerce")
+        return pd.Series([None if pd.isna(v) else int(v) for v in numbers], index=values.index, dtype=object)
     
-    if col_type is Float or issubclass(col_type, Float):
-        try:
-            return float(value)
-        except (ValueError, TypeError):
-            return None
+    if issubclass(col_type, Float):
+        numbers = pd.to_numeric(values, errors="coerce")
+        return pd.Series([None if pd.isna(v) else float(v) for v in numbers], index=values.index, dtype=object)
     
-    if col_type is Date or issubclass(col_type, Date):
-        try:
-            return datetime.strptime(value, "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            return None
+    if issubclass(col_type, Date):
+        dates = pd.to_datetime(values, format="%Y-%m-%d", errors="coerce")
+        return pd.Series([None if pd.isna(d) else d.date() for d in dates], index=values.index, dtype=object)
     
-    return value
+    # object dtype: a string-dtype Series would turn None back into NaN
+    return values.astype(object).where(values != "", None)
+
+
+def _read_chunks(csv_path, columns):
+    """Stream a seed CSV as DataFrames of typed values, SEED_CHUNK_SIZE rows at a time."""
+    reader = pd.read_csv(csv_path, dtype=str, keep_default_na=False, encoding="utf-8",
+                         usecols=lambda c: c in columns, chunksize=SEED_CHUNK_SIZE)
+    for chunk in reader:
+        yield pd.DataFrame({name: _coerce_column(chunk[name], columns[name]) for name in chunk.columns}, dtype=object)
+
+
+def _copy_chunk(conn, table, df):
+    """PostgreSQL COPY FROM STDIN of a typed chunk (psycopg2 or psycopg 3)."""
+    buf = io.StringIO()
+    # None is written as an unquoted empty field, which COPY's CSV format reads as NULL
+    df.to_csv(buf, index=False, header=False, quoting=csv.QUOTE_MINIMAL)
+    cols = ", ".join(f'"{c}"' for c in df.columns)
+    sql = f'COPY {table.name} ({cols}) FROM STDIN WITH (FORMAT csv)'
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buf.getvalue())
+    finally:
+        cursor.close()
+
+
+def _reset_id_sequence(conn, table):
+    """PostgreSQL: explicit ids bypass the id sequence; move it past them so new rows don't collide."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT MAX(id) FROM {table.name}))"))
 
 
-def _seed_table(session, csv_filename, model_class):
-    """Load a CSV file into a database table, skipping existing records."""
+def _seed_table(conn, csv_filename, model_class):
+    """Stream a CSV file into a database table, skipping tables that already have records."""
     csv_path = os.path.join(SEED_DIR, csv_filename)
     
     if not os.path.exists(csv_path):
         print(f"  [SKIP] {csv_filename} not found, skipping.")
         return
     
-    table_name = model_class.__tablename__
-    existing_count = session.query(model_class).count()
+    table = model_class.__table__
+    existing_count = conn.execute(select(func.count()).select_from(table)).scalar()
     
     if existing_count > 0:
-        print(f"  [SKIP] {table_name}: already has {existing_count} records, skipping.")
+        print(f"  [SKIP] {table.name}: already has {existing_count} records, skipping.")
         return
     
-    # Read CSV and insert
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    # Build column lookup: name -> Column object
+    columns = {c.name: c for c in table.columns}
+    use_copy = conn.dialect.name == "postgresql"
+    
+    start = time.time()
+    count = 0
+    for chunk in _read_chunks(csv_path, columns):
+        if use_copy:
+            _copy_chunk(conn, table, chunk)
+        else:
+            # Core executemany: one prepared INSERT for the whole chunk, no ORM objects
+            conn.execute(table.insert(), chunk.to_dict("records"))
+        count += len(chunk)
+        print(f"  [*] {table.name}: {count} rows...", end="\r")
     
-    if not rows:
+    if not count:
         print(f"  [SKIP] {csv_filename} is empty, skipping.")
         return
     
-    # Build column lookup: name -> Column object
-    columns = {c.name: c for c in model_class.__table__.columns}
+    if use_copy and "id" in columns:
+        _reset_id_sequence(conn, table)
     
-    count = 0
-    for row in rows:
-        filtered = {}
-        for k, v in row.items():
-            if k in columns:
-                filtered[k] = _coerce_value(v, columns[k])
-        
-        obj = model_class(**filtered)
-        session.add(obj)
-        count += 1
+    elapsed = time.time() - start
+    print(f"  [OK] {table.name}: loaded {count} records from {csv_filename} ({elapsed:.2f}s, {count / max(elapsed, 1e-6):,.0f} rows/s{', COPY' if use_copy else ''})")
+
+# --- SEED SYNC ---
+# Columns locating a row's geometry: when they change, the stored extent no longer applies
+# (models._on_geometry_source_set does the same for ORM edits)
+GEOMETRY_SOURCES = {Appellation: ["inao_id", "pdo_id"], Vineyard: ["vineyard_id"]}
+
+
+def _row_hash(values):
+    return hashlib.sha1(repr(tuple(values)).encode("utf-8")).digest()
+
+
+def _batches(items, size=SYNC_BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _referenced_ids(conn, table, ids):
+    """Ids among `ids` that a foreign key in another table still points to."""
+    refs = set()
+    for other in Base.metadata.sorted_tables:
+        for fk in other.foreign_keys:
+            if fk.column.table is not table or not inspect(conn).has_table(other.name):
+                continue
+            for batch in _batches(ids):
+                refs.update(r[0] for r in conn.execute(select(fk.parent).where(fk.parent.in_(batch)).distinct()))
+    return refs
+
+
+def _upsert(conn, table, rows, columns):
+    """Batched INSERT ... ON CONFLICT (id) DO UPDATE of the given CSV columns."""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.id],
+                                      set_={c: stmt.excluded[c] for c in columns if c != "id"})
+    for batch in _batches(rows):
+        conn.execute(stmt, batch)
+
+
+def _sync_table(conn, csv_filename, model_class, dry_run=False):
+    """
+    Diff a seed CSV against its table by id and apply only the differences.
+    Rows are compared by a hash of the CSV's columns; columns not in the CSV (geojson,
+    extents) are left alone. Rows missing from the CSV are deleted unless referenced.
+    
+    Returns:
+        Set of updated ids (for refreshing derived tables)
+    """
+    csv_path = os.path.join(SEED_DIR, csv_filename)
+    if not os.path.exists(csv_path):
+        print(f"  [SKIP] {csv_filename} not found, skipping.")
+        return set()
+    
+    start = time.time()
+    table = model_class.__table__
+    columns = {c.name: c for c in table.columns}
+    geo_columns = GEOMETRY_SOURCES.get(model_class, [])
+    
+    csv_rows = {}
+    names = None
+    for chunk in _read_chunks(csv_path, columns):
+        names = list(chunk.columns)
+        for row in chunk.to_dict("records"):
+            if row.get("id") is not None:
+                csv_rows[row["id"]] = row
+    if names is None or "id" not in names:
+        print(f"  [SKIP] {csv_filename} has no rows or no id column, skipping.")
+        return set()
     
-    session.flush()
-    print(f"  [OK] {table_name}: loaded {count} records from {csv_filename}")
+    db_hashes, db_geo = {}, {}
+    for row in conn.execute(select(*(table.c[n] for n in names))):
+        values = dict(zip(names, row))
+        db_hashes[values["id"]] = _row_hash(row)
+        db_geo[values["id"]] = tuple(values[c] for c in geo_columns if c in values)
+    
+    inserts, updates, unchanged = [], [], 0
+    for row_id, row in csv_rows.items():
+        old = db_hashes.get(row_id)
+        if old is None:
+            inserts.append(row)
+        elif old != _row_hash(row[n] for n in names):
+            updates.append(row)
+        else:
+            unchanged += 1
+    missing = [row_id for row_id in db_hashes if row_id not in csv_rows]
+    referenced = _referenced_ids(conn, table, missing) if missing else set()
+    deletes = [row_id for row_id in missing if row_id not in referenced]
+    moved = [r["id"] for r in updates if db_geo[r["id"]] != tuple(r[c] for c in geo_columns if c in r)]
+    
+    if not dry_run:
+        _upsert(conn, table, inserts + updates, names)
+        for batch in _batches(deletes):
+            conn.execute(delete(table).where(table.c.id.in_(batch)))
+        if moved and hasattr(model_class, "set_extent"):
+            extent = {c: None for c in ("min_lng", "min_lat", "max_lng", "max_lat", "centroid_lng", "centroid_lat")}
+            for batch in _batches(moved):
+                conn.execute(update(table).where(table.c.id.in_(batch)).values(**extent))
+        if inserts:
+            _reset_id_sequence(conn, table)
+    
+    kept = f" ({len(referenced)} referenced kept)" if referenced else ""
+    prefix = "[DRY RUN]" if dry_run else "[OK]"
+    print(f"  {prefix} {table.name}: +{len(inserts)} inserted, ~{len(updates)} updated, "
+          f"-{len(deletes)} deleted{kept}, {unchanged} unchanged ({time.time() - start:.2f}s)")
+    if dry_run:
+        for label, ids in (("insert", [r["id"] for r in inserts]), ("update", [r["id"] for r in updates]),
+                           ("delete", deletes), ("keep (referenced)", sorted(referenced))):
+            if ids:
+                more = f" ... (+{len(ids) - 10})" if len(ids) > 10 else ""
+                print(f"      {label}: {', '.join(str(i) for i in ids[:10])}{more}")
+    return {r["id"] for r in updates}
+
+
+def sync_seed(engine, dry_run=False):
+    """
+    Apply the seed CSVs to an existing database in one transaction, then refresh the
+    derived tables (cellar_inventory, summary_stats) that copy updated names.
+    """
+    print(f"[*] Syncing seed data from {SEED_DIR}{' (dry run, nothing is written)' if dry_run else ''}")
+    try:
+        with engine.begin() as conn:
+            changed = {}
+            for csv_filename, model_class in SEED_TABLES:
+                changed[model_class] = _sync_table(conn, csv_filename, model_class, dry_run=dry_run)
+            if not dry_run:
+                _refresh_derived(conn, changed)
+        print("\n[DONE] Seed data is in sync." if not dry_run else "\n[DONE] Dry run finished; run without --dry-run to apply.")
+    except Exception as e:
+        print(f"\n[ERROR] Error syncing seed data: {e}")
+        raise
+
+
+def _refresh_derived(conn, changed):
+    from inventory import refresh_inventory, TRACKED as INVENTORY_TRACKED
+    from stats import refresh_stats
+    changed = {m: ids for m, ids in changed.items() if ids and m in INVENTORY_TRACKED}
+    if not changed:
+        return
+    tables = inspect(conn)
+    if tables.has_table("cellar_inventory"):
+        refresh_inventory(conn, changed)
+        print("  [OK] cellar_inventory: refreshed rows of updated reference data")
+    if tables.has_table("summary_stats"):
+        refresh_stats(conn)
+        print("  [OK] summary_stats: rebuilt")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Initialize WineLib database")
     parser.add_argument("--skip-seed", action="store_true", help="Skip seeding reference data")
+    parser.add_argument("--sync", action="store_true", help="Apply seed CSV changes to tables that already have rows")
+    parser.add_argument("--dry-run", action="store_true", help="With --sync: report the changes without writing")
     args = parser.parse_args()
     
-    init_db(seed=not args.skip_seed)
+    init_db(seed=not args.skip_seed, sync=args.sync, dry_run=args.dry_run)
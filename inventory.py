@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Denormalized cellar inventory (the cellar_inventory table).
+
+The Cellar page, the Summary inventory tab and the detail page Cellar tabs read
+bottles from cellar_inventory instead of re-running the cellar -> wines ->
+producers/regions/appellations/varietals join on every rerun.
+
+The table is kept in sync incrementally: track_inventory() installs Session
+events that record which bottles, wines, producers, regions, appellations and
+varietals a transaction touched, and refreshes only the affected rows right
+before the commit (in the same transaction). A full rebuild runs automatically
+when the table is missing or empty, or on demand:
+
+Usage:
+    python inventory.py --rebuild
+
+This module does not import Streamlit.
+"""
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+from sqlalchemy import event, select, delete, insert, func, or_, case
+
+# Ensure this directory is in sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import CellarInventory, Bottle, Wine, Producer, Region, Appellation, Varietal
+
+# Changes to these models affect inventory rows: model -> CellarInventory column holding its id
+TRACKED = {
+    Bottle: CellarInventory.bottle_id,
+    Wine: CellarInventory.wine_id,
+    Producer: CellarInventory.producer_id,
+    Region: CellarInventory.region_id,
+    Appellation: CellarInventory.appellation_id,
+    Varietal: CellarInventory.varietal_id,
+}
+
+# Source column for each inventory column
+_SOURCE_COLUMNS = {
+    "bottle_id": Bottle.id,
+    "wine_id": Wine.id,
+    "producer_id": Producer.id,
+    "region_id": Wine.region_id,
+    "appellation_id": Wine.appellation_id,
+    "varietal_id": Wine.varietal_id,
+    "vineyard_id": Wine.vineyard_id,
+    "location": Bottle.location,
+    "qty": Bottle.qty,
+    "bottle_size": Bottle.bottle_size,
+    "price": Bottle.price,
+    "currency": Bottle.currency,
+    "purchase_date": Bottle.purchase_date,
+    "color": Wine.type,
+    "region": Region.name,
+    "domaine": Producer.name,
+    "cuvee": Wine.cuvee,
+    "appellation": Appellation.name,
+    "varietal": Varietal.name,
+    "vintage": Wine.vintage,
+    "vintage_year": Wine.vintage_year,
+    "is_nv": Wine.is_nv,
+    "disgorgement_date": Wine.disgorgement_date,
+    "rp_score": Wine.rp_score,
+}
+
+# Inventory column -> column name used by the views (same aliases as the old cellar query)
+VIEW_COLUMNS = {
+    "location": "Location",
+    "qty": "Qty",
+    "color": "Color",
+    "region": "Region",
+    "domaine": "Domaine",
+    "cuvee": "Cuvee",
+    "appellation": "Appellation",
+    "varietal": "Varietal",
+    "vintage": "Vintage",
+    "disgorgement_date": "Disgorgement",
+    "bottle_size": "Format",
+    "price": "raw_price",
+    "currency": "Currency",
+    "rp_score": "RP",
+    "purchase_date": "DatePurchased",
+    "producer_id": "pid",
+    "wine_id": "wid",
+    "bottle_id": "bid",
+    "appellation_id": "aid",
+    "vineyard_id": "vid",
+}
+
+# SQL version of ui_utils.location_group: H* -> Home, WB* -> WineBanc, otherwise the location itself
+LOCATION_GROUP = case(
+    (func.substr(CellarInventory.location, 1, 2) == "WB", "WineBanc"),
+    (func.substr(CellarInventory.location, 1, 1) == "H", "Home"),
+    else_=func.coalesce(CellarInventory.location, "None"),
+)
+
+_ready_engines = set()
+
+
+def _source_select():
+    """SELECT producing inventory rows from the normalized tables."""
+    return (
+        select(*_SOURCE_COLUMNS.values())
+        .select_from(Bottle)
+        .join(Wine, Bottle.wine_id == Wine.id)
+        .join(Producer, Wine.producer_id == Producer.id)
+        .outerjoin(Region, Wine.region_id == Region.id)
+        .outerjoin(Appellation, Wine.appellation_id == Appellation.id)
+        .outerjoin(Varietal, Wine.varietal_id == Varietal.id)
+    )
+
+
+def _source_condition(changed):
+    """WHERE clause over the source tables matching the changed ids."""
+    source_ids = {
+        Bottle: Bottle.id, Wine: Wine.id, Producer: Producer.id,
+        Region: Wine.region_id, Appellation: Wine.appellation_id, Varietal: Wine.varietal_id,
+    }
+    return or_(*(source_ids[model].in_(ids) for model, ids in changed.items() if ids))
+
+
+def refresh_inventory(conn, changed=None):
+    """
+    Rewrites inventory rows in the current transaction.
+
+    Args:
+        conn: Connection or Session
+        changed: dict of model class -> set of ids (see TRACKED); None rebuilds everything
+
+    Returns:
+        Number of rows written
+    """
+    insert_stmt = insert(CellarInventory).from_select(list(_SOURCE_COLUMNS), _source_select())
+    if changed is None:
+        conn.execute(delete(CellarInventory))
+    else:
+        changed = {m: ids for m, ids in changed.items() if ids}
+        if not changed:
+            return 0
+        conn.execute(delete(CellarInventory).where(or_(*(TRACKED[m].in_(ids) for m, ids in changed.items()))))
+        insert_stmt = insert(CellarInventory).from_select(list(_SOURCE_COLUMNS), _source_select().where(_source_condition(changed)))
+    return conn.execute(insert_stmt).rowcount
+
+
+def _ensure(conn):
+    CellarInventory.__table__.create(conn, checkfirst=True)
+    has_rows = conn.execute(select(CellarInventory.bottle_id).limit(1)).first() is not None
+    if not has_rows and conn.execute(select(Bottle.id).limit(1)).first() is not None:
+        refresh_inventory(conn)
+
+
+def ensure_inventory(engine, conn=None):
+    """
+    Creates the table and fills it when missing or empty (once per engine and process).
+    Pass conn to do it inside an open transaction on that engine.
+    """
+    if engine in _ready_engines:
+        return
+    if conn is None:
+        with engine.begin() as conn:
+            _ensure(conn)
+    else:
+        _ensure(conn)
+    _ready_engines.add(engine)
+
+
+def _on_after_flush(session, flush_context):
+    # New objects have their primary key by now, but no identity key until after this event
+    changed = session.info.setdefault("inventory_changed", {})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        model = type(obj)
+        if model in TRACKED and obj.id is not None:
+            changed.setdefault(model, set()).add(obj.id)
+
+
+def _on_before_commit(session):
+    # before_commit runs ahead of the final flush; flush first so pending changes are tracked
+    session.flush()
+    changed = session.info.pop("inventory_changed", None)
+    if changed:
+        conn = session.connection()
+        ensure_inventory(conn.engine, conn)
+        refresh_inventory(conn, changed)
+
+
+def _on_after_rollback(session):
+    session.info.pop("inventory_changed", None)
+
+
+def track_inventory(session_factory):
+    """Keeps cellar_inventory in sync with commits made through session_factory (a sessionmaker)."""
+    event.listen(session_factory, "after_flush", _on_after_flush)
+    event.listen(session_factory, "before_commit", _on_before_commit)
+    event.listen(session_factory, "after_soft_rollback", lambda session, previous_transaction: _on_after_rollback(session))
+
+
+def inventory_select(in_stock=True, **filters):
+    """
+    SELECT of inventory rows with the view column names (no ORDER BY).
+    Filters are inventory column == value (or in a list), e.g. producer_id=3, wine_id=[1, 2].
+    """
+    query = select(*(getattr(CellarInventory, c).label(label) for c, label in VIEW_COLUMNS.items()))
+    if in_stock:
+        query = query.where(CellarInventory.qty > 0)
+    for column, value in filters.items():
+        col = getattr(CellarInventory, column)
+        query = query.where(col.in_(value) if isinstance(value, (list, tuple, set)) else col == value)
+    return query
+
+
+def read_inventory(engine, in_stock=True, **filters):
+    """
+    Inventory rows as a DataFrame with the view column names (Location, Qty, Color, ..., pid, wid, bid, aid, vid),
+    ordered by region, domaine and vintage (newest first).
+
+    Args:
+        engine: SQLAlchemy engine
+        in_stock: Only bottle lines with qty > 0
+        **filters: inventory column == value (or in a list), e.g. producer_id=3, wine_id=[1, 2]
+    """
+    ensure_inventory(engine)
+    query = inventory_select(in_stock, **filters).order_by(CellarInventory.region, CellarInventory.domaine, CellarInventory.vintage.desc())
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the WineLib cellar inventory table")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild every inventory row")
+    args = parser.parse_args()
+
+    from database import DB_URL, make_engine
+    engine = make_engine(DB_URL)
+
+    ensure_inventory(engine)
+    if args.rebuild:
+        start = time.time()
+        with engine.begin() as conn:
+            count = refresh_inventory(conn)
+        print(f"[OK] cellar_inventory: rebuilt {count} rows ({time.time() - start:.2f}s)")
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(CellarInventory)).scalar()
+    print(f"[DONE] cellar_inventory has {total} rows.")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for the WineLib database (SQLite and PostgreSQL).
+
+Each migration is a function registered with @migration(version, name). It receives the
+engine and applies its changes with the helpers below, which are idempotent (they skip
+columns and indexes that already exist), so a database created by create_all from the
+current models can run every migration safely. Applied versions are recorded in
+schema_version.
+
+Data backfills run in primary-key batches, one short transaction each, and record their
+progress in schema_backfills: an interrupted run resumes where it stopped and large
+tables are never locked for the whole backfill. On PostgreSQL, indexes are built with
+CREATE INDEX CONCURRENTLY so writes continue while they build.
+
+Usage:
+    python migrations.py                # apply pending migrations
+    python migrations.py --status       # list applied / pending migrations
+    python migrations.py --target 2     # apply up to version 2
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+from sqlalchemy import (
+    inspect, select, func, insert, update, text, bindparam,
+    MetaData, Table, Column, Integer, String, DateTime,
+)
+from sqlalchemy.schema import CreateIndex
+
+# Ensure this directory is in sys.path for local imports
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import (
+    Base, Appellation, Vineyard, Wine, Bottle, TastingNote, RestaurantVisit, CellarInventory, SummaryStat,
+    GeoExtentMixin, parse_vintage,
+)
+
+BATCH_SIZE = 1000
+
+# Bookkeeping tables (not part of models.Base: the app never reads them)
+_meta = MetaData()
+schema_version = Table(
+    "schema_version", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime),
+)
+schema_backfills = Table(
+    "schema_backfills", _meta,
+    Column("name", String, primary_key=True),
+    Column("last_id", Integer), # highest primary key processed
+    Column("rows", Integer), # rows processed so far
+    Column("finished_at", DateTime),
+)
+
+MIGRATIONS = [] # (version, name, function), in version order
+
+def migration(version, name):
+    """Registers a migration function. Versions must be unique and increasing."""
+    def register(fn):
+        assert not MIGRATIONS or version > MIGRATIONS[-1][0], f"migration {version} out of order"
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+# --- OPERATIONS ---
+def add_column(engine, column):
+    """Adds a model column to its table unless it exists (nullable columns only: no table rewrite)."""
+    table = column.table
+    if column.name in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+        return False
+    col_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+    print(f"  [OK] {table.name}: added column {column.name}")
+    return True
+
+def create_index(engine, index):
+    """Creates a model index unless it exists; CONCURRENTLY on PostgreSQL so writes aren't blocked."""
+    if index.name in {i["name"] for i in inspect(engine).get_indexes(index.table.name)}:
+        return False
+    ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+    if engine.dialect.name == "postgresql":
+        # CONCURRENTLY can't run inside a transaction block
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1).replace("CREATE UNIQUE INDEX", "CREATE UNIQUE INDEX CONCURRENTLY", 1)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(ddl))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+    print(f"  [OK] {index.table.name}: created index {index.name}")
+    return True
+
+def backfill(engine, name, table, apply, batch_size=BATCH_SIZE):
+    """
+    Runs a data backfill over a table in primary-key batches, one transaction per batch.
+    Progress is committed with each batch, so rerunning resumes after the last finished batch.
+
+    Args:
+        engine: SQLAlchemy engine
+        name: Unique backfill name (progress key in schema_backfills)
+        table: Table to walk (single integer primary key)
+        apply: Function (conn, first_id, last_id) updating the rows in that id range
+        batch_size: Rows per batch
+
+    Returns:
+        Number of rows processed by this run
+    """
+    pk = table.primary_key.columns.values()[0]
+    with engine.begin() as conn:
+        state = conn.execute(select(schema_backfills).where(schema_backfills.c.name == name)).first()
+        if state is None:
+            conn.execute(insert(schema_backfills).values(name=name, last_id=None, rows=0))
+        elif state.finished_at is not None:
+            return 0
+    last_id = state.last_id if state else None
+    done = state.rows if state else 0
+    start, processed = time.time(), 0
+
+    while True:
+        with engine.begin() as conn:
+            ids = select(pk.label("id")).order_by(pk).limit(batch_size)
+            if last_id is not None:
+                ids = ids.where(pk > last_id)
+            ids = ids.subquery()
+            first_id, batch_last, count = conn.execute(select(func.min(ids.c.id), func.max(ids.c.id), func.count())).first()
+            if not count:
+                conn.execute(update(schema_backfills).where(schema_backfills.c.name == name)
+                             .values(finished_at=datetime.now()))
+                break
+            last_id = batch_last
+            apply(conn, first_id, last_id)
+            processed += count
+            conn.execute(update(schema_backfills).where(schema_backfills.c.name == name)
+                         .values(last_id=last_id, rows=done + processed))
+        print(f"  [*] {name}: {done + processed} rows ({processed / max(time.time() - start, 1e-6):,.0f} rows/s)", end="\r")
+    if processed:
+        print()
+    print(f"  [OK] {name}: backfilled {processed} rows in {time.time() - start:.1f}s")
+    return processed
+
+# --- MIGRATIONS ---
+@migration(1, "baseline tables")
+def _baseline(engine):
+    # Creates tables missing from the database (new databases get every current column and index)
+    Base.metadata.create_all(engine)
+
+@migration(2, "geo extent columns on appellations and vineyards")
+def _geo_extents(engine):
+    for model in (Appellation, Vineyard):
+        for name in GeoExtentMixin.__dict__:
+            column = model.__table__.columns.get(name)
+            if column is not None:
+                add_column(engine, column)
+
+@migration(3, "indexes for hot query predicates")
+def _query_indexes(engine):
+    names = {
+        TastingNote: ["ix_tasting_notes_bottle_id", "ix_tasting_notes_date", "ix_tasting_notes_place_id"],
+        Wine: ["ix_wines_appellation_id", "ix_wines_vineyard_id"],
+        Appellation: ["ix_appellations_region_id"],
+        Bottle: ["idx_cellar_wine_qty"],
+        RestaurantVisit: ["idx_visit_place_date"],
+    }
+    for model, index_names in names.items():
+        for index in model.__table__.indexes:
+            if index.name in index_names:
+                create_index(engine, index)
+
+@migration(4, "numeric vintage and drinking window index")
+def _numeric_vintage(engine):
+    add_column(engine, Wine.__table__.c.vintage_year)
+    add_column(engine, Wine.__table__.c.is_nv)
+    add_column(engine, CellarInventory.__table__.c.vintage_year)
+    for index in Wine.__table__.indexes:
+        if index.name in ("ix_wines_vintage_year", "idx_wine_drink_window"):
+            create_index(engine, index)
+
+    wines = Wine.__table__
+    def parse_wines(conn, first_id, last_id):
+        rows = conn.execute(select(wines.c.id, wines.c.vintage).where(wines.c.id.between(first_id, last_id))).all()
+        values = [dict(zip(("b_id", "vintage_year", "is_nv"), (r.id, *parse_vintage(r.vintage)))) for r in rows]
+        if values:
+            conn.execute(update(wines).where(wines.c.id == bindparam("b_id"))
+                         .values(vintage_year=bindparam("vintage_year"), is_nv=bindparam("is_nv")), values)
+    backfill(engine, "wines.vintage_year", wines, parse_wines)
+
+    inventory = CellarInventory.__table__
+    def copy_inventory(conn, first_id, last_id):
+        year = select(wines.c.vintage_year).where(wines.c.id == inventory.c.wine_id).scalar_subquery()
+        conn.execute(update(inventory).where(inventory.c.bottle_id.between(first_id, last_id)).values(vintage_year=year))
+    backfill(engine, "cellar_inventory.vintage_year", inventory, copy_inventory)
+
+    # Vintage groups now carry the numeric year (ref_id); rebuild the aggregates if they exist
+    from stats import refresh_stats
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(SummaryStat)).scalar():
+            print(f"  [OK] summary_stats: rebuilt {refresh_stats(conn)} rows")
+
+@migration(5, "non-vintage flag on cellar inventory and vintage aggregates")
+def _nv_flags(engine):
+    add_column(engine, CellarInventory.__table__.c.is_nv)
+    add_column(engine, SummaryStat.__table__.c.is_nv)
+
+    wines, inventory = Wine.__table__, CellarInventory.__table__
+    def copy_inventory(conn, first_id, last_id):
+        is_nv = select(wines.c.is_nv).where(wines.c.id == inventory.c.wine_id).scalar_subquery()
+        conn.execute(update(inventory).where(inventory.c.bottle_id.between(first_id, last_id)).values(is_nv=is_nv))
+    backfill(engine, "cellar_inventory.is_nv", inventory, copy_inventory)
+
+    # Vintage groups now carry is_nv (NV variants sort last); rebuild the aggregates if they exist
+    from stats import refresh_stats
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(SummaryStat)).scalar():
+            print(f"  [OK] summary_stats: rebuilt {refresh_stats(conn)} rows")
+
+# --- RUNNER ---
+def current_version(engine):
+    """Highest applied migration version (0 for a database without schema_version)."""
+    _meta.create_all(engine)
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def migrate(engine, target=None):
+    """
+    Applies pending migrations in order, recording each version once it completes.
+
+    Args:
+        engine: SQLAlchemy engine
+        target: Last version to apply (default: all)
+
+    Returns:
+        List of applied versions
+    """
+    version = current_version(engine)
+    applied = []
+    for number, name, fn in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        print(f"[*] Migration {number}: {name}")
+        start = time.time()
+        fn(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(schema_version).values(version=number, name=name, applied_at=datetime.now()))
+        print(f"[OK] Migration {number} applied ({time.time() - start:.1f}s)")
+        applied.append(number)
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply WineLib schema migrations")
+    parser.add_argument("--status", action="store_true", help="List applied and pending migrations")
+    parser.add_argument("--target", type=int, help="Apply migrations up to this version")
+    args = parser.parse_args()
+
+    from database import DB_URL, make_engine
+    engine = make_engine(DB_URL)
+    print(f"[*] Database: {engine.url.render_as_string(hide_password=True)}")
+
+    if args.status:
+        version = current_version(engine)
+        for number, name, _ in MIGRATIONS:
+            print(f"  {'[OK]  ' if number <= version else '[TODO]'} {number}: {name}")
+        sys.exit(0)
+
+    applied = migrate(engine, args.target)
+    if applied:
+        print(f"[DONE] Database at version {applied[-1]}.")
+    else:
+        print(f"[DONE] Database is up to date (version {current_version(engine)}).")
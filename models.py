@@ -1,8 +1,47 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Text, Index
+import json
+from sqlalchemy import Column, Integer, String, Float, Date, Boolean, ForeignKey, Text, Index, event
 from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy.orm.base import NO_VALUE
 
 Base = declarative_base()
 
+class GeoExtentMixin:
+    """
+    Cached extent of an object's resolved geometry (parquet or DB GeoJSON), so maps
+    can be centered and fitted without loading the geometry.
+    Filled by `python geo_build.py --sync-extents`; cleared when the geometry changes.
+    """
+    min_lng = Column(Float)
+    min_lat = Column(Float)
+    max_lng = Column(Float)
+    max_lat = Column(Float)
+    centroid_lng = Column(Float)
+    centroid_lat = Column(Float)
+
+    @property
+    def bounds(self):
+        """[[min_lat, min_lng], [max_lat, max_lng]] (folium fit_bounds format) or None."""
+        if None in (self.min_lng, self.min_lat, self.max_lng, self.max_lat):
+            return None
+        return [[self.min_lat, self.min_lng], [self.max_lat, self.max_lng]]
+
+    @property
+    def centroid(self):
+        """[lat, lng] or None."""
+        if self.centroid_lat is None or self.centroid_lng is None:
+            return None
+        return [self.centroid_lat, self.centroid_lng]
+
+    def set_extent(self, geom):
+        """Sets the extent columns from a Shapely geometry (None or empty clears them)."""
+        if geom is None or geom.is_empty:
+            self.min_lng = self.min_lat = self.max_lng = self.max_lat = None
+            self.centroid_lng = self.centroid_lat = None
+            return
+        self.min_lng, self.min_lat, self.max_lng, self.max_lat = (float(v) for v in geom.bounds)
+        c = geom.centroid
+        self.centroid_lng, self.centroid_lat = float(c.x), float(c.y)
+
 class Region(Base):
     __tablename__ = 'regions'
     id = Column(Integer, primary_key=True)
@@ -17,11 +56,11 @@ class Region(Base):
     wines = relationship("Wine", back_populates="region_obj")
 
 
-class Appellation(Base):
+class Appellation(GeoExtentMixin, Base):
     __tablename__ = 'appellations'
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False, unique=True)
-    region_id = Column(Integer, ForeignKey('regions.id'))
+    region_id = Column(Integer, ForeignKey('regions.id'), index=True)
     subregion = Column(String)
     type = Column(String) # AOC, PDO, IG...
     details = Column(Text)
@@ -76,7 +115,7 @@ class Producer(Base):
     wines = relationship("Wine", back_populates="producer")
     region_obj = relationship("Region", back_populates="producers")
 
-class Vineyard(Base):
+class Vineyard(GeoExtentMixin, Base):
     __tablename__ = 'vineyards'
     __table_args__ = (Index('idx_vineyard_name_region', 'name', 'region_id'),)
     #non unique as vineyards can have the same name in different regions and geodata would be in different files.abs
@@ -94,18 +133,24 @@ class Vineyard(Base):
 
 class Wine(Base):
     __tablename__ = 'wines'
-    __table_args__ = (Index('idx_wine_lookup', 'producer_id', 'cuvee', 'appellation_id', 'varietal_id'),)
+    __table_args__ = (
+        Index('idx_wine_lookup', 'producer_id', 'cuvee', 'appellation_id', 'varietal_id'),
+        # "Drinkable in year Y": drink_window_start <= Y AND drink_window_end >= Y
+        Index('idx_wine_drink_window', 'drink_window_start', 'drink_window_end', 'vintage_year'),
+    )
     
     id = Column(Integer, primary_key=True)
     producer_id = Column(Integer, ForeignKey('producers.id'))
-    vineyard_id = Column(Integer, ForeignKey('vineyards.id'))
+    vineyard_id = Column(Integer, ForeignKey('vineyards.id'), index=True)
     
     cuvee = Column(String) # e.g. "Les Pucelles" (Raw)
     vintage = Column(String) # "2010" or "NV"
+    vintage_year = Column(Integer, index=True) # 2010; NULL for NV/unknown (set from vintage)
+    is_nv = Column(Boolean) # non-vintage (set from vintage)
     disgorgement_date = Column(String) # e.g. "Oct 2024"
     type = Column(String)     # Red, White, Sparkling, Sweet
     region_id = Column(Integer, ForeignKey('regions.id'))
-    appellation_id = Column(Integer, ForeignKey('appellations.id'))
+    appellation_id = Column(Integer, ForeignKey('appellations.id'), index=True)
     varietal_id = Column(Integer, ForeignKey('varietals.id'))
     appellation = relationship("Appellation", back_populates="wines")
     varietal = relationship("Varietal", back_populates="wines")
@@ -124,6 +169,8 @@ class Wine(Base):
 class Bottle(Base):
     """Represents physical inventory"""
     __tablename__ = 'cellar'
+    # Bottles of a wine, in stock first (qty > 0)
+    __table_args__ = (Index('idx_cellar_wine_qty', 'wine_id', 'qty'),)
     
     id = Column(Integer, primary_key=True)
     wine_id = Column(Integer, ForeignKey('wines.id'))
@@ -143,8 +190,8 @@ class TastingNote(Base):
     __tablename__ = 'tasting_notes'
     
     id = Column(Integer, primary_key=True)
-    bottle_id = Column(Integer, ForeignKey('cellar.id'), nullable=False)
-    date = Column(Date)
+    bottle_id = Column(Integer, ForeignKey('cellar.id'), nullable=False, index=True)
+    date = Column(Date, index=True)
     rating = Column(Integer) # Your 100pt score
     notes = Column(Text)     # "Explosive nose of..."
     tags = Column(String)    # "Dinner, Gift, corked"
@@ -153,7 +200,7 @@ class TastingNote(Base):
     glasses = Column(Float)    # Amount drank in glasses (Gls)
     # Relationships
     bottle = relationship("Bottle", back_populates="tastings")
-    place_id = Column(Integer, ForeignKey('places.id'))
+    place_id = Column(Integer, ForeignKey('places.id'), index=True)
     place = relationship("Place", back_populates="tastings")
 
 class Place(Base):
@@ -175,6 +222,7 @@ class Place(Base):
 
 class RestaurantVisit(Base):
     __tablename__ = 'restaurants_visits'
+    __table_args__ = (Index('idx_visit_place_date', 'place_id', 'date'),)
     
     id = Column(Integer, primary_key=True)
     date = Column(Date)
@@ -182,3 +230,115 @@ class RestaurantVisit(Base):
     notes = Column(Text)
     
     place = relationship("Place", back_populates="visits")
+
+class CellarInventory(Base):
+    """
+    Denormalized copy of cellar JOIN wines/producers/regions/appellations/varietals,
+    one row per bottle line. Maintained by inventory.py; read-only for the views.
+    """
+    __tablename__ = 'cellar_inventory'
+    __table_args__ = (Index('idx_inventory_stock', 'qty', 'region', 'domaine'),)
+    
+    bottle_id = Column(Integer, primary_key=True) # cellar.id (no FK: rows are refreshed after bottle deletes)
+    wine_id = Column(Integer, index=True)
+    producer_id = Column(Integer, index=True)
+    region_id = Column(Integer)
+    appellation_id = Column(Integer, index=True)
+    varietal_id = Column(Integer)
+    vineyard_id = Column(Integer, index=True)
+    
+    location = Column(String)
+    qty = Column(Integer)
+    bottle_size = Column(String)
+    price = Column(Float)
+    currency = Column(String)
+    purchase_date = Column(Date)
+    
+    color = Column(String) # wines.type
+    region = Column(String)
+    domaine = Column(String)
+    cuvee = Column(String)
+    appellation = Column(String)
+    varietal = Column(String)
+    vintage = Column(String)
+    vintage_year = Column(Integer)
+    is_nv = Column(Boolean)
+    disgorgement_date = Column(String)
+    rp_score = Column(String)
+
+class SummaryStat(Base):
+    """
+    Dashboard aggregates: one row per (scope, dimension, group), e.g. ("tastings", "producer", "12").
+    Maintained by stats.py; read-only for the views.
+    """
+    __tablename__ = 'summary_stats'
+
+    scope = Column(String, primary_key=True) # tastings, cellar
+    dimension = Column(String, primary_key=True) # all, color, region, producer, appellation, vintage, wine
+    group_key = Column(String, primary_key=True) # grouped value as text ('' for NULL)
+
+    label = Column(String) # display name (producer/appellation name for id groups)
+    ref_id = Column(Integer) # producer/appellation id for links; vintage year for vintage groups
+    region = Column(String) # region name for bar colors
+    is_nv = Column(Boolean) # non-vintage group (vintage dimension)
+    count = Column(Integer) # tasting notes / bottle lines
+    qty = Column(Integer) # bottles (cellar)
+    value = Column(Float) # sum(qty * price) (cellar)
+
+
+# --- GEO EXTENT SYNC ---
+def _geojson_shape(text):
+    try:
+        from shapely.geometry import shape
+        geo = json.loads(text)
+        if geo.get("type") == "FeatureCollection":
+            from shapely.ops import unary_union
+            return unary_union([shape(f["geometry"]) for f in geo["features"] if f.get("geometry")])
+        if geo.get("type") == "Feature":
+            geo = geo["geometry"]
+        return shape(geo)
+    except Exception:
+        return None
+
+def _on_geometry_source_set(target, value, oldvalue, initiator):
+    """
+    A geometry source changed: recompute the extent when the DB GeoJSON is the geometry
+    in use (no parquet id), otherwise clear it until the next --sync-extents.
+    """
+    # oldvalue is the stored value (active_history below); NO_VALUE only for new objects
+    if value == oldvalue or (value is None and oldvalue is NO_VALUE):
+        return
+    uses_parquet = target.vineyard_id if isinstance(target, Vineyard) else (target.inao_id or target.pdo_id)
+    if initiator.key == "geojson" and value and not uses_parquet:
+        target.set_extent(_geojson_shape(value))
+    else:
+        target.set_extent(None)
+
+for _attr in (Appellation.geojson, Appellation.inao_id, Appellation.pdo_id, Vineyard.geojson, Vineyard.vineyard_id):
+    # active_history loads an expired or unloaded old value, so unchanged assignments keep the extent
+    event.listen(_attr, "set", _on_geometry_source_set, active_history=True)
+
+
+# --- VINTAGE ---
+def parse_vintage(value):
+    """
+    Numeric form of a vintage string.
+    
+    Returns:
+        (year or None, is_nv): ("2010") -> (2010, False), ("NV") -> (None, True), ("") -> (None, False)
+    """
+    if value is None:
+        return None, False
+    text = str(value).strip()
+    if text.upper() in ("NV", "N.V.", "NON VINTAGE", "NON-VINTAGE"):
+        return None, True
+    try:
+        year = int(float(text))
+    except (ValueError, OverflowError):
+        return None, False
+    return (year, False) if 1800 <= year <= 2200 else (None, False)
+
+def _on_vintage_set(target, value, oldvalue, initiator):
+    target.vintage_year, target.is_nv = parse_vintage(value)
+
+event.listen(Wine.vintage, "set", _on_vintage_set)
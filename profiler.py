@@ -0,0 +1,190 @@
+"""
+Opt-in page instrumentation. With WINELIB_PROFILE=1 every page render records:
+- SQL statements: count, total DB time and the slowest statements (with their parameters)
+- geometry resolution time (geo_utils.resolve_for_map / resolve_many_for_map)
+- HTML payload size (folium maps and HTML cards sent to the browser)
+
+Finished renders are shown in a sidebar debug panel, kept in memory for JSON export and
+appended as JSON lines to WINELIB_PROFILE_LOG (default data/profile.jsonl), which
+index_advisor.py can replay.
+
+Usage:
+    import profiler
+    profiler.start_page("Producer Detail", {"id": "14"})
+    ...  # render
+    profiler.render_panel(profiler.finish_page())
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENABLED = os.getenv("WINELIB_PROFILE", "").lower() in ("1", "true", "yes")
+LOG_PATH = os.getenv("WINELIB_PROFILE_LOG", os.path.join(CURRENT_DIR, "data", "profile.jsonl"))
+SLOWEST = 10 # statements kept per page in the panel and the log
+HISTORY_SIZE = 100 # finished renders kept in memory for export
+
+_local = threading.local() # the render in progress on this script thread
+_history = deque(maxlen=HISTORY_SIZE)
+_log_lock = threading.Lock()
+
+def _current():
+    return getattr(_local, "record", None)
+
+# --- SQL ---
+def _params(parameters, executemany):
+    """JSON-safe copy of a statement's parameters (first row for executemany)."""
+    if executemany and parameters:
+        parameters = parameters[0]
+    try:
+        return json.loads(json.dumps(parameters, default=str))
+    except Exception:
+        return repr(parameters)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault("profiler_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record = _current()
+    starts = conn.info.get("profiler_start")
+    if record is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = record["statements"].get(statement)
+    if stats is None:
+        stats = record["statements"][statement] = {"sql": statement, "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+    stats["count"] += 1
+    stats["total_ms"] += elapsed * 1000
+    if elapsed * 1000 >= stats["max_ms"]:
+        stats["max_ms"] = elapsed * 1000
+        stats["params"] = _params(parameters, executemany)
+    record["query_count"] += 1
+    record["db_ms"] += elapsed * 1000
+
+if ENABLED:
+    # Listening on the Engine class covers every engine the app creates
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+# --- PAGE RECORDS ---
+def start_page(page, params=None):
+    """Starts recording a page render on this thread (no-op unless profiling is enabled)."""
+    if not ENABLED:
+        return
+    _local.record = {
+        "page": page,
+        "params": dict(params or {}),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "_t0": time.perf_counter(),
+        "query_count": 0,
+        "db_ms": 0.0,
+        "geometry_ms": 0.0,
+        "html_bytes": {},
+        "statements": {},
+    }
+
+def finish_page():
+    """
+    Stops recording, stores the render in the history and appends it to LOG_PATH.
+
+    Returns:
+        The finished record (dict) or None when nothing was being recorded
+    """
+    record = _current()
+    if record is None:
+        return None
+    _local.record = None
+    record["render_ms"] = (time.perf_counter() - record.pop("_t0")) * 1000
+    for key in ("render_ms", "db_ms", "geometry_ms"):
+        record[key] = round(record[key], 1)
+    statements = sorted(record.pop("statements").values(), key=lambda s: s["max_ms"], reverse=True)
+    record["distinct_statements"] = len(statements)
+    # The log keeps every distinct statement so index_advisor.py can replay them
+    log_entry = dict(record, statements=statements)
+    record["slowest"] = statements[:SLOWEST]
+    _history.append(record)
+    try:
+        with _log_lock, open(LOG_PATH, "a") as f:
+            f.write(json.dumps(log_entry, default=str) + "\n")
+    except Exception as e:
+        print(f"[WARN] Could not write profile log {LOG_PATH}: {e}")
+    return record
+
+@contextmanager
+def timed(kind="geometry"):
+    """Adds the time spent in the block to the current page's {kind}_ms."""
+    record = _current()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record[f"{kind}_ms"] = record.get(f"{kind}_ms", 0.0) + (time.perf_counter() - start) * 1000
+
+def add_html(kind, html):
+    """Counts HTML sent to the browser (str or byte count) under kind, e.g. "map" or "cards"."""
+    record = _current()
+    if record is None:
+        return
+    size = html if isinstance(html, int) else len(html.encode("utf-8"))
+    record["html_bytes"][kind] = record["html_bytes"].get(kind, 0) + size
+
+def history():
+    """Finished renders kept in memory, oldest first."""
+    return list(_history)
+
+# --- DEBUG PANEL ---
+def render_panel(record):
+    """Sidebar debug panel for the finished render, with a JSON export of the history."""
+    if not ENABLED or record is None:
+        return
+    import streamlit as st
+    html_kb = sum(record["html_bytes"].values()) / 1024
+    with st.sidebar.expander(":material/speed: Profiler", expanded=False):
+        c1, c2 = st.columns(2)
+        c1.metric("Queries", record["query_count"])
+        c2.metric("DB time", f"{record['db_ms']:,.0f} ms")
+        c1.metric("Render", f"{record['render_ms']:,.0f} ms")
+        c2.metric("Geometry", f"{record['geometry_ms']:,.0f} ms")
+        st.caption(f"HTML: {html_kb:,.0f} KB" + "".join(f" · {k} {v / 1024:,.0f} KB" for k, v in record["html_bytes"].items()))
+        for s in record["slowest"][:5]:
+            st.caption(f"**{s['max_ms']:,.1f} ms** ×{s['count']}")
+            st.code(s["sql"][:500], language="sql")
+        st.download_button("Export JSON", json.dumps(history(), default=str, indent=2),
+                           file_name="winelib_profile.json", mime="application/json", use_container_width=True)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize the page profile log")
+    parser.add_argument("--log", default=LOG_PATH, help="Profile log (JSON lines)")
+    args = parser.parse_args()
+    if not os.path.exists(args.log):
+        print(f"[SKIP] No profile log at {args.log} (run the app with WINELIB_PROFILE=1)")
+        sys.exit(0)
+
+    pages = {}
+    with open(args.log) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            pages.setdefault(entry["page"], []).append(entry)
+
+    print(f"{'Page':<24} {'Renders':>7} {'Queries':>8} {'DB ms':>8} {'Geo ms':>8} {'Render ms':>10} {'HTML KB':>8}")
+    for page, entries in sorted(pages.items()):
+        n = len(entries)
+        avg = lambda key: sum(e.get(key) or 0 for e in entries) / n
+        html = sum(sum(e.get("html_bytes", {}).values()) for e in entries) / n / 1024
+        print(f"{page:<24} {n:>7} {avg('query_count'):>8.1f} {avg('db_ms'):>8.1f} {avg('geometry_ms'):>8.1f} {avg('render_ms'):>10.1f} {html:>8.0f}")
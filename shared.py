@@ -1,7 +1,11 @@
 import sys
 import os
+import threading
+from collections import OrderedDict
 import streamlit as st
-from sqlalchemy import create_engine
+import pandas as pd
+from sqlalchemy import and_, or_, not_, event, inspect, Table
+from sqlalchemy.sql.util import find_tables
 from sqlalchemy.orm import sessionmaker
 
 # Ensure this directory is in sys.path for local imports
@@ -16,22 +20,202 @@ __all__ = [
     "Varietal", "Place", "RestaurantVisit", "Vineyard", "Region",
     "get_all_regions", "get_region_colors_map", "get_or_create_region",
     "get_region_name", "get_session", "TYPE_COLORS", "ISO_MAP", "EXCHANGE_RATES",
-    "DB_URL", "engine", "Session", "AVAILABLE_TILESETS"
+    "DB_URL", "DB_READ_URL", "engine", "read_engine", "engine_options", "make_engine", "Session", "AVAILABLE_TILESETS", "fetch_page",
+    "cached_query", "invalidate_tables", "clear_query_cache", "migrate_schema"
 ]
 
 # --- DATABASE ---
-# PostgreSQL via DB_URL env var (e.g. docker-compose), or SQLite by default
-DATA_DIR = os.path.join(CURRENT_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
+# Connection settings and the engine factory live in database.py (no Streamlit import)
+from database import DB_URL, DB_READ_URL, engine_options, make_engine
 
-DB_URL = os.getenv("DB_URL", f"sqlite:///{os.path.join(DATA_DIR, 'winelib.db')}")
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-engine = create_engine(DB_URL, connect_args=connect_args)
+engine = make_engine(DB_URL)
+read_engine = make_engine(DB_READ_URL) if DB_READ_URL else engine
 Session = sessionmaker(bind=engine)
 
+# Keep the denormalized cellar_inventory table in sync with every commit
+from inventory import track_inventory, TRACKED as INVENTORY_SOURCES
+track_inventory(Session)
+
+# Keep the summary_stats dashboard aggregates in sync (after the inventory, which they read)
+from stats import track_stats, TRACKED as STATS_SOURCES
+track_stats(Session)
+
 def get_session():
     return Session()
 
+@st.cache_resource
+def migrate_schema():
+    """
+    Applies pending schema migrations (migrations.py) once per process, so a database
+    created by an older WineLib gets the columns and tables the models now query.
+
+    Returns:
+        List of applied versions
+    """
+    from migrations import migrate
+    return migrate(engine)
+
+# --- QUERY CACHE ---
+# Query results kept in memory until a commit touches one of the tables they read.
+# Invalidation comes from Session events (see _on_cache_after_flush), so writes made by
+# other processes (CLI scripts) are only picked up by "Clear Cache" in the sidebar.
+# Results are read from the primary, not DB_READ_URL: a replica lagging behind a commit
+# would keep a stale result cached until the next write.
+QUERY_CACHE_SIZE = 256
+
+_query_cache = OrderedDict() # (sql, params) -> (tables, DataFrame)
+_table_versions = {} # table name -> number of invalidations
+_query_cache_lock = threading.Lock()
+
+# Tables rewritten with Core statements inside the commit of their source tables
+_DERIVED_TABLES = {
+    "cellar_inventory": {m.__table__.name for m in INVENTORY_SOURCES},
+    "summary_stats": {m.__table__.name for m in STATS_SOURCES},
+}
+
+def query_tables(query):
+    """Names of the tables a select reads (including joins, subqueries and unions)."""
+    return frozenset(t.name for t in find_tables(query, check_columns=True, include_joins=True) if isinstance(t, Table))
+
+def cached_query(query, tables=None):
+    """
+    pd.read_sql through the query cache.
+    
+    Args:
+        query: SQLAlchemy select (or text(), in which case tables is required)
+        tables: Table names the result depends on (default: found in the query)
+    
+    Returns:
+        A copy of the cached DataFrame
+    """
+    if tables is None:
+        tables = query_tables(query)
+    tables = frozenset(tables)
+    compiled = query.compile(engine)
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    
+    with _query_cache_lock:
+        hit = _query_cache.get(key)
+        if hit is not None:
+            _query_cache.move_to_end(key)
+            return hit[1].copy()
+        versions = {t: _table_versions.get(t, 0) for t in tables}
+    
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn)
+    
+    with _query_cache_lock:
+        # Skip storing a result that raced with a commit to one of its tables
+        if all(_table_versions.get(t, 0) == v for t, v in versions.items()):
+            _query_cache[key] = (tables, df)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return df.copy()
+
+def invalidate_tables(tables):
+    """Drops cached results (and the cached region lookups) that read any of the tables."""
+    tables = set(tables)
+    for derived, sources in _DERIVED_TABLES.items():
+        if tables & sources:
+            tables.add(derived)
+    with _query_cache_lock:
+        for t in tables:
+            _table_versions[t] = _table_versions.get(t, 0) + 1
+        for key in [k for k, (deps, _) in _query_cache.items() if deps & tables]:
+            del _query_cache[key]
+    if "regions" in tables:
+        get_all_regions.clear()
+        get_region_colors_map.clear()
+
+def clear_query_cache():
+    with _query_cache_lock:
+        _query_cache.clear()
+
+def _object_tables(obj):
+    mapper = inspect(obj).mapper
+    tables = {t.name for t in mapper.tables}
+    tables.update(rel.secondary.name for rel in mapper.relationships if rel.secondary is not None)
+    return tables
+
+def _on_cache_after_flush(session, flush_context):
+    changed = session.info.setdefault("cache_tables", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        changed.update(_object_tables(obj))
+
+def _on_cache_orm_execute(orm_execute_state):
+    # Bulk update()/delete()/insert() run through session.execute
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        orm_execute_state.session.info.setdefault("cache_tables", set()).add(table.name)
+
+def _on_cache_after_commit(session):
+    changed = session.info.pop("cache_tables", None)
+    if changed:
+        invalidate_tables(changed)
+
+event.listen(Session, "after_flush", _on_cache_after_flush)
+event.listen(Session, "do_orm_execute", _on_cache_orm_execute)
+event.listen(Session, "after_commit", _on_cache_after_commit)
+event.listen(Session, "after_soft_rollback", lambda session, previous_transaction: session.info.pop("cache_tables", None))
+
+# --- PAGINATION ---
+def _keyset_after(keys, after):
+    """WHERE clause selecting rows that sort after the cursor `after` in the ORDER BY `keys`."""
+    clauses = []
+    for i, (expr, desc) in enumerate(keys):
+        ties = [k == v for (k, _), v in zip(keys[:i], after[:i])]
+        clauses.append(and_(*ties, expr < after[i] if desc else expr > after[i]))
+    return or_(*clauses)
+
+def keyset_window(keys, after, until):
+    """
+    WHERE clauses for the rows between two fetch_page cursors: after `after` (the cursor
+    the page was fetched with) up to and including `until` (the cursor it returned).
+    Pages another table in step with a list, so each of its rows lands on exactly one page.
+    
+    Args:
+        keys: list of (expression, descending), in the same order as the list's keys
+        after: Cursor of the previous page (None for the first page)
+        until: Cursor returned for the next page (None on the last page)
+    """
+    clauses = []
+    if after is not None:
+        clauses.append(_keyset_after(keys, after))
+    if until is not None:
+        clauses.append(not_(_keyset_after(keys, until)))
+    return clauses
+
+def _plain(value):
+    # numpy scalars from the DataFrame -> Python values for the bind parameters
+    return value.item() if hasattr(value, "item") else value
+
+def fetch_page(query, keys, after=None, limit=100):
+    """
+    Fetches one page of a select with keyset pagination (no OFFSET scan).
+    
+    Args:
+        query: SQLAlchemy select (filters already applied, no ORDER BY)
+        keys: list of (expression, descending) forming a unique, non-null sort key,
+              e.g. [(func.coalesce(Region.name, ""), False), (Bottle.id, False)]
+        after: Cursor returned for the previous page (None for the first page)
+        limit: Page size
+    
+    Returns:
+        (DataFrame of the page, cursor for the next page or None on the last page)
+    """
+    labels = [f"_key{i}" for i in range(len(keys))]
+    query = query.add_columns(*(expr.label(l) for (expr, _), l in zip(keys, labels)))
+    if after is not None:
+        query = query.where(_keyset_after(keys, after))
+    query = query.order_by(*(expr.desc() if desc else expr for expr, desc in keys)).limit(limit + 1)
+    with read_engine.connect() as conn:
+        df = pd.read_sql(query, conn)
+    cursor = None
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        cursor = tuple(_plain(v) for v in df[labels].iloc[-1])
+    return df.drop(columns=labels), cursor
+
 # --- CACHED METADATA ---
 @st.cache_data
 def get_all_regions():
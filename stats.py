@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Dashboard aggregates (the summary_stats table).
+
+The Summary page reads pre-grouped counts (notes per color, region, producer,
+appellation and vintage; bottles and value for the cellar) from summary_stats
+instead of loading the tasting history and cellar into pandas on every visit.
+
+The table is kept in sync incrementally: track_stats() installs Session events
+that note which groups a transaction moves rows out of (before the flush) and
+into (at commit), then recomputes only those groups right before the commit.
+Cellar groups are computed from cellar_inventory, so track_stats() must be
+installed after inventory.track_inventory(). A full rebuild runs automatically
+when the table is missing or empty, or on demand:
+
+The scalar dashboard metrics (tasting_metrics, cellar_metrics, michelin_select)
+are plain SQL and can be used outside the app.
+
+Usage:
+    python stats.py --rebuild
+    python stats.py --metrics
+
+This module does not import Streamlit.
+"""
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+from sqlalchemy import event, select, delete, insert, func, or_, literal, cast, String, Integer, Boolean, union
+
+# Ensure this directory is in sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from models import SummaryStat, CellarInventory, TastingNote, Bottle, Wine, Producer, Region, Appellation, Place, RestaurantVisit
+from inventory import TRACKED as INVENTORY_TRACKED, ensure_inventory
+
+SCOPES = ("tastings", "cellar")
+
+
+def _tasting_source():
+    return (
+        select()
+        .select_from(TastingNote)
+        .join(Bottle, TastingNote.bottle_id == Bottle.id)
+        .join(Wine, Bottle.wine_id == Wine.id)
+        .join(Producer, Wine.producer_id == Producer.id)
+        .outerjoin(Region, Wine.region_id == Region.id)
+        .outerjoin(Appellation, Wine.appellation_id == Appellation.id)
+    )
+
+
+def _cellar_source():
+    return select().select_from(CellarInventory).where(CellarInventory.qty > 0)
+
+
+# Per scope: source select, metric columns, and dimension -> (grouped column, label, ref_id, region, is_nv)
+# (ref_id holds the numeric year and is_nv the non-vintage flag of vintage groups, for sorting)
+_SCOPES = {
+    "tastings": {
+        "source": _tasting_source,
+        "metrics": {"count": func.count(), "qty": literal(None), "value": literal(None)},
+        "dimensions": {
+            "all": (None, None, None, None, None),
+            "color": (Wine.type, None, None, None, None),
+            "region": (Region.name, None, None, None, None),
+            "producer": (Producer.id, Producer.name, Producer.id, Region.name, None),
+            "appellation": (Appellation.id, Appellation.name, Appellation.id, Region.name, None),
+            "vintage": (Wine.vintage, None, Wine.vintage_year, None, Wine.is_nv),
+            "wine": (Wine.id, None, None, None, None),
+        },
+        # Changed model -> source column holding its id
+        "tracked": {
+            TastingNote: TastingNote.id, Bottle: Bottle.id, Wine: Wine.id, Producer: Producer.id,
+            Region: Wine.region_id, Appellation: Wine.appellation_id,
+        },
+    },
+    "cellar": {
+        "source": _cellar_source,
+        "metrics": {
+            "count": func.count(),
+            "qty": func.sum(CellarInventory.qty),
+            "value": func.sum(CellarInventory.qty * CellarInventory.price),
+        },
+        "dimensions": {
+            "all": (None, None, None, None, None),
+            "color": (CellarInventory.color, None, None, None, None),
+            "region": (CellarInventory.region, None, None, None, None),
+            "producer": (CellarInventory.producer_id, CellarInventory.domaine, CellarInventory.producer_id, CellarInventory.region, None),
+            "appellation": (CellarInventory.appellation_id, CellarInventory.appellation, CellarInventory.appellation_id, CellarInventory.region, None),
+            "vintage": (CellarInventory.vintage, None, CellarInventory.vintage_year, None, CellarInventory.is_nv),
+            "wine": (CellarInventory.wine_id, None, None, None, None),
+        },
+        "tracked": dict(INVENTORY_TRACKED),
+    },
+}
+
+TRACKED = set().union(*(spec["tracked"] for spec in _SCOPES.values()))
+
+_ready_engines = set()
+
+
+def _group_key(column):
+    # Stored group key: the value as text, '' for NULL
+    return func.coalesce(cast(column, String), "")
+
+
+def _in_groups(column, keys):
+    """WHERE clause matching source rows whose grouped column is one of keys (as stored)."""
+    values = [k for k in keys if k != ""]
+    if column.type.python_type is int:
+        values = [int(k) for k in values]
+    clauses = [column.in_(values)] if values else []
+    if "" in keys:
+        clauses += [column.is_(None), column == ""] if column.type.python_type is str else [column.is_(None)]
+    return or_(*clauses)
+
+
+def _aggregate_select(scope, dimension, keys=None):
+    """SELECT producing summary_stats rows for one dimension (only the given group keys when set)."""
+    spec = _SCOPES[scope]
+    column, label, ref_id, region, is_nv = spec["dimensions"][dimension]
+    group = _group_key(column) if column is not None else literal("")
+    query = spec["source"]().add_columns(
+        literal(scope), literal(dimension), group,
+        func.max(label) if label is not None else group,
+        func.max(ref_id) if ref_id is not None else literal(None),
+        func.max(region) if region is not None else literal(None),
+        # max() over booleans isn't portable (PostgreSQL has bool_or); go through integers
+        cast(func.max(cast(is_nv, Integer)), Boolean) if is_nv is not None else literal(None),
+        *spec["metrics"].values(),
+    )
+    if column is not None:
+        query = query.group_by(group)
+        if keys is not None:
+            query = query.where(_in_groups(column, keys))
+    return query
+
+
+_STAT_COLUMNS = ["scope", "dimension", "group_key", "label", "ref_id", "region", "is_nv", "count", "qty", "value"]
+
+
+def refresh_stats(conn, scope=None, keys=None):
+    """
+    Recomputes summary_stats rows in the current transaction.
+
+    Args:
+        conn: Connection or Session
+        scope: "tastings" or "cellar"; None rebuilds both scopes
+        keys: dict of dimension -> set of group keys to recompute; None rebuilds the whole scope
+
+    Returns:
+        Number of rows written
+    """
+    count = 0
+    for s in ([scope] if scope else SCOPES):
+        for dimension in _SCOPES[s]["dimensions"]:
+            dim_keys = None if keys is None else keys.get(dimension)
+            if keys is not None and not dim_keys:
+                continue
+            stmt = delete(SummaryStat).where(SummaryStat.scope == s, SummaryStat.dimension == dimension)
+            if dim_keys is not None:
+                stmt = stmt.where(SummaryStat.group_key.in_(dim_keys))
+            conn.execute(stmt)
+            if dim_keys is not None and dimension == "all":
+                dim_keys = None
+            result = conn.execute(insert(SummaryStat).from_select(_STAT_COLUMNS, _aggregate_select(s, dimension, dim_keys)))
+            count += max(result.rowcount, 0)
+    return count
+
+
+def _affected_keys(conn, scope, changed):
+    """Group keys (per dimension) of the source rows belonging to the changed ids, in the current state."""
+    spec = _SCOPES[scope]
+    conditions = [spec["tracked"][m].in_(ids) for m, ids in changed.items() if ids and m in spec["tracked"]]
+    if not conditions:
+        return {}
+    dimensions = {d: col for d, (col, *_) in spec["dimensions"].items() if col is not None}
+    query = spec["source"]().add_columns(*(_group_key(col) for col in dimensions.values())).where(or_(*conditions)).distinct()
+    keys = {d: set() for d in dimensions}
+    for row in conn.execute(query):
+        for d, value in zip(dimensions, row):
+            keys[d].add(value)
+    keys["all"] = {""}
+    return keys
+
+
+def _merge_keys(target, keys):
+    for dimension, values in keys.items():
+        target.setdefault(dimension, set()).update(values)
+
+
+def _ensure(conn):
+    SummaryStat.__table__.create(conn, checkfirst=True)
+    if conn.execute(select(SummaryStat.scope).limit(1)).first() is None:
+        refresh_stats(conn)
+
+
+def ensure_stats(engine, conn=None):
+    """
+    Creates the table and fills it when missing or empty (once per engine and process).
+    Pass conn to do it inside an open transaction on that engine.
+    """
+    if engine in _ready_engines:
+        return
+    if conn is None:
+        with engine.begin() as conn:
+            ensure_inventory(engine, conn)
+            _ensure(conn)
+    else:
+        ensure_inventory(engine, conn)
+        _ensure(conn)
+    _ready_engines.add(engine)
+
+
+def _changed_ids(objects):
+    changed = {}
+    for obj in objects:
+        model = type(obj)
+        if model in TRACKED and obj.id is not None:
+            changed.setdefault(model, set()).add(obj.id)
+    return changed
+
+
+def _on_before_flush(session, flush_context, instances):
+    # Groups the changed rows are leaving: read them before the flush writes the new values
+    changed = _changed_ids(list(session.dirty) + list(session.deleted))
+    if not changed:
+        return
+    with session.no_autoflush:
+        conn = session.connection()
+        ensure_stats(conn.engine, conn)
+        old_keys = session.info.setdefault("stats_keys", {})
+        for scope in SCOPES:
+            _merge_keys(old_keys.setdefault(scope, {}), _affected_keys(conn, scope, changed))
+
+
+def _on_after_flush(session, flush_context):
+    changed = session.info.setdefault("stats_changed", {})
+    for model, ids in _changed_ids(list(session.new) + list(session.dirty) + list(session.deleted)).items():
+        changed.setdefault(model, set()).update(ids)
+
+
+def _on_before_commit(session):
+    # Runs after inventory's before_commit, so cellar_inventory is already up to date
+    session.flush()
+    changed = session.info.pop("stats_changed", None)
+    keys = session.info.pop("stats_keys", {})
+    if not changed:
+        return
+    conn = session.connection()
+    ensure_stats(conn.engine, conn)
+    for scope in SCOPES:
+        scope_keys = keys.get(scope, {})
+        _merge_keys(scope_keys, _affected_keys(conn, scope, changed))
+        if scope_keys:
+            refresh_stats(conn, scope, scope_keys)
+
+
+def _on_after_rollback(session):
+    session.info.pop("stats_changed", None)
+    session.info.pop("stats_keys", None)
+
+
+def track_stats(session_factory):
+    """Keeps summary_stats in sync with commits made through session_factory (after track_inventory)."""
+    event.listen(session_factory, "before_flush", _on_before_flush)
+    event.listen(session_factory, "after_flush", _on_after_flush)
+    event.listen(session_factory, "before_commit", _on_before_commit)
+    event.listen(session_factory, "after_soft_rollback", lambda session, previous_transaction: _on_after_rollback(session))
+
+
+def stats_select(scope, dimension=None):
+    """SELECT of summary_stats rows for a scope (and dimension), largest groups first."""
+    query = select(*(getattr(SummaryStat, c) for c in _STAT_COLUMNS[1:])).where(SummaryStat.scope == scope)
+    if dimension:
+        query = query.where(SummaryStat.dimension == dimension)
+    return query.order_by(SummaryStat.dimension, SummaryStat.count.desc(), SummaryStat.group_key)
+
+
+def read_stats(engine, scope, dimension=None):
+    """summary_stats rows for a scope as a DataFrame (dimension, group_key, label, ref_id, region, is_nv, count, qty, value)."""
+    ensure_stats(engine)
+    with engine.connect() as conn:
+        return pd.read_sql(stats_select(scope, dimension), conn)
+
+
+def drink_window_select(year):
+    """
+    Bottles in stock whose drinking window includes year, per region (most bottles first).
+    The window predicates are a range scan on idx_wine_drink_window.
+    """
+    bottles = func.sum(Bottle.qty).label("bottles")
+    return (
+        select(func.coalesce(Region.name, "Unknown").label("region"), bottles,
+               func.count(func.distinct(Wine.id)).label("wines"))
+        .select_from(Wine)
+        .join(Bottle, Bottle.wine_id == Wine.id)
+        .outerjoin(Region, Wine.region_id == Region.id)
+        .where(Wine.drink_window_start <= year, Wine.drink_window_end >= year, Bottle.qty > 0)
+        .group_by(Region.name)
+        .order_by(bottles.desc())
+    )
+
+
+def michelin_select():
+    """
+    One-row SELECT of the Michelin metrics:
+        unique_stars: stars of the distinct starred places visited (tastings or visits)
+        total_stars: stars summed over distinct (date, place) visits, same-day tastings and visits counted once
+    """
+    visits = union(
+        select(TastingNote.date, TastingNote.place_id),
+        select(RestaurantVisit.date, RestaurantVisit.place_id),
+    ).subquery()
+    places = union(select(TastingNote.place_id), select(RestaurantVisit.place_id)).subquery()
+    starred = Place.michelin_stars > 0
+    return select(
+        select(func.coalesce(func.sum(Place.michelin_stars), 0))
+        .join(places, places.c.place_id == Place.id).where(starred)
+        .scalar_subquery().label("unique_stars"),
+        select(func.coalesce(func.sum(Place.michelin_stars), 0))
+        .join(visits, visits.c.place_id == Place.id).where(starred)
+        .scalar_subquery().label("total_stars"),
+    )
+
+
+def _totals(conn, scope):
+    row = conn.execute(select(SummaryStat.count, SummaryStat.qty, SummaryStat.value).where(
+        SummaryStat.scope == scope, SummaryStat.dimension == "all")).first()
+    wines = conn.execute(select(func.count()).select_from(SummaryStat).where(
+        SummaryStat.scope == scope, SummaryStat.dimension == "wine", SummaryStat.group_key != "")).scalar()
+    return row, wines
+
+
+def tasting_metrics(engine):
+    """
+    Tasting dashboard metrics as plain numbers.
+
+    Returns:
+        dict with total_notes, unique_wines, unique_stars, total_stars
+    """
+    ensure_stats(engine)
+    with engine.connect() as conn:
+        row, wines = _totals(conn, "tastings")
+        stars = conn.execute(michelin_select()).one()
+    return {
+        "total_notes": row.count if row else 0,
+        "unique_wines": wines,
+        "unique_stars": int(stars.unique_stars),
+        "total_stars": int(stars.total_stars),
+    }
+
+
+def cellar_metrics(engine):
+    """
+    Cellar dashboard metrics as plain numbers (bottles in stock).
+
+    Returns:
+        dict with total_bottles, unique_wines, total_value (sum of qty * price, unconverted)
+    """
+    ensure_stats(engine)
+    with engine.connect() as conn:
+        row, wines = _totals(conn, "cellar")
+    return {
+        "total_bottles": int(row.qty or 0) if row else 0,
+        "unique_wines": wines,
+        "total_value": float(row.value or 0) if row else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the WineLib dashboard aggregates")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild every aggregate row")
+    parser.add_argument("--metrics", action="store_true", help="Print the dashboard metrics")
+    args = parser.parse_args()
+
+    from database import DB_URL, make_engine
+    engine = make_engine(DB_URL)
+
+    ensure_stats(engine)
+    if args.rebuild:
+        start = time.time()
+        with engine.begin() as conn:
+            count = refresh_stats(conn)
+        print(f"[OK] summary_stats: rebuilt {count} rows ({time.time() - start:.2f}s)")
+    with engine.connect() as conn:
+        for scope in SCOPES:
+            total = conn.execute(select(func.count()).select_from(SummaryStat).where(SummaryStat.scope == scope)).scalar()
+            print(f"  {scope}: {total} rows")
+    if args.metrics:
+        for name, metrics in [("tastings", tasting_metrics(engine)), ("cellar", cellar_metrics(engine))]:
+            print(f"  {name}: " + ", ".join(f"{k}={v:,.0f}" if isinstance(v, float) else f"{k}={v}" for k, v in metrics.items()))
+    print("[DONE] summary_stats is up to date.")
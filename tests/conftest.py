@@ -0,0 +1,32 @@
+"""
+Test setup: the app modules create their engines from DB_URL when shared.py is imported,
+so a throwaway SQLite database is configured here, before any test imports them.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_DB_DIR = tempfile.mkdtemp(prefix="winelib-test-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'winelib.db')}"
+# The engine profile and page instrumentation come from the environment too; use the defaults
+for _name in ("DB_READ_URL", "WINELIB_PROFILE", "TILE_SERVER_PORT"):
+    os.environ.pop(_name, None)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def db():
+    """The shared module, with the schema of the test database migrated as at app startup."""
+    import shared
+    shared.migrate_schema()
+    return shared
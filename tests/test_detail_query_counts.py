@@ -0,0 +1,91 @@
+"""
+Detail pages load related rows with the joinedload plans in views.details.QUERY_PLANS.
+The SQL statements a page runs must stay under a fixed bound that does not grow with
+the number of wines, bottles, notes and visits it lists.
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from streamlit.testing.v1 import AppTest
+
+# page -> (view function, object id, max statements per render with warm caches)
+PAGES = {
+    "producer": ("view_producer_detail", 1, 5),
+    "appellation": ("view_appellation_detail", 1, 3),
+    "vineyard": ("view_vineyard_detail", 1, 3),
+    "wine": ("view_wine_detail", 1, 8),
+    "place": ("view_place_detail", 1, 3),
+}
+
+
+@pytest.fixture(scope="module")
+def seeded(db):
+    """Reference rows every page points at (all with id 1), plus a first batch of wines."""
+    from shared import Region, Producer, Appellation, Vineyard, Varietal, Place
+    session = db.get_session()
+    region = Region(id=1, name="Bourgogne", country="France", color="#8b0000")
+    session.add_all([
+        region,
+        Producer(id=1, name="Domaine Test", region_obj=region),
+        Appellation(id=1, name="Meursault", region_obj=region, type="AOC"),
+        Vineyard(id=1, name="Perrières", region_obj=region, village="Meursault"),
+        Varietal(id=1, name="Chardonnay"),
+        Place(id=1, name="Test Bistro", city="Beaune", michelin_stars=1),
+    ])
+    session.commit()
+    session.close()
+    add_rows(db, 3)
+    return db
+
+
+def add_rows(db, count):
+    """
+    Adds `count` wines for the producer, appellation and vineyard, each with a bottle in
+    the cellar and a tasting note at the place, plus `count` bottles, notes and visits
+    for wine 1 and the place.
+    """
+    from shared import Wine, Bottle, TastingNote, RestaurantVisit
+    session = db.get_session()
+    wine_one = session.get(Wine, 1)
+    if wine_one is None:
+        wine_one = Wine(id=1, producer_id=1, appellation_id=1, vineyard_id=1, region_id=1, varietal_id=1,
+                        cuvee="Perrières", vintage="2015", type="White")
+        session.add(wine_one)
+    for i in range(count):
+        wine = Wine(producer_id=1, appellation_id=1, vineyard_id=1, region_id=1, varietal_id=1,
+                    cuvee=f"Cuvée {i}", vintage=str(2000 + i % 20), type="White")
+        for w in (wine, wine_one):
+            bottle = Bottle(wine=w, qty=1, location="Rack A", price=80.0, currency="EUR")
+            session.add(TastingNote(bottle=bottle, date=date(2024, 1, 1 + i % 28), rating=92, place_id=1, notes="Test"))
+        session.add(RestaurantVisit(date=date(2024, 2, 1 + i % 28), place_id=1, notes="Dinner"))
+    session.commit()
+    session.close()
+
+
+def count_queries(page):
+    """Statements run by one render of a detail page (after a warm-up render fills the caches)."""
+    view, obj_id, _ = PAGES[page]
+    script = f"from views import details\ndetails.{view}({obj_id})\n"
+    AppTest.from_string(script, default_timeout=60).run()
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        at = AppTest.from_string(script, default_timeout=60).run()
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    assert not at.exception, at.exception
+    return len(statements)
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_detail_query_count_is_bounded(seeded, page):
+    before = count_queries(page)
+    add_rows(seeded, 10)
+    after = count_queries(page)
+    assert after == before, f"{page}: {before} statements with fewer rows, {after} with 10 more wines"
+    assert after <= PAGES[page][2], f"{page}: {after} statements (max {PAGES[page][2]})"
@@ -0,0 +1,84 @@
+"""
+init_db streams the seed CSVs through _read_chunks. Empty cells must come back as None
+(NULL), never NaN: PostgreSQL rejects NaN in integer and date columns and COPY writes
+it as the text "nan".
+"""
+import math
+from datetime import date
+
+import pytest
+
+import init_db
+from models import Appellation
+
+CSV = """id,name,inao_id,max_yield_hl,max_yield_kg,registration_date,details
+1,Meursault,101,50.5,7000,1937-07-31,Côte de Beaune
+2,Chablis,,,,,
+3,Pomerol,80.0,bad,,not a date,
+"""
+
+
+@pytest.fixture
+def seed_csv(tmp_path):
+    path = tmp_path / "appellations.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return str(path)
+
+
+def _rows(path, chunk_size=2000):
+    columns = {c.name: c for c in Appellation.__table__.columns}
+    original = init_db.SEED_CHUNK_SIZE
+    init_db.SEED_CHUNK_SIZE = chunk_size
+    try:
+        return [row for chunk in init_db._read_chunks(path, columns) for row in chunk.to_dict("records")]
+    finally:
+        init_db.SEED_CHUNK_SIZE = original
+
+
+@pytest.mark.parametrize("chunk_size", [2000, 1])
+def test_empty_values_are_none(seed_csv, chunk_size):
+    rows = _rows(seed_csv, chunk_size)
+    assert rows[0] == {
+        "id": 1, "name": "Meursault", "inao_id": 101, "max_yield_hl": 50.5, "max_yield_kg": 7000,
+        "registration_date": date(1937, 7, 31), "details": "Côte de Beaune",
+    }
+    # Empty ints, floats, dates and strings, and unparseable values
+    for row in rows[1:]:
+        for name in ("max_yield_hl", "max_yield_kg", "registration_date", "details"):
+            assert row[name] is None, (row["id"], name, row[name])
+    assert rows[1]["inao_id"] is None
+    assert rows[2]["inao_id"] == 80 and isinstance(rows[2]["inao_id"], int)
+    for row in rows:
+        assert not any(isinstance(v, float) and math.isnan(v) for v in row.values()), row
+
+
+class _CopyCursor:
+    """Captures what _copy_chunk sends to a psycopg2 cursor's copy_expert."""
+    def __init__(self):
+        self.sql = self.data = None
+
+    def copy_expert(self, sql, buf):
+        self.sql, self.data = sql, buf.read()
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self, cursor):
+        self.connection = type("DBAPIConnection", (), {"driver_connection": type("Driver", (), {"cursor": lambda _: cursor})()})()
+
+
+def test_copy_writes_empty_values_as_null(seed_csv):
+    columns = {c.name: c for c in Appellation.__table__.columns}
+    chunk = next(init_db._read_chunks(seed_csv, columns))
+    cursor = _CopyCursor()
+    init_db._copy_chunk(_Connection(cursor), Appellation.__table__, chunk)
+
+    assert cursor.sql.startswith('COPY appellations ("id", "name", "inao_id"')
+    lines = cursor.data.splitlines()
+    assert lines[0] == "1,Meursault,101,50.5,7000,1937-07-31,Côte de Beaune"
+    # Unquoted empty fields are NULL in COPY's CSV format
+    assert lines[1] == "2,Chablis,,,,,"
+    assert lines[2] == "3,Pomerol,80,,,,"
+    assert "nan" not in cursor.data.lower()
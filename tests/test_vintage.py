@@ -0,0 +1,44 @@
+"""
+Vintage parsing and the Summary page's vintage order: years ascending, every non-vintage
+spelling last, unparsed vintages first.
+"""
+import pandas as pd
+import pytest
+
+from models import parse_vintage
+from views.summary import vintage_counts
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2010", (2010, False)),
+    (" 1996.0 ", (1996, False)),
+    ("NV", (None, True)),
+    ("n.v.", (None, True)),
+    ("Non-Vintage", (None, True)),
+    ("", (None, False)),
+    (None, (None, False)),
+    ("abc", (None, False)),
+    ("1650", (None, False)),
+    ("nan", (None, False)),
+    ("inf", (None, False)),
+    ("-inf", (None, False)),
+    ("1e400", (None, False)),
+])
+def test_parse_vintage(text, expected):
+    assert parse_vintage(text) == expected
+
+
+def test_vintage_counts_puts_every_nv_spelling_last():
+    labels = ["N.V.", "2015", "Non-Vintage", "abc", "NV", "2001"]
+    parsed = [parse_vintage(label) for label in labels]
+    stats = pd.DataFrame({
+        "dimension": "vintage",
+        "group_key": labels,
+        "label": labels,
+        "ref_id": [year for year, _ in parsed],
+        "is_nv": [is_nv for _, is_nv in parsed],
+        "count": range(len(labels)),
+    })
+    counts = vintage_counts(stats, "count", "Notes")
+    assert list(counts.index) == ["abc", "2001", "2015", "N.V.", "Non-Vintage", "NV"]
+    assert counts["NV"] == 4
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Local Mapbox Vector Tile (MVT) endpoint for the appellation and vineyard layers.
+
+Serves /tiles/{z}/{x}/{y}.pbf from the geo_utils.SpatialIndex of the simplification
+level matching the tile's zoom. Each tile holds two layers, "appellations" and
+"vineyards", whose features are keyed by Appellation.id / Vineyard.id, clipped to the
+tile and simplified for its zoom. Maps add the endpoint as a single VectorGrid layer and
+browsers only fetch the visible tiles.
+
+The app starts it in-process when TILE_SERVER_PORT is set (see geo_utils.start_tile_server).
+It listens on 127.0.0.1 unless TILE_SERVER_HOST (or --host) says otherwise. It can also
+run on its own, e.g. behind a reverse proxy:
+
+Usage:
+    python tile_server.py --port 8765
+    python tile_server.py --host 0.0.0.0   # reachable from other machines
+
+Requires the optional mapbox-vector-tile package (pip install mapbox-vector-tile).
+"""
+import os
+import re
+import sys
+import math
+import argparse
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+import mapbox_vector_tile
+
+# Ensure this directory is in sys.path
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.insert(0, CURRENT_DIR)
+
+from geo_build import VINEYARD_MIN_ZOOM
+
+# --- Config ---
+EXTENT = 4096           # MVT tile coordinate space
+BUFFER = 64             # Pixels drawn outside the tile so strokes don't clip at edges
+DEFAULT_HOST = os.getenv("TILE_SERVER_HOST") or "127.0.0.1"
+MAX_LAT = 85.0511287798
+ORIGIN = 20037508.342789244  # Half the web mercator world width in meters
+
+# layer name in the tile -> SpatialIndex kind, minimum zoom
+LAYERS = {
+    "appellations": ("Appellation", 0),
+    "vineyards": ("Vineyard", VINEYARD_MIN_ZOOM),
+}
+
+_TILE_RE = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+def tile_lonlat_bounds(z, x, y):
+    """(min_lng, min_lat, max_lng, max_lat) of a slippy map tile."""
+    n = 2 ** z
+    min_lng = x / n * 360.0 - 180.0
+    max_lng = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _to_tile_pixels(coords, z, x, y):
+    """Projects lon/lat coordinates (N x 2 array) to tile pixel space (y down)."""
+    lng = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MAX_LAT, MAX_LAT)
+    mx = np.radians(lng) * ORIGIN / math.pi
+    my = np.log(np.tan(math.pi / 4 + np.radians(lat) / 2)) * ORIGIN / math.pi
+    size = 2 * ORIGIN / 2 ** z
+    px = (mx - (-ORIGIN + x * size)) / size * EXTENT
+    py = ((ORIGIN - y * size) - my) / size * EXTENT
+    return np.column_stack([px, py])
+
+
+class _Source:
+    """The index and names a tile is rendered from; equal only to the same two objects."""
+    __slots__ = ("index", "names")
+
+    def __init__(self, index, names):
+        self.index, self.names = index, names
+
+    def __eq__(self, other):
+        return self.index is other.index and self.names is other.names
+
+    def __hash__(self):
+        return hash((id(self.index), id(self.names)))
+
+
+class TileRenderer:
+    """
+    Encodes vector tiles, caching the most recently used tiles.
+
+    The index and names are looked up on every request and are part of the tile cache
+    key, so tiles follow a rebuilt index ("Clear Cache", new geo data). The cache is
+    dropped when they change, so the old index can be freed.
+    """
+
+    def __init__(self, get_index, get_names, cache_size=4096):
+        """
+        Args:
+            get_index: Function zoom -> geo_utils.SpatialIndex with the geometries for that zoom
+            get_names: Function returning dict of kind -> {id: name} (the feature "name" property)
+        """
+        self.get_index = get_index
+        self.get_names = get_names
+        self._sources = {} # zoom -> _Source of the most recent request
+        self._lock = threading.Lock()
+        self._cached = lru_cache(maxsize=cache_size)(self._render)
+
+    def render(self, z, x, y):
+        """Encoded tile bytes (empty when the tile has no features)."""
+        source = _Source(self.get_index(z), self.get_names())
+        with self._lock:
+            previous = self._sources.get(z)
+            if previous is not None and previous != source:
+                self._cached.cache_clear()
+                self._sources.clear()
+            self._sources[z] = source
+        return self._cached(z, x, y, source)
+
+    def _layer_features(self, source, kind, z, x, y):
+        index = source.index
+        min_lng, min_lat, max_lng, max_lat = tile_lonlat_bounds(z, x, y)
+        pad_lng = (max_lng - min_lng) * BUFFER / EXTENT
+        pad_lat = (max_lat - min_lat) * BUFFER / EXTENT
+        hits = index.query_bbox(min_lng - pad_lng, min_lat - pad_lat, max_lng + pad_lng, max_lat + pad_lat, kind=kind)
+
+        clip_box = box(-BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+        kind_names = source.names.get(kind, {})
+        features = []
+        for _, obj_id in hits:
+            geom = shapely.transform(index.geometry(kind, obj_id), lambda c: _to_tile_pixels(c, z, x, y))
+            geom = geom.intersection(clip_box).simplify(0.5, preserve_topology=True)
+            if geom.is_empty:
+                continue
+            features.append({
+                "geometry": geom,
+                "properties": {"id": obj_id, "name": kind_names.get(obj_id, "")},
+                "id": obj_id,
+            })
+        return features
+
+    def _render(self, z, x, y, source):
+        layers = []
+        for layer_name, (kind, min_zoom) in LAYERS.items():
+            if z < min_zoom:
+                continue
+            features = self._layer_features(source, kind, z, x, y)
+            if features:
+                layers.append({"name": layer_name, "features": features})
+        if not layers:
+            return b""
+        return mapbox_vector_tile.encode(layers, default_options={"y_coord_down": True, "extents": EXTENT})
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    renderer = None
+
+    def do_GET(self):
+        match = _TILE_RE.match(self.path.split("?")[0])
+        if not match:
+            self.send_error(404)
+            return
+        z, x, y = (int(v) for v in match.groups())
+        try:
+            body = self.renderer.render(z, x, y)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        # The app versions the tile URL (?v=...) whenever its index changes
+        self.send_header("Cache-Control", "public, max-age=3600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(renderer, host=DEFAULT_HOST, port=8765, background=True):
+    """
+    Starts the tile endpoint. With background=True the server runs in a daemon thread
+    and is returned; otherwise this call blocks. The default host only accepts local
+    connections; pass "0.0.0.0" to listen on every interface.
+    """
+    handler = type("TileHandler", (_TileHandler,), {"renderer": renderer})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="tile-server", daemon=True).start()
+        return server
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve WineLib appellation/vineyard vector tiles")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on (default: TILE_SERVER_HOST or 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("TILE_SERVER_PORT") or 8765))
+    args = parser.parse_args()
+
+    import geo_utils
+    print("[*] Building spatial index...")
+    renderer = TileRenderer(geo_utils.get_tile_index, geo_utils.get_geometry_names)
+    print(f"[OK] {len(geo_utils.get_spatial_index())} geometries indexed.")
+    print(f"[*] Serving tiles on http://{args.host}:{args.port}/tiles/{{z}}/{{x}}/{{y}}.pbf")
+    serve(renderer, args.host, args.port, background=False)
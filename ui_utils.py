@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from shared import get_region_colors_map, TYPE_COLORS
+from shared import get_region_colors_map, TYPE_COLORS, EXCHANGE_RATES
 
 COLOR_PRODUCER = "#d9ead3"
 COLOR_SEC = "#ead1dc"
-COLOR_VINTAGE = "#d9d2e9"
 COLOR_APPELATION = "#ead1dc"
 
 def render_table(styler, config, cols):
+    """Renders a table from apply_colors (a Styler, or a plain DataFrame for large tables)."""
     # Ensure specific columns expand to fill space if using container width
     new_config = config.copy() if config else {}
     greedy_cols = ["Producer", "Domaine", "Domaine_Link", "Cuvee", "Cuvee_Link", "Link"]
@@ -17,12 +17,44 @@ def render_table(styler, config, cols):
             # We use "large" to suggest these should take more space
             new_config[c] = st.column_config.Column(width="large")
             
-    n_rows = len(styler.data)
+    n_rows = len(styler) if isinstance(styler, pd.DataFrame) else len(styler.data)
     height = min((n_rows + 1) * 35 + 3, 2000)
     if height < 150: height = 150
     st.dataframe(styler, column_config=new_config, hide_index=True, width="stretch", column_order=cols, height=height)
 
 
+PAGE_SIZES = [50, 100, 250]
+
+def pager_cursor(key, signature):
+    """
+    Cursor of the current page of a keyset-paginated list (see shared.fetch_page), and its page size.
+    Goes back to the first page when the filter signature or the page size changes.
+    """
+    size = st.session_state.get(f"{key}_size", PAGE_SIZES[0])
+    state = st.session_state.get(key)
+    if state is None or state["signature"] != (signature, size):
+        state = {"signature": (signature, size), "cursors": [None], "page": 0}
+        st.session_state[key] = state
+    return state["cursors"][state["page"]], size
+
+def _turn_page(key, step):
+    st.session_state[key]["page"] += step
+
+def render_pager(key, total, next_cursor):
+    """Page size selector and Prev/Next buttons; next_cursor is the cursor returned with the current page."""
+    state = st.session_state[key]
+    page = state["page"]
+    del state["cursors"][page + 1:]
+    if next_cursor is not None:
+        state["cursors"].append(next_cursor)
+    size = state["signature"][1]
+    
+    c1, c2, c3, c4 = st.columns([1, 3, 1, 1], vertical_alignment="center")
+    c1.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_size", label_visibility="collapsed")
+    c2.caption(f"Page {page + 1} of {max(1, -(-total // size))} · {total} rows")
+    c3.button("Prev", key=f"{key}_prev", disabled=page == 0, on_click=_turn_page, args=(key, -1), use_container_width=True)
+    c4.button("Next", key=f"{key}_next", disabled=next_cursor is None, on_click=_turn_page, args=(key, 1), use_container_width=True)
+
 def navigate_to(page_name, params=None):
     st.session_state["page"] = page_name
     st.query_params["page"] = page_name
@@ -39,73 +71,98 @@ def display_region_line(region):
     color = region_colors.get(region, "#7b68ee")
     st.markdown(f'<hr style="border: none; border-top: 3px solid {color}; margin: 5px 0 15px 0; opacity: 0.8;">', unsafe_allow_html=True)
 
+# --- COLUMN BUILDERS ---
+# Vectorized builders for the derived and link columns of the list views
+# (one pandas string operation per column instead of a Python lambda per row).
+
+def url_label(values):
+    """Label part of a link URL: text with spaces as '+' (empty when missing)."""
+    return values.fillna("").astype(str).str.replace(" ", "+", regex=False)
+
+def _id_text(ids):
+    # Float ids (int columns with NULLs) would print as "3.0"
+    if pd.api.types.is_float_dtype(ids):
+        ids = ids.astype("Int64")
+    return ids.astype(str)
+
+def link_column(page, ids, labels, fallback=None):
+    """
+    "/?page={page}&id={id}&label={label}" for each row.
+    
+    Args:
+        page: Page name with spaces as '+', e.g. "Producer+Detail"
+        ids: Series of ids; rows with a null id get the fallback value
+        labels: Series of labels (already URL-formatted, see url_label)
+        fallback: Series or scalar used where the id is null (default None)
+    """
+    links = ("/?page=" + page + "&id=") + _id_text(ids) + "&label=" + labels
+    return links.where(ids.notna(), fallback)
+
+def cuvee_label(cuvee):
+    """URL label for a cuvee, '-' when missing or blank."""
+    blank = cuvee.isna() | (cuvee.astype(str).str.strip() == "")
+    return url_label(cuvee).where(~blank, "-")
+
+def price_sgd(price, currency):
+    """Prices converted to SGD with EXCHANGE_RATES (unknown currencies count as SGD)."""
+    return price * currency.map(EXCHANGE_RATES).fillna(1.0)
+
+def vintage_label(vintage, disgorgement):
+    """Vintage, with the disgorgement date appended to NV wines ("NV - Oct 2024")."""
+    has_disg = (vintage == "NV") & disgorgement.notna() & (disgorgement.astype(str) != "")
+    return vintage.where(~has_disg, vintage.astype(str) + " - " + disgorgement.astype(str))
+
+def location_group(location):
+    """Location group: H* -> Home, WB* -> WineBanc, otherwise the location itself."""
+    loc = location.fillna("None").astype(str)
+    return pd.Series(np.select([loc.str.startswith("H"), loc.str.startswith("WB")], ["Home", "WineBanc"], default=loc), index=location.index)
+
 opacity = "80"
 color_dark = "#808080"
+
+# Tables with more rows than this skip the pandas Styler (per-cell CSS on every rerun)
+STYLER_MAX_ROWS = 300
+
+# Colored dots standing in for TYPE_COLORS in tables rendered without a Styler
+TYPE_EMOJI = {
+    "Red": "🔴", "White": "🟡", "Bubbles": "⚪", "Rose": "🟣",
+    "Sweet": "🟠", "Fortified": "🟤", "Orange": "🟠",
+}
+
+BOLD_COLUMNS = ["Producer", "Domaine", "Producer_Link", "Domaine_Link", "Name_Link", "Appellation", "Varietal", "Vintage"]
+
 def apply_colors(df):
-    region_colors = get_region_colors_map()
+    """
+    Colors the Region and wine type (Color / Type) columns and bolds producer, appellation,
+    varietal and vintage columns.
     
-    def color_region(val):
-        color = region_colors.get(val)
-        if color: return f'font-weight: bold; color: {color};'
-        return ''
-        
-    def color_type(val):
-        cols = TYPE_COLORS.get(val)
-        if cols: return f'font-weight: bold; color: {cols[0]}; font-size: 1.2em; text-align: center;'
-        return ''
+    Styles are computed once per column from precomputed lookups. Tables larger than
+    STYLER_MAX_ROWS come back as a plain DataFrame with wine types shown as TYPE_EMOJI;
+    render_table accepts either.
+    """
+    type_cols = [c for c in ["Color", "Type"] if c in df.columns]
+    if "City" in df.columns and "Type" in type_cols:
+        type_cols.remove("Type") # Place types, not wine types
     
-    def color_producer(val):
-        col = COLOR_PRODUCER
-        return f'font-weight: bold;' 
+    if len(df) > STYLER_MAX_ROWS:
+        df = df.copy()
+        for c in type_cols:
+            df[c] = df[c].map(TYPE_EMOJI).fillna("●")
+        return df
     
-    def color_appellation(val):
-        col = COLOR_APPELATION
-        return f'font-weight: bold;' 
+    region_css = {name: f'font-weight: bold; color: {color};' for name, color in get_region_colors_map().items()}
+    type_css = {name: f'font-weight: bold; color: {cols[0]}; font-size: 1.2em; text-align: center;' for name, cols in TYPE_COLORS.items()}
     styler = df.style
     
     if "Region" in df.columns:
-        styler = styler.map(color_region, subset=["Region"])
-    if "Color" in df.columns: 
-        styler = styler.map(color_type, subset=["Color"])
-        styler = styler.format({"Color": lambda x: "●"})
-    if "Type" in df.columns and not "City" in df.columns:
-        styler = styler.map(color_type, subset=["Type"])
-        styler = styler.format({"Type": lambda x: "●"})
+        styler = styler.apply(lambda s: s.map(region_css).fillna(""), subset=["Region"])
+    for c in type_cols:
+        styler = styler.apply(lambda s: s.map(type_css).fillna(""), subset=[c])
+    if type_cols:
+        styler = styler.format(dict.fromkeys(type_cols, lambda x: "●"))
         
-    prod_cols = [c for c in df.columns if c in ["Producer", "Domaine", "Producer_Link", "Domaine_Link", "Name_Link"]]
-    if prod_cols:
-        styler = styler.map(color_producer, subset=prod_cols)
-        
-    app_var_cols = [c for c in df.columns if c in ["Appellation", "Varietal"]]
-    if app_var_cols:
-        styler = styler.map(color_appellation, subset=app_var_cols)
-
-    if "Vintage" in df.columns:
-        try:
-            vintages = pd.to_numeric(df["Vintage"], errors='coerce')
-            min_v = vintages.min()
-            max_v = vintages.max()
-            
-            def get_vintage_color(v):
-                try:
-                    year = float(v)
-                    if np.isnan(year): return ''
-                    if min_v == max_v:
-                        return 'font-weight: bold; background-color: #d9ead3; color: black'
-                    
-                    norm = (year - min_v) / (max_v - min_v)
-                    # Custom interpolation from purple-ish to green-is
-                    s_rgb = [209, 196, 233] # Start
-                    e_rgb = [217, 234, 211] # End
-                    curr_rgb = [int(s + (e - s) * norm) for s, e in zip(s_rgb, e_rgb)]
-                    hex_color = '#{:02x}{:02x}{:02x}'.format(*curr_rgb)
-                    return f'font-weight: bold; color: black; background-color: {hex_color};'
-                except:
-                    return f'font-weight: bold; color: black; background-color: {COLOR_VINTAGE};'
-                 
-            #styler = styler.map(get_vintage_color, subset=["Vintage"])
-            styler = styler.map(lambda x: f'font-weight: bold;', subset=["Vintage"])
-        except Exception:
-            pass
+    bold_cols = [c for c in df.columns if c in BOLD_COLUMNS]
+    if bold_cols:
+        styler = styler.set_properties(subset=bold_cols, **{"font-weight": "bold"})
 
     return styler
@@ -1,79 +1,67 @@
 import streamlit as st
-import pandas as pd
-from shared import get_session, engine, EXCHANGE_RATES
-from ui_utils import apply_colors, render_table, navigate_to
-from shared import Bottle
+from sqlalchemy import select, func, case, and_
+from shared import engine, read_engine, fetch_page, EXCHANGE_RATES
+from ui_utils import apply_colors, render_table, navigate_to, pager_cursor, render_pager
+from ui_utils import link_column, url_label, cuvee_label, price_sgd, vintage_label, location_group
+from inventory import CellarInventory, LOCATION_GROUP, ensure_inventory, inventory_select
+
+# Singapore value excludes bottles held at these locations
+EXCLUDED_LOCATIONS = ["Paris", "Chemaze", "Beaune", "Octavian"]
+
+# List order: region, domaine, vintage (newest first); bottle_id makes the keyset unique
+SORT_KEYS = [
+    (func.coalesce(CellarInventory.region, ""), False),
+    (func.coalesce(CellarInventory.domaine, ""), False),
+    (func.coalesce(CellarInventory.vintage, ""), True),
+    (CellarInventory.bottle_id, False),
+]
+
+def _distinct(conn, column):
+    rows = conn.execute(select(column).where(CellarInventory.qty > 0).distinct())
+    return sorted(r[0] for r in rows if r[0] is not None)
+
+def _position(conn, text, part):
+    """Case-sensitive substring position (0 if absent); LIKE ignores case on SQLite but not on PostgreSQL."""
+    if conn.dialect.name == "postgresql":
+        return func.strpos(text, part)
+    return func.instr(text, part)
+
+def _stats(conn):
+    """Total bottles, value and Singapore value (SGD), summed in SQL per currency."""
+    location = func.coalesce(CellarInventory.location, "")
+    in_sg = and_(*(_position(conn, location, k) == 0 for k in EXCLUDED_LOCATIONS))
+    value = CellarInventory.qty * CellarInventory.price
+    rows = conn.execute(
+        select(
+            CellarInventory.currency,
+            func.sum(CellarInventory.qty),
+            func.sum(value),
+            func.sum(case((in_sg, value), else_=0)),
+        ).where(CellarInventory.qty > 0).group_by(CellarInventory.currency)
+    ).all()
+    total_qty = sum(r[1] or 0 for r in rows)
+    total_val = sum((r[2] or 0) * EXCHANGE_RATES.get(r[0], 1.0) for r in rows)
+    singapore_val = sum((r[3] or 0) * EXCHANGE_RATES.get(r[0], 1.0) for r in rows)
+    return total_qty, total_val, singapore_val
 
 def view_cellar():
     st.markdown('# :material/warehouse: Cellar', unsafe_allow_html=True)
     
-    session = get_session()
-    
-    # Stats
-    bottles_in_stock = session.query(Bottle).filter(Bottle.qty > 0).all()
-    total_qty = sum(b.qty for b in bottles_in_stock)
-    total_val = sum(b.qty * b.price * EXCHANGE_RATES.get(b.currency, 1.0) for b in bottles_in_stock)
-    unique_lines = len(bottles_in_stock)
+    # Denormalized inventory (see inventory.py); filters, totals and paging run in SQL
+    ensure_inventory(engine)
+    with read_engine.connect() as conn:
+        total_qty, total_val, singapore_val = _stats(conn)
+        options = {
+            "Color": _distinct(conn, CellarInventory.color),
+            "Region": _distinct(conn, CellarInventory.region),
+            "Producer": _distinct(conn, CellarInventory.domaine),
+            "Location Group": _distinct(conn, LOCATION_GROUP),
+            "Location": _distinct(conn, CellarInventory.location),
+        }
     
     # Custom CSS handled by shared component
-        
-    query = """
-        SELECT 
-            b.location as "Location",
-            b.qty as "Qty",
-            w.type as "Color",
-            r.name as "Region",
-            p.name as "Domaine",
-            w.cuvee as "Cuvee",
-            a.name as "Appellation",
-            v.name as "Varietal",
-            w.vintage as "Vintage",
-            w.disgorgement_date as "Disgorgement",
-            b.bottle_size as "Format",
-            b.price as "raw_price",
-            b.currency as "Currency",
-            w.rp_score as "RP",
-            b.purchase_date as "DatePurchased",
-            p.id as "pid", w.id as "wid", b.id as "bid", a.id as "aid"
-        FROM cellar b
-        JOIN wines w ON b.wine_id = w.id
-        JOIN producers p ON w.producer_id = p.id
-        LEFT JOIN regions r ON w.region_id = r.id
-        LEFT JOIN appellations a ON w.appellation_id = a.id
-        LEFT JOIN varietals v ON w.varietal_id = v.id
-        WHERE b.qty > 0
-        ORDER BY r.name, p.name, w.vintage DESC
-    """
-    df = pd.read_sql(query, engine)
-    session.close()
     
-    if not df.empty:
-        # --- Aggregation / Summary Table ---
-        def get_loc_group(loc):
-            if str(loc).startswith("H"): return "Home"
-            if str(loc).startswith("WB"): return "WineBanc"
-            return str(loc)
-        
-        df['Price(sgd)'] = df.apply(lambda r: r['raw_price'] * EXCHANGE_RATES.get(r['Currency'], 1.0), axis=1)
-        df['Vintage'] = df.apply(lambda x: f"{x['Vintage']} - {x['Disgorgement']}" if (x['Vintage'] == "NV" and pd.notnull(x['Disgorgement']) and x['Disgorgement']) else x['Vintage'], axis=1)
-        df['LocGroup'] = df['Location'].apply(get_loc_group)
-        df['Total(sgd)'] = df['Qty'] * df['Price(sgd)']
-        
-        # Singapore Value Calculation (Excl. Paris, Octavian, Chemaze, Beaune)
-        # Normalize check to simple substring or exact match? User said "Paris, Octavian, Chemaze, Beaune"
-        # We will assume case-insensitive substring match for safety? Or exact? 
-        # Existing code uses startswith. Let's use flexible string check.
-        excluded_keywords = ["Paris", "Chemaze", "Beaune", "Octavian"]
-        
-        def is_singapore(loc):
-            loc_s = str(loc)
-            for k in excluded_keywords:
-                if k in loc_s: return False
-            return True
-            
-        singapore_df = df[df['Location'].apply(is_singapore)]
-        singapore_val = singapore_df['Total(sgd)'].sum()
-
+    if total_qty:
         with st.container(border=True):
             c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
             
@@ -92,28 +80,39 @@ def view_cellar():
         # --- Detailed Inventory ---
         with st.container(border=True):
             f1, f2, f3, f4, f5 = st.columns(5)
-            sel_color = f1.multiselect("Color", sorted(df["Color"].unique()))
-            sel_region = f2.multiselect("Region", sorted(df["Region"].unique()))
-            sel_prod = f3.multiselect("Producer", sorted(df["Domaine"].unique()))
-            sel_loc_group = f4.multiselect("Location Group", sorted(df["LocGroup"].unique()))
-            sel_loc = f5.multiselect("Location", sorted(df["Location"].unique()))
-        
-        filtered_df = df.copy()
-        if sel_color: filtered_df = filtered_df[filtered_df["Color"].isin(sel_color)]
-        if sel_region: filtered_df = filtered_df[filtered_df["Region"].isin(sel_region)]
-        if sel_prod: filtered_df = filtered_df[filtered_df["Domaine"].isin(sel_prod)]
-        if sel_loc_group: filtered_df = filtered_df[filtered_df["LocGroup"].isin(sel_loc_group)]
-        if sel_loc: filtered_df = filtered_df[filtered_df["Location"].isin(sel_loc)]
-        
-        if not filtered_df.empty:
+            sel_color = f1.multiselect("Color", options["Color"])
+            sel_region = f2.multiselect("Region", options["Region"])
+            sel_prod = f3.multiselect("Producer", options["Producer"])
+            sel_loc_group = f4.multiselect("Location Group", options["Location Group"])
+            sel_loc = f5.multiselect("Location", options["Location"])
+
+        filters = {col: sel for col, sel in [("color", sel_color), ("region", sel_region), ("domaine", sel_prod), ("location", sel_loc)] if sel}
+        query = inventory_select(**filters)
+        if sel_loc_group: query = query.where(LOCATION_GROUP.in_(sel_loc_group))
+
+        with read_engine.connect() as conn:
+            total_rows = conn.execute(select(func.count()).select_from(query.subquery())).scalar()
+
+        if total_rows:
+            signature = (tuple(sel_color), tuple(sel_region), tuple(sel_prod), tuple(sel_loc_group), tuple(sel_loc))
+            cursor, page_size = pager_cursor("cellar_pager", signature)
+            page_df, next_cursor = fetch_page(query, SORT_KEYS, cursor, page_size)
+            render_pager("cellar_pager", total_rows, next_cursor)
+
+            # Derived columns for the visible page only
+            page_df['Price(sgd)'] = price_sgd(page_df['raw_price'], page_df['Currency'])
+            page_df['Vintage'] = vintage_label(page_df['Vintage'], page_df['Disgorgement'])
+            page_df['LocGroup'] = location_group(page_df['Location'])
+            page_df['Total(sgd)'] = page_df['Qty'] * page_df['Price(sgd)']
+
             tab_cards, tab_list = st.tabs(["Cards", "List"])
             
             with tab_list:
-                filtered_df = filtered_df.copy() # Avoid SettingWithCopy
-                filtered_df['Domaine_Link'] = filtered_df.apply(lambda x: f"/?page=Producer+Detail&id={x['pid']}&label={x['Domaine'].replace(' ', '+')}", axis=1)
-                filtered_df['Cuvee_Link'] = filtered_df.apply(lambda x: f"/?page=Wine+Detail&id={x['wid']}&label={x['Cuvee'].replace(' ', '+') if pd.notnull(x['Cuvee']) and x['Cuvee'].strip() else '-'}", axis=1)
-                filtered_df['Qty_Link'] = filtered_df.apply(lambda x: f"/?page=Bottle+Detail&id={x['bid']}&label={str(x['Qty'])}", axis=1)
-                filtered_df['Appellation_Link'] = filtered_df.apply(lambda x: f"/?page=Appellation+Detail&id={int(x['aid'])}&label={x['Appellation'].replace(' ', '+')}" if pd.notnull(x['aid']) else x['Appellation'], axis=1)
+                filtered_df = page_df.copy() # Avoid SettingWithCopy
+                filtered_df['Domaine_Link'] = link_column("Producer+Detail", filtered_df['pid'], url_label(filtered_df['Domaine']))
+                filtered_df['Cuvee_Link'] = link_column("Wine+Detail", filtered_df['wid'], cuvee_label(filtered_df['Cuvee']))
+                filtered_df['Qty_Link'] = link_column("Bottle+Detail", filtered_df['bid'], filtered_df['Qty'].astype(str))
+                filtered_df['Appellation_Link'] = link_column("Appellation+Detail", filtered_df['aid'], url_label(filtered_df['Appellation']), fallback=filtered_df['Appellation'])
                 
                 # Drop original columns being replaced by links
                 display_df = filtered_df.drop(columns=["Qty", "Appellation"], errors="ignore")
@@ -139,7 +138,7 @@ def view_cellar():
 
             with tab_cards:
                 from views.components import render_cellar_cards
-                render_cellar_cards(filtered_df)
+                render_cellar_cards(page_df)
         else:
             st.info("No wines match the selected filter.") 
     else:
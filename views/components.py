@@ -3,6 +3,7 @@ import glob
 import os
 import base64
 from shared import get_region_colors_map, TYPE_COLORS
+import profiler
 
 CURRENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -176,6 +177,7 @@ def render_tasting_cards(events, key_suffix=""):
 </div>
 </div>
 """
+        profiler.add_html("cards", card_html)
         st.markdown(card_html, unsafe_allow_html=True)
 
 
@@ -316,4 +318,5 @@ def render_cellar_cards(bottles_df):
 </div>
 </details>
 """
+        profiler.add_html("cards", full_html)
         st.markdown(full_html, unsafe_allow_html=True)
@@ -1,27 +1,67 @@
 import streamlit as st
-import pandas as pd
 from shared import (
     Producer, Wine, Bottle, Place, TastingNote, 
     Appellation, RestaurantVisit, Vineyard, get_region_name,
-    get_session
+    get_session, engine
 )
-from ui_utils import navigate_to, display_region_line
+from inventory import read_inventory
+from ui_utils import navigate_to, display_region_line, vintage_label, location_group, price_sgd
 from views.components import render_tasting_cards, render_cellar_cards
 from geo_utils import (
     resolve_app_geometry, 
     resolve_vine_geometry,
+    resolve_for_map,
     get_geometry_bounds,
     create_place_map,
     create_appellation_map,
     create_vineyard_map,
-    create_wine_combined_map
+    create_wine_combined_map,
+    render_map
 )
 from shapely.geometry import mapping as shape_mapping
+from sqlalchemy.orm import joinedload
+
+# --- QUERY PLANS ---
+# Eager loads for the relationships each page walks, so a page runs a fixed number of
+# SELECTs instead of one lazy load per tasting note, bottle or wine (N+1).
+# Everything here is many-to-one, so joinedload folds it into the main SELECT.
+_WINE_CARD = (joinedload(Wine.producer), joinedload(Wine.appellation), joinedload(Wine.region_obj))
+
+QUERY_PLANS = {
+    # Tasting cards: t.place, t.bottle.wine and the wine's producer/appellation/region
+    "tasting_cards": (
+        joinedload(TastingNote.place),
+        joinedload(TastingNote.bottle).joinedload(Bottle.wine).options(*_WINE_CARD),
+    ),
+    "producer": (joinedload(Producer.region_obj),),
+    "wine": _WINE_CARD + (
+        joinedload(Wine.varietal),
+        joinedload(Wine.vineyard),
+        joinedload(Wine.appellation).joinedload(Appellation.region_obj),
+    ),
+    "bottle": (joinedload(Bottle.wine).options(*_WINE_CARD),),
+    "appellation": (joinedload(Appellation.region_obj),),
+    "vineyard": (joinedload(Vineyard.region_obj),),
+    "tasting": (joinedload(TastingNote.place), joinedload(TastingNote.bottle)),
+}
+
+def _inventory_cards_df(with_disgorgement=False, **filters):
+    """Rows for the Cellar tabs (render_cellar_cards) from the denormalized inventory."""
+    df = read_inventory(engine, **filters)
+    if df.empty:
+        return df
+    
+    df["Appellation"] = df["Appellation"].fillna("")
+    if with_disgorgement:
+        df["Vintage"] = vintage_label(df["Vintage"], df["Disgorgement"])
+    df["LocGroup"] = location_group(df["Location"])
+    df["Total(sgd)"] = df["Qty"] * price_sgd(df["raw_price"].fillna(0), df["Currency"])
+    return df
 
 def view_producer_detail(pid):
     #if st.button("Back"): navigate_to("Producers")
     session = get_session()
-    p = session.get(Producer, pid)
+    p = session.get(Producer, pid, options=QUERY_PLANS["producer"])
     if p:           
         with st.container(border=True):
             m1,m2 = st.columns(2)
@@ -75,42 +115,15 @@ def view_producer_detail(pid):
         tab_cellar, tab_history = st.tabs(["Cellar", "History"])
         
         with tab_cellar:
-            active_bottles = session.query(Bottle).join(Wine).filter(Wine.producer_id == pid, Bottle.qty > 0).all()
-            if active_bottles:
-                # Prepare data for Cellar Cards
-                data = []
-                from shared import EXCHANGE_RATES
-                
-                def get_loc_group(loc):
-                    if str(loc).startswith("H"): return "Home"
-                    if str(loc).startswith("WB"): return "WineBanc"
-                    return str(loc)
-                    
-                for b in active_bottles:
-                    w = b.wine
-                    price_sgd = (b.price or 0) * EXCHANGE_RATES.get(b.currency, 1.0)
-                    data.append({
-                        "Qty": b.qty,
-                        "Color": w.type,
-                        "Region": get_region_name(w),
-                        "Domaine": w.producer.name,
-                        "Cuvee": w.cuvee,
-                        "Appellation": w.appellation.name if w.appellation else "",
-                        "Vintage": w.vintage,
-                        "wid": w.id,
-                        "bid": b.id,
-                        "Location": b.location,
-                        "LocGroup": get_loc_group(b.location),
-                        "Total(sgd)": b.qty * price_sgd
-                    })
-                
-                inv_df = pd.DataFrame(data)
+            inv_df = _inventory_cards_df(producer_id=pid)
+            if not inv_df.empty:
                 render_cellar_cards(inv_df)
             else:
                 st.info("No bottles from this producer currently in stock.")
 
         with tab_history:
-            all_tastings = session.query(TastingNote).join(Bottle).join(Wine).filter(Wine.producer_id == pid).order_by(TastingNote.date.desc()).all()
+            all_tastings = session.query(TastingNote).join(Bottle).join(Wine).filter(Wine.producer_id == pid)\
+                .options(*QUERY_PLANS["tasting_cards"]).order_by(TastingNote.date.desc()).all()
             
             if all_tastings:
                 # Group by Date + Place for Card Format
@@ -176,7 +189,7 @@ def view_producer_detail(pid):
     session.close()
 
 def render_wine_content(session, wid):
-    w = session.query(Wine).join(Producer).filter(Wine.id==wid).first()
+    w = session.query(Wine).join(Producer).filter(Wine.id==wid).options(*QUERY_PLANS["wine"]).first()
     if w:
         m1,m2 = st.columns(2)
         with m1:
@@ -205,20 +218,19 @@ def render_wine_content(session, wid):
             if w.blend: st.write(f"**Blend:** {w.blend}")
         with m2:
             # Map Rendering Logic
-            from streamlit_folium import st_folium
 
             # Resolve geometries
             app_geo = None
             vine_geo = None
             
             if w.appellation:
-                geom = resolve_app_geometry(w.appellation)
+                geom = resolve_for_map(resolve_app_geometry, w.appellation)
                 if geom:
                     app_geo = shape_mapping(geom) if not isinstance(geom, dict) else geom
 
             if w.vineyard:
-                geom = resolve_vine_geometry(vineyard=w.vineyard, region_name=get_region_name(w), 
-                                            appellation_name=w.appellation.name if w.appellation else None)
+                geom = resolve_for_map(resolve_vine_geometry, w.vineyard, region_name=get_region_name(w), 
+                                       appellation_name=w.appellation.name if w.appellation else None)
                 if geom:
                     vine_geo = shape_mapping(geom) if not isinstance(geom, dict) else geom
             
@@ -228,7 +240,7 @@ def render_wine_content(session, wid):
             if m:
                 if label_str:
                     st.caption(label_str)
-                st_folium(m, height=400, width="100%", returned_objects=[])
+                render_map(m, height=400, width="100%", returned_objects=[])
             elif app_geo or vine_geo:
                 st.error("Unified Map Error")
 
@@ -302,41 +314,16 @@ def render_wine_content(session, wid):
         
         # 1. CELLAR (Current Vintage)
         with tab_cellar:
-            active_bottles = [b for b in w.inventory if b.qty > 0]
-            if active_bottles:
-                inv_data = []
-                from shared import EXCHANGE_RATES
-                
-                def get_loc_group(loc):
-                    if str(loc).startswith("H"): return "Home"
-                    if str(loc).startswith("WB"): return "WineBanc"
-                    return str(loc)
-                
-                for b in active_bottles:
-                    price_sgd = (b.price or 0) * EXCHANGE_RATES.get(b.currency, 1.0)
-                    inv_data.append({
-                        "Qty": b.qty,
-                        "Color": w.type,
-                        "Region": get_region_name(w),
-                        "Domaine": w.producer.name,
-                        "Cuvee": w.cuvee,
-                        "Appellation": w.appellation.name if w.appellation else "",
-                        "Vintage": w.vintage,
-                        "wid": w.id,
-                        "bid": b.id,
-                        "Location": b.location,
-                        "LocGroup": get_loc_group(b.location),
-                        "Total(sgd)": b.qty * price_sgd
-                    })
-                
-                inv_df = pd.DataFrame(inv_data)
+            inv_df = _inventory_cards_df(wine_id=w.id)
+            if not inv_df.empty:
                 render_cellar_cards(inv_df)
             else:
                 st.info("No bottles of this vintage currently in stock.")
 
         # 2. HISTORY (Current Vintage)
         with tab_history:
-            all_tastings = session.query(TastingNote).join(Bottle).filter(Bottle.wine_id == wid).order_by(TastingNote.date.desc()).all()
+            all_tastings = session.query(TastingNote).join(Bottle).filter(Bottle.wine_id == wid)\
+                .options(*QUERY_PLANS["tasting_cards"]).order_by(TastingNote.date.desc()).all()
             
             if all_tastings:
                 # Group by Date + Place
@@ -399,42 +386,16 @@ def render_wine_content(session, wid):
 
         # 3. CELLAR (All Vintages)
         with tab_cellar_all:
-            active_bottles_all = session.query(Bottle).filter(Bottle.wine_id.in_(all_ids), Bottle.qty > 0).all()
-            if active_bottles_all:
-                inv_data = []
-                from shared import EXCHANGE_RATES
-                
-                def get_loc_group(loc):
-                    if str(loc).startswith("H"): return "Home"
-                    if str(loc).startswith("WB"): return "WineBanc"
-                    return str(loc)
-                
-                for b in active_bottles_all:
-                    w_sub = b.wine # Need to get the wine object for each bottle since IDs differ
-                    price_sgd = (b.price or 0) * EXCHANGE_RATES.get(b.currency, 1.0)
-                    inv_data.append({
-                        "Qty": b.qty,
-                        "Color": w_sub.type,
-                        "Region": get_region_name(w_sub),
-                        "Domaine": w_sub.producer.name,
-                        "Cuvee": w_sub.cuvee,
-                        "Appellation": w_sub.appellation.name if w_sub.appellation else "",
-                        "Vintage": f"{w_sub.vintage} - {w_sub.disgorgement_date}" if (w_sub.vintage == "NV" and w_sub.disgorgement_date) else w_sub.vintage,
-                        "wid": w_sub.id,
-                        "bid": b.id,
-                        "Location": b.location,
-                        "LocGroup": get_loc_group(b.location),
-                        "Total(sgd)": b.qty * price_sgd
-                    })
-                
-                inv_df = pd.DataFrame(inv_data)
+            inv_df = _inventory_cards_df(with_disgorgement=True, wine_id=list(all_ids))
+            if not inv_df.empty:
                 render_cellar_cards(inv_df)
             else:
                 st.info("No bottles of any vintage in stock.")
 
         # 4. HISTORY (All Vintages)
         with tab_history_all:
-            all_tastings_all = session.query(TastingNote).join(Bottle).filter(Bottle.wine_id.in_(all_ids)).order_by(TastingNote.date.desc()).all()
+            all_tastings_all = session.query(TastingNote).join(Bottle).filter(Bottle.wine_id.in_(all_ids))\
+                .options(*QUERY_PLANS["tasting_cards"]).order_by(TastingNote.date.desc()).all()
             
             if all_tastings_all:
                 # Group by Date + Place
@@ -504,7 +465,7 @@ def view_wine_detail(wid):
 def view_bottle_detail(bid):
     #if st.button("Back"): navigate_to("Cellar")
     session = get_session()
-    b = session.query(Bottle).join(Wine).join(Producer).filter(Bottle.id==bid).first()
+    b = session.query(Bottle).join(Wine).join(Producer).filter(Bottle.id==bid).options(*QUERY_PLANS["bottle"]).first()
     if b:
         with st.container(border=True):
             m1, m2 = st.columns(2)
@@ -533,7 +494,7 @@ def view_place_detail(plid):
             if st.button("Edit Place"): navigate_to("Edit Place", {"id": plid})
         
         # Calculate Stats
-        notes = session.query(TastingNote).filter_by(place_id=plid).all()
+        notes = session.query(TastingNote).filter_by(place_id=plid).options(*QUERY_PLANS["tasting_cards"]).all()
         visits = session.query(RestaurantVisit).filter_by(place_id=plid).all()
         
         nb_tastings = len(notes)
@@ -582,12 +543,11 @@ def view_place_detail(plid):
         
         # MAP DISPLAY
         if p.lat and p.lng:
-            from streamlit_folium import st_folium
             from geo_utils import create_place_map
             
             m = create_place_map(p)
             if m:
-                st_folium(m, height=300, width="100%", returned_objects=[])
+                render_map(m, height=300, width="100%", returned_objects=[])
             else:
                 st.error("Error loading map")
         
@@ -679,7 +639,7 @@ def view_appellation_detail(aid):
     except (ValueError, TypeError):
         aid = 0
 
-    a = session.get(Appellation, aid)
+    a = session.get(Appellation, aid, options=QUERY_PLANS["appellation"])
     
     if a:
         st.title(a.name)
@@ -721,18 +681,17 @@ def view_appellation_detail(aid):
             # Small map if geojson exists or INAO data
             
             # Resolve Geometry
-            geom = resolve_app_geometry(a)
+            geom = resolve_for_map(resolve_app_geometry, a)
             geo_data = shape_mapping(geom) if geom and not isinstance(geom, dict) else geom
 
             if geo_data:
-                from streamlit_folium import st_folium
                 from geo_utils import create_appellation_map
                 
                 color = a.region_obj.color if a.region_obj and a.region_obj.color else "#c27ba0"
-                m = create_appellation_map(a, geo_data, color)
+                m = create_appellation_map(a, geo_data, color, bounds=a.bounds)
                 
                 if m:
-                    st_folium(m, height=250, width="100%", returned_objects=[])
+                    render_map(m, height=250, width="100%", returned_objects=[])
                 else:
                     st.error("Map Error")
 
@@ -756,6 +715,7 @@ def view_appellation_detail(aid):
                 .join(Bottle)\
                 .join(Wine)\
                 .filter(Wine.appellation_id == aid)\
+                .options(*QUERY_PLANS["tasting_cards"])\
                 .order_by(TastingNote.date.desc())\
                 .all()
                 
@@ -819,38 +779,8 @@ def view_appellation_detail(aid):
 
         with tab2:
             # Inventory for this appellation
-            bottles = session.query(Bottle)\
-                .join(Wine)\
-                .filter(Wine.appellation_id == aid, Bottle.qty > 0)\
-                .all()
-                
-            if bottles:
-                data = []
-                from shared import EXCHANGE_RATES
-                def get_loc_group(loc):
-                    if str(loc).startswith("H"): return "Home"
-                    if str(loc).startswith("WB"): return "WineBanc"
-                    return str(loc)
-
-                for b in bottles:
-                    w = b.wine
-                    price_sgd = (b.price or 0) * EXCHANGE_RATES.get(b.currency, 1.0)
-                    data.append({
-                        "Qty": b.qty,
-                        "Color": w.type,
-                        "Region": get_region_name(w),
-                        "Domaine": w.producer.name,
-                        "Cuvee": w.cuvee,
-                        "Appellation": w.appellation.name if w.appellation else "",
-                        "Vintage": w.vintage,
-                        "wid": w.id,
-                        "bid": b.id,
-                        "Location": b.location,
-                        "LocGroup": get_loc_group(b.location),
-                        "Total(sgd)": b.qty * price_sgd
-                    })
-                
-                inv_df = pd.DataFrame(data)
+            inv_df = _inventory_cards_df(appellation_id=aid)
+            if not inv_df.empty:
                 render_cellar_cards(inv_df)
             else:
                 st.info("No bottles in cellar from this appellation.")
@@ -859,7 +789,7 @@ def view_appellation_detail(aid):
 
 def view_tasting_detail(tid):
     session = get_session()
-    n = session.get(TastingNote, tid)
+    n = session.get(TastingNote, tid, options=QUERY_PLANS["tasting"])
     if n:
         # TASTING DETAILS
         with st.container(border=True):
@@ -919,7 +849,7 @@ def view_vineyard_detail(vid):
     except (ValueError, TypeError):
         vid = 0
 
-    v = session.get(Vineyard, vid)
+    v = session.get(Vineyard, vid, options=QUERY_PLANS["vineyard"])
     
     if v:
         st.title(v.name)
@@ -933,14 +863,13 @@ def view_vineyard_detail(vid):
             
         with m2:
             # Map Rendering
-            from streamlit_folium import st_folium
             import json
 
             geo_data = None
             if v.vineyard_id:
-                sample_wine = session.query(Wine).filter(Wine.vineyard_id == vid).first()
+                sample_wine = session.query(Wine).filter(Wine.vineyard_id == vid).options(joinedload(Wine.appellation)).first()
                 app_name = sample_wine.appellation.name if sample_wine and sample_wine.appellation else None
-                geom = resolve_vine_geometry(v, get_region_name(v), app_name)
+                geom = resolve_for_map(resolve_vine_geometry, v, region_name=get_region_name(v), appellation_name=app_name)
                 geo_data = shape_mapping(geom) if geom and not isinstance(geom, dict) else geom
             
             if not geo_data and v.geojson:
@@ -948,9 +877,9 @@ def view_vineyard_detail(vid):
                 except: pass
 
             if geo_data:
-                m = create_vineyard_map(v, geo_data)
+                m = create_vineyard_map(v, geo_data, bounds=v.bounds)
                 if m:
-                    st_folium(m, height=300, width="100%", key=f"v_map_{vid}", returned_objects=[])
+                    render_map(m, height=300, width="100%", key=f"v_map_{vid}", returned_objects=[])
                 else:
                     st.error("Map Error")
             else:
@@ -962,32 +891,15 @@ def view_vineyard_detail(vid):
         tab_cellar, tab_history = st.tabs(["Cellar", "History"])
         
         with tab_cellar:
-            active_bottles = session.query(Bottle).join(Wine).filter(Wine.vineyard_id == vid, Bottle.qty > 0).all()
-            if active_bottles:
-                inv_data = []
-                from shared import EXCHANGE_RATES
-                for b in active_bottles:
-                    w = b.wine
-                    price_sgd = (b.price or 0) * EXCHANGE_RATES.get(b.currency, 1.0)
-                    inv_data.append({
-                        "Qty": b.qty,
-                        "Color": w.type,
-                        "Region": get_region_name(w),
-                        "Domaine": w.producer.name,
-                        "Cuvee": w.cuvee,
-                        "Appellation": w.appellation.name if w.appellation else "",
-                        "Vintage": w.vintage,
-                        "wid": w.id,
-                        "bid": b.id,
-                        "Location": b.location,
-                        "Total(sgd)": b.qty * price_sgd
-                    })
-                render_cellar_cards(pd.DataFrame(inv_data))
+            inv_df = _inventory_cards_df(vineyard_id=vid)
+            if not inv_df.empty:
+                render_cellar_cards(inv_df)
             else:
                 st.info("No bottles from this vineyard currently in cellar.")
 
         with tab_history:
-            all_tastings = session.query(TastingNote).join(Bottle).join(Wine).filter(Wine.vineyard_id == vid).order_by(TastingNote.date.desc()).all()
+            all_tastings = session.query(TastingNote).join(Bottle).join(Wine).filter(Wine.vineyard_id == vid)\
+                .options(*QUERY_PLANS["tasting_cards"]).order_by(TastingNote.date.desc()).all()
             if all_tastings:
                 grouped = {}
                 for t in all_tastings:
@@ -1,34 +1,23 @@
 import streamlit as st
 import pandas as pd
-from shared import get_session, get_region_name
-from ui_utils import apply_colors, render_table, navigate_to
-from sqlalchemy.orm import joinedload
-from shared import Producer, Place, Region
+from shared import cached_query
+from ui_utils import apply_colors, render_table, navigate_to, link_column, url_label
+from sqlalchemy import select, union, func
+from shared import Producer, Place, Region, TastingNote, RestaurantVisit
 
 def view_producers():
     st.markdown('# :material/domain: Producers', unsafe_allow_html=True)
     if st.button("Add New Producer"): navigate_to("Add Producer")
-    session = get_session()
-    prods = session.query(Producer)\
-        .outerjoin(Producer.region_obj)\
-        .order_by(Region.name, Producer.subregion, Producer.village, Producer.name)\
-        .options(joinedload(Producer.region_obj))\
-        .all()
-    
-    data = []
-    for p in prods:
-        r_name = get_region_name(p)
-        data.append({
-            "Name": p.name, 
-            "Region": r_name, 
-            "Subregion": p.subregion,
-            "Village": p.village,
-            "Winemaker": p.winemaker, 
-            "Lists": p.lists,
-            "Notes": p.notes,
-            "id": p.id
-        })
-    df = pd.DataFrame(data)
+    # Served from the query cache until a commit touches producers or regions
+    df = cached_query(
+        select(
+            Producer.name.label("Name"), Region.name.label("Region"), Producer.subregion.label("Subregion"),
+            Producer.village.label("Village"), Producer.winemaker.label("Winemaker"), Producer.lists.label("Lists"),
+            Producer.notes.label("Notes"), Producer.id.label("id"),
+        )
+        .outerjoin(Region, Producer.region_id == Region.id)
+        .order_by(Region.name, Producer.subregion, Producer.village, Producer.name)
+    )
     if "Lists" in df.columns:
         # Strip brackets AND quotes for clean display
         df["Lists"] = df["Lists"].str.strip("[]").str.replace("'", "").str.replace('"', "").str.strip()
@@ -73,7 +62,7 @@ def view_producers():
         if search_name: filtered_df = filtered_df[filtered_df["Name"].str.contains(search_name, case=False, na=False)]
         
         if not filtered_df.empty:
-            filtered_df['Name_Link'] = filtered_df.apply(lambda x: f"/?page=Producer+Detail&id={x['id']}&label={x['Name'].replace(' ', '+')}", axis=1)
+            filtered_df['Name_Link'] = link_column("Producer+Detail", filtered_df['id'], url_label(filtered_df['Name']))
             
             cols_to_show = ["Name_Link", "Region", "Subregion", "Village", "Winemaker", "Lists", "Notes"]
             styler = apply_colors(filtered_df[cols_to_show])
@@ -85,38 +74,34 @@ def view_producers():
             )
         else:
             st.info("No producers match the selected filters.")
-    session.close()
 
 
 
 def view_places():
     st.markdown('# :material/restaurant: Places', unsafe_allow_html=True)
     if st.button("Add Restaurant Visit"): navigate_to("Add Restaurant Visit")
-    session = get_session()
-    # Eager load tastings and visits to calculate unique dates
-    places = session.query(Place).options(joinedload(Place.tastings), joinedload(Place.visits)).order_by(Place.name).all()
-    
-    data = []
-    for p in places:
-        # Calculate unique dates visited
-        tasting_dates = set(t.date for t in p.tastings if t.date)
-        visit_dates = set(v.date for v in p.visits if v.date)
-        all_dates = tasting_dates.union(visit_dates)
-        
-        data.append({
-            "Name": p.name, 
-            "City": p.city, 
-            "Country": p.country, 
-            "Type": p.type, 
-            "Michelin Stars": p.michelin_stars if p.michelin_stars else 0,
-            "Visits": len(all_dates),
-            "Last Visit": max(all_dates) if all_dates else None,
-            "id": p.id
-        })
-        
-    df = pd.DataFrame(data)
+    # Unique (place, date) pairs from tastings and visits give the number of days visited
+    dates = union(
+        select(TastingNote.place_id, TastingNote.date).where(TastingNote.date.isnot(None)),
+        select(RestaurantVisit.place_id, RestaurantVisit.date).where(RestaurantVisit.date.isnot(None)),
+    ).subquery()
+    visits = (
+        select(dates.c.place_id, func.count().label("visits"), func.max(dates.c.date).label("last_visit"))
+        .group_by(dates.c.place_id)
+        .subquery()
+    )
+    df = cached_query(
+        select(
+            Place.name.label("Name"), Place.city.label("City"), Place.country.label("Country"), Place.type.label("Type"),
+            func.coalesce(Place.michelin_stars, 0).label("Michelin Stars"),
+            func.coalesce(visits.c.visits, 0).label("Visits"),
+            visits.c.last_visit.label("Last Visit"),
+            Place.id.label("id"),
+        )
+        .outerjoin(visits, visits.c.place_id == Place.id)
+        .order_by(Place.name)
+    )
     df = df.sort_values("Last Visit", ascending=False, na_position="last").reset_index(drop=True)
-    session.close()
 
     if not df.empty:
         # --- FILTERS ---
@@ -135,7 +120,7 @@ def view_places():
         if search_name: filtered_df = filtered_df[filtered_df["Name"].str.contains(search_name, case=False, na=False)]
 
         if not filtered_df.empty:
-            filtered_df['Name_Link'] = filtered_df.apply(lambda x: f"/?page=Place+Detail&id={x['id']}&label={x['Name'].replace(' ', '+')}", axis=1)
+            filtered_df['Name_Link'] = link_column("Place+Detail", filtered_df['id'], url_label(filtered_df['Name']))
             
             # Drop original Name before renaming link to avoid duplicate column names
             display_df = filtered_df.drop(columns=["Name"], errors="ignore").rename(columns={"Name_Link": "Name"})
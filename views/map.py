@@ -1,21 +1,32 @@
 
 import streamlit as st
 import folium
-from streamlit_folium import st_folium
 from shapely.geometry import mapping as shape_mapping
-from sqlalchemy import or_
+from sqlalchemy import or_, func
 
 from shared import get_session, get_all_regions, get_region_name
 from shared import Appellation, Vineyard
 from geo_utils import (
-    resolve_app_geometry, 
-    resolve_vine_geometry,
+    resolve_app_geometries,
+    resolve_vine_geometries,
+    resolve_many_for_map,
     get_geometry_bounds,
-    add_tile_layers
+    get_spatial_index,
+    zoom_for_bounds,
+    simplify_tolerance,
+    start_tile_server,
+    add_vector_tile_layers,
+    add_tile_layers,
+    render_map,
+    VINEYARD_MIN_ZOOM
 )
 
 # Redundant cached functions removed (moved to geo_utils.py)
 
+# Viewport mode limits: vineyards are only drawn once zoomed in, and the number of
+# polygons sent to the browser is capped (largest first) to keep the payload small.
+VIEWPORT_MAX_FEATURES = 500
+
 def view_map():
     st.markdown("# :material/map: Appellations Map", unsafe_allow_html=True)
     
@@ -57,21 +68,28 @@ def view_map():
         with col1:
             selected_region_name = st.selectbox("Region", sorted_region_names, index=default_idx)
             selected_region = region_map[selected_region_name]
+            viewport_mode = st.toggle("Explore visible area", help="Show every appellation and vineyard in the current map view")
+
+        if viewport_mode:
+            _render_viewport_map(session, selected_region)
+            return
 
         # Filter content based on Region Object
-        region_apps = session.query(Appellation).filter(
+        # Only the columns needed for the multiselect options; full rows are fetched for the selection.
+        app_filter = (
             Appellation.region_id == selected_region.id,
             or_(Appellation.geojson.isnot(None), Appellation.inao_id.isnot(None), Appellation.pdo_id.isnot(None))
-        ).all()
+        )
+        region_app_names = session.query(Appellation.name).filter(*app_filter).all()
         
-        region_vineyards = session.query(Vineyard).filter(
+        region_vineyards = session.query(Vineyard.id, Vineyard.sub_region, Vineyard.village, Vineyard.name).filter(
             Vineyard.region_id == selected_region.id,
             or_(Vineyard.geojson.isnot(None), Vineyard.vineyard_id.isnot(None))
         ).all()
         
         # Filter 2: Appellations (Multiselect)
         # Options: Name -> ID map to handle duplicate names if any (though unlikely within region)
-        app_options = sorted(list(set([a.name for a in region_apps])))
+        app_options = sorted(list(set([r.name for r in region_app_names])))
         with col2:
             selected_app_names = st.multiselect("Appellations", app_options)
             
@@ -80,7 +98,7 @@ def view_map():
             parts = [x for x in [v.sub_region, v.village, v.name] if x]
             return " - ".join(parts)
             
-        v_map = {format_v(v): v for v in region_vineyards}
+        v_map = {format_v(v): v.id for v in region_vineyards}
         vineyard_options = sorted(list(v_map.keys()))
         
         with col3:
@@ -95,17 +113,19 @@ def view_map():
         # Appellations to Render
         apps_to_render = []
         if selected_app_names:
-            apps_to_render = [a for a in region_apps if a.name in selected_app_names]
+            apps_to_render = session.query(Appellation).filter(*app_filter, Appellation.name.in_(selected_app_names)).all()
         
         # Vineyards to Render
         vines_to_render = []
         if selected_vineyard_labels:
-            vines_to_render = [v_map[label] for label in selected_vineyard_labels]
+            selected_vids = [v_map[label] for label in selected_vineyard_labels]
+            vines_by_id = {v.id: v for v in session.query(Vineyard).filter(Vineyard.id.in_(selected_vids))}
+            vines_to_render = [vines_by_id[vid] for vid in selected_vids if vid in vines_by_id]
             
-        # Local get_app_geometry removed (using resolve_app_geometry from geo_utils)
+        # Local get_app_geometry removed (using resolve_app_geometries from geo_utils)
 
         # Helper to add feature
-        def add_feature(geo, name, fid, ftype):
+        def add_feature(geo, name, fid, ftype, bounds=None):
             try:
                  if geo['type'] == 'Point':
                     coords = geo['coordinates'] # [lon, lat]
@@ -115,7 +135,8 @@ def view_map():
                         "location": [lat, lon],
                         "name": name,
                         "id": fid,
-                        "ftype": ftype
+                        "ftype": ftype,
+                        "bounds": bounds
                     })
                  elif geo['type'] in ['Polygon', 'MultiPolygon']:
                      # Wrap geometry in a Feature to support properties
@@ -133,7 +154,8 @@ def view_map():
                          "geo": feature,
                          "name": name,
                          "id": fid,
-                         "ftype": ftype
+                         "ftype": ftype,
+                         "bounds": bounds
                      })
                  elif geo['type'] == 'FeatureCollection':
                      map_features.append({
@@ -141,24 +163,27 @@ def view_map():
                          "geo": geo,
                          "name": name,
                          "id": fid,
-                         "ftype": ftype
+                         "ftype": ftype,
+                         "bounds": bounds
                      })
             except Exception as e:
                 pass
 
-        # A. Process Appellations
+        # A. Process Appellations (one pass per geometry source)
+        app_geoms = resolve_many_for_map(resolve_app_geometries, apps_to_render)
         for app in apps_to_render:
-            geom = resolve_app_geometry(app)
+            geom = app_geoms.get(app.id)
             if geom:
                 geo = shape_mapping(geom) if not isinstance(geom, dict) else geom
-                add_feature(geo, app.name, app.id, "Appellation")
+                add_feature(geo, app.name, app.id, "Appellation", app.bounds)
 
-        # B. Process Vineyards
+        # B. Process Vineyards (one pass per region)
+        vine_geoms = resolve_many_for_map(resolve_vine_geometries, vines_to_render)
         for v in vines_to_render:
-            geom = resolve_vine_geometry(v)
+            geom = vine_geoms.get(v.id)
             if geom:
                 geo = shape_mapping(geom) if not isinstance(geom, dict) else geom
-                add_feature(geo, v.name, v.id, "Vineyard")
+                add_feature(geo, v.name, v.id, "Vineyard", v.bounds)
 
         # --- 5. Render Map ---
         
@@ -169,9 +194,11 @@ def view_map():
         # If we have selection, center on the first item
         if map_features:
             first = map_features[0]
-            # geo_utils.get_geometry_bounds returns bounds for fit_bounds
-            geo = first.get('geo') or {"type": "Point", "coordinates": [first['location'][1], first['location'][0]]}
-            bounds = get_geometry_bounds(geo)
+            # Precomputed extent columns, else geo_utils.get_geometry_bounds (both in fit_bounds format)
+            bounds = first.get('bounds')
+            if not bounds:
+                geo = first.get('geo') or {"type": "Point", "coordinates": [first['location'][1], first['location'][0]]}
+                bounds = get_geometry_bounds(geo)
             if bounds:
                 # Calculate center from bounds
                 min_lat, min_lng = bounds[0]
@@ -244,7 +271,7 @@ def view_map():
         if not map_features:
             st.info("Select Appellations or Vineyards to view them on the map.")
 
-        st_folium(m, width="100%", height=1000, returned_objects=[])
+        render_map(m, width="100%", height=1000, returned_objects=[])
 
         # --- 6. Detailed Information ---
         if apps_to_render or vines_to_render:
@@ -307,3 +334,172 @@ def view_map():
                         st.markdown(f"[:material/open_in_new: Open Details](/?page=Vineyard+Detail&id={v.id})")
     finally:
         session.close()
+
+
+def _region_viewport(session, index, region):
+    """Initial viewport for a region: the extent of its appellations and vineyards."""
+    # Precomputed extent columns first, then the geometries in the index
+    all_bounds = []
+    for model in (Appellation, Vineyard):
+        row = session.query(
+            func.min(model.min_lng), func.min(model.min_lat), func.max(model.max_lng), func.max(model.max_lat)
+        ).filter(model.region_id == region.id).one()
+        if None not in row:
+            all_bounds.append(tuple(row))
+    
+    if not all_bounds:
+        app_ids = [r[0] for r in session.query(Appellation.id).filter(Appellation.region_id == region.id)]
+        vine_ids = [r[0] for r in session.query(Vineyard.id).filter(Vineyard.region_id == region.id)]
+        geoms = [index.geometry("Appellation", i) for i in app_ids] + [index.geometry("Vineyard", i) for i in vine_ids]
+        all_bounds = [g.bounds for g in geoms if g is not None]
+    
+    if all_bounds:
+        bbox = (
+            min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+            max(b[2] for b in all_bounds), max(b[3] for b in all_bounds)
+        )
+    else:
+        bbox = (-1.0, 42.0, 9.0, 50.0) # France Default
+    
+    min_lng, min_lat, max_lng, max_lat = bbox
+    center = [(min_lat + max_lat) / 2, (min_lng + max_lng) / 2]
+    zoom = zoom_for_bounds([[min_lat, min_lng], [max_lat, max_lng]])
+    return {
+        "region_id": region.id,
+        "bbox": bbox,
+        "zoom": zoom,
+        "center": center,
+        # The base map is built from the origin so panning doesn't re-mount the component
+        "origin_center": center,
+        "origin_zoom": zoom
+    }
+
+def _parse_viewport(map_state):
+    """Extracts (bbox, zoom, center) from st_folium's returned bounds/zoom/center, or None."""
+    if not map_state:
+        return None
+    bounds = map_state.get("bounds") or {}
+    sw = bounds.get("_southWest") or {}
+    ne = bounds.get("_northEast") or {}
+    zoom = map_state.get("zoom")
+    coords = [sw.get("lng"), sw.get("lat"), ne.get("lng"), ne.get("lat")]
+    if zoom is None or any(c is None for c in coords):
+        return None
+    bbox = tuple(round(c, 4) for c in coords)
+    center = map_state.get("center") or {}
+    if center.get("lat") is not None and center.get("lng") is not None:
+        center = [center["lat"], center["lng"]]
+    else:
+        center = [(bbox[1] + bbox[3]) / 2, (bbox[0] + bbox[2]) / 2]
+    return bbox, int(zoom), center
+
+def _render_viewport_map(session, selected_region):
+    """
+    Map mode driven by the visible area: st_folium reports bounds and zoom, and only the
+    polygons intersecting that bbox are looked up in the spatial index, simplified for
+    the zoom level and sent to the browser. When the vector tile endpoint is enabled, the
+    tiles draw the polygons instead.
+    """
+    index = get_spatial_index()
+    viewport = st.session_state.get("map_viewport")
+    if not viewport or viewport.get("region_id") != selected_region.id:
+        viewport = _region_viewport(session, index, selected_region)
+        st.session_state["map_viewport"] = viewport
+
+    region_color = selected_region.color if selected_region.color else "#c27ba0"
+    
+    # With the vector tile endpoint, every polygon is drawn by one tile layer and the
+    # browser fetches only the visible tiles: no GeoJSON is sent
+    if start_tile_server():
+        m = folium.Map(location=viewport["origin_center"], zoom_start=viewport["origin_zoom"])
+        add_vector_tile_layers(m, color=region_color)
+        add_tile_layers(m)
+        st.caption(f"All appellations • vineyards from zoom {VINEYARD_MIN_ZOOM}")
+        render_map(m, key=f"tile_map_{selected_region.id}", width="100%", height=1000, returned_objects=[])
+        return
+
+    min_lng, min_lat, max_lng, max_lat = viewport["bbox"]
+    zoom = viewport["zoom"]
+    
+    # 1. Which polygons are visible?
+    kinds = ["Appellation"]
+    if zoom >= VINEYARD_MIN_ZOOM:
+        kinds.append("Vineyard")
+    hits = [k for k in index.query_bbox(min_lng, min_lat, max_lng, max_lat) if k[0] in kinds]
+    truncated = len(hits) > VIEWPORT_MAX_FEATURES
+    if truncated:
+        hits.sort(key=lambda k: index.geometry(*k).area, reverse=True)
+        hits = hits[:VIEWPORT_MAX_FEATURES]
+    
+    # 2. Names for the visible ids only
+    app_ids = [i for kind, i in hits if kind == "Appellation"]
+    vine_ids = [i for kind, i in hits if kind == "Vineyard"]
+    names = {"Appellation": {}, "Vineyard": {}}
+    if app_ids:
+        names["Appellation"] = dict(session.query(Appellation.id, Appellation.name).filter(Appellation.id.in_(app_ids)).all())
+    if vine_ids:
+        names["Vineyard"] = dict(session.query(Vineyard.id, Vineyard.name).filter(Vineyard.id.in_(vine_ids)).all())
+    
+    # 3. Simplified features, one GeoJson layer per type
+    tolerance = simplify_tolerance(zoom)
+    fg = folium.FeatureGroup(name="Visible Area")
+    for ftype, id_names in names.items():
+        features = []
+        for obj_id, name in id_names.items():
+            geom = index.geometry(ftype, obj_id).simplify(tolerance, preserve_topology=True)
+            if geom.is_empty:
+                continue
+            features.append({
+                "type": "Feature",
+                "geometry": shape_mapping(geom),
+                "properties": {
+                    "name": name,
+                    "ftype": ftype,
+                    "link": f"<a href='/?page={ftype}+Detail&id={obj_id}' target='_top'>Open Details</a>"
+                }
+            })
+        if not features:
+            continue
+        color = region_color if ftype == "Appellation" else "#228b22"
+        folium.GeoJson(
+            {"type": "FeatureCollection", "features": features},
+            name=ftype,
+            style_function=lambda x, c=color, t=ftype: {
+                'fillColor': c,
+                'color': c,
+                'weight': 1 if t == 'Appellation' else 2,
+                'fillOpacity': 0.4 if t == 'Appellation' else 0.6
+            },
+            tooltip=folium.GeoJsonTooltip(fields=["ftype", "name"], labels=False),
+            popup=folium.GeoJsonPopup(fields=["link"], labels=False)
+        ).add_to(fg)
+    
+    caption = f"{len(names['Appellation'])} appellations, {len(names['Vineyard'])} vineyards in view"
+    if zoom < VINEYARD_MIN_ZOOM:
+        caption += " • zoom in to see vineyards"
+    if truncated:
+        caption += f" • showing the {VIEWPORT_MAX_FEATURES} largest, zoom in for more"
+    st.caption(caption)
+    
+    # 4. Render; the base map stays constant and features are swapped in dynamically
+    m = folium.Map(location=viewport["origin_center"], zoom_start=viewport["origin_zoom"])
+    add_tile_layers(m)
+    map_state = render_map(
+        m,
+        key=f"viewport_map_{selected_region.id}",
+        center=viewport["center"],
+        zoom=zoom,
+        feature_group_to_add=fg,
+        width="100%",
+        height=1000,
+        returned_objects=["bounds", "zoom", "center"]
+    )
+    
+    # 5. Viewport changed: remember it and redraw with the polygons now in view
+    parsed = _parse_viewport(map_state)
+    if parsed:
+        bbox, new_zoom, center = parsed
+        if bbox != tuple(viewport["bbox"]) or new_zoom != zoom:
+            viewport.update({"bbox": bbox, "zoom": new_zoom, "center": center})
+            st.session_state["map_viewport"] = viewport
+            st.rerun()
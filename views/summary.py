@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from shared import get_session, engine, TYPE_COLORS, get_region_colors_map
-from sqlalchemy import func
-from shared import TastingNote, Bottle, Wine, Place, RestaurantVisit
+from datetime import date
+from shared import engine, TYPE_COLORS, get_region_colors_map, cached_query
+from stats import ensure_stats, stats_select, michelin_select, drink_window_select
 
 def render_colored_bar(label, value, total, color, suffix=""):
     percent = (value / total) * 100 if total > 0 else 0
@@ -19,10 +19,23 @@ def render_colored_bar(label, value, total, color, suffix=""):
         </div>
     """, unsafe_allow_html=True)
 
-def sort_vintage(v):
-    if not v or v == "NV": return 9999
-    try: return int(v)
-    except: return 0
+def vintage_counts(stats, metric, name):
+    """Vintage groups in year order (numeric year stored in ref_id), NV variants last, unparsed first."""
+    rows = stat_rows(stats, "vintage")
+    order = rows["ref_id"].fillna(0).mask(rows["is_nv"].fillna(False).astype(bool), 9999)
+    counts = rows.assign(order=order).sort_values("order", kind="stable").set_index("label")[metric].rename(name)
+    counts.index.name = "Vintage"
+    return counts
+
+def load_stats(scope):
+    """Dashboard aggregates for "tastings" or "cellar" (see stats.py), through the query cache."""
+    ensure_stats(engine)
+    return cached_query(stats_select(scope))
+
+def stat_rows(stats, dimension):
+    """Groups of one dimension, largest first (NULL groups dropped, like value_counts)."""
+    rows = stats[(stats["dimension"] == dimension) & (stats["group_key"] != "")]
+    return rows.reset_index(drop=True)
 
 def view_summary():
     st.markdown('# :material/pie_chart: Intelligence Dashboard', unsafe_allow_html=True)
@@ -35,72 +48,31 @@ def view_summary():
         render_cellar_summary()
 
 def render_tasting_summary():
-    session = get_session()
-    total_notes = session.query(TastingNote).count()
-    unique_wines = session.query(func.count(func.distinct(Wine.id))).join(Bottle).join(TastingNote).scalar()
-    #avg_rating = session.query(func.avg(TastingNote.rating)).scalar() or 0
-    
-    # Calculate Michelin Stats
-    # 1. Unique Places Visited (Tastings or Visits) that have stars
-    star_places = session.query(Place).filter(Place.michelin_stars > 0).all()
+    stats = load_stats("tastings")
+    totals = stats[stats["dimension"] == "all"].iloc[0]
+    total_notes = int(totals["count"])
+    unique_wines = len(stat_rows(stats, "wine"))
     
-    # Places from Tasting Notes
-    tasting_place_ids = {r[0] for r in session.query(TastingNote.place_id).distinct()}
-    # Places from Visits
-    visit_place_ids = {r[0] for r in session.query(RestaurantVisit.place_id).distinct()}
-    
-    all_visited_ids = tasting_place_ids.union(visit_place_ids)
-    
-    # Sum stars for unique visited places
-    unique_michelin_stars = 0
-    for p in star_places:
-        if p.id in all_visited_ids:
-            unique_michelin_stars += p.michelin_stars
-            
-    # 2. Total Cumulative Stars (Sum of stars for every visit day)
-    # Get distinct (date, place_id) from tastings
-    tasting_visits = session.query(TastingNote.date, TastingNote.place_id).distinct().all()
-    # Get distinct (date, place_id) from visits
-    manual_visits = session.query(RestaurantVisit.date, RestaurantVisit.place_id).distinct().all()
-    
-    # Combine into a set of (date, place_id) to deduplicate same-day overlapping
-    all_visits_set = set(tasting_visits).union(set(manual_visits))
-    
-    total_cumulative_stars = 0
-    # Create map for fast lookup
-    place_stars_map = {p.id: p.michelin_stars for p in star_places}
-    
-    for date, place_id in all_visits_set:
-        stars = place_stars_map.get(place_id, 0)
-        total_cumulative_stars += stars
+    # Michelin metrics in one SQL query over the UNION of tasting and visit (date, place) pairs
+    stars = cached_query(michelin_select()).iloc[0]
+    unique_michelin_stars = int(stars["unique_stars"])
+    total_cumulative_stars = int(stars["total_stars"])
 
     m1, m2, m3, m4 = st.columns(4)
     m1.metric("Total Tasting Notes", total_notes)
     m2.metric("Unique Wines", unique_wines)
     m3.metric("Unique Michelin Stars", unique_michelin_stars, help="Sum of stars of unique restaurants visited")
     m4.metric("Total Stars Experience", total_cumulative_stars, help="Sum of stars accumulated over all visits")
-    session.close()
     st.divider()
 
-    query = """
-        SELECT w.type as "Color", r.name as "Region", p.name as "Producer", p.id as "pid",
-               a.name as "Appellation", a.id as "aid", w.vintage as "Vintage", t.rating as "Rating"
-        FROM tasting_notes t
-        JOIN cellar b ON t.bottle_id = b.id
-        JOIN wines w ON b.wine_id = w.id
-        JOIN producers p ON w.producer_id = p.id
-        LEFT JOIN regions r ON w.region_id = r.id
-        LEFT JOIN appellations a ON w.appellation_id = a.id
-    """
-    df = pd.read_sql(query, engine)
-    if df.empty:
+    if not total_notes:
         st.info("No tasting notes found.")
         return
 
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("Distribution by Color")
-        counts = df["Color"].value_counts().reset_index()
+        counts = stat_rows(stats, "color")[["label", "count"]]
         counts.columns = ["Color", "Count"] # Explicitly rename
         
         # Prepare color scale
@@ -119,80 +91,67 @@ def render_tasting_summary():
         
         st.write("")
         st.subheader("Top 10 Domaines")
-        # Color by Region. Group by Producer + Region
-        top_prods = df.groupby(["Producer", "pid", "Region"]).size().reset_index(name="Count").sort_values("Count", ascending=False).head(10)
+        # Color by Region
+        top_prods = stat_rows(stats, "producer").head(10)
         
         for _, row in top_prods.iterrows():
-            color = region_colors.get(row["Region"], "#7b68ee")
-            label = row["Producer"]
-            pid_int = int(row["pid"]) if pd.notnull(row["pid"]) else 0
+            color = region_colors.get(row["region"], "#7b68ee")
+            label = row["label"]
+            pid_int = int(row["ref_id"]) if pd.notnull(row["ref_id"]) else 0
             if pid_int:
-                 label = f'<a href="/?page=Producer+Detail&id={pid_int}" target="_self" style="text-decoration:none; color:inherit;">{row["Producer"]}</a>'
+                 label = f'<a href="/?page=Producer+Detail&id={pid_int}" target="_self" style="text-decoration:none; color:inherit;">{row["label"]}</a>'
             
-            render_colored_bar(label, row["Count"], df.shape[0], color)
+            render_colored_bar(label, int(row["count"]), total_notes, color)
         
         st.write("")
         st.subheader("Top 10 Appellations")
-        # st.dataframe(df["Appellation"].value_counts().head(10).reset_index(name="Notes"), hide_index=True, width="stretch")
-        top_apps = df.groupby(["Appellation", "aid", "Region"]).size().reset_index(name="Count").sort_values("Count", ascending=False).head(10)
+        top_apps = stat_rows(stats, "appellation").head(10)
         
         for _, row in top_apps.iterrows():
-            color = region_colors.get(row["Region"], "#7b68ee")
-            label = row["Appellation"]
+            color = region_colors.get(row["region"], "#7b68ee")
+            label = row["label"]
             # Add Link
-            aid_int = int(row["aid"]) if pd.notnull(row["aid"]) else 0
+            aid_int = int(row["ref_id"]) if pd.notnull(row["ref_id"]) else 0
             if aid_int:
                  # Use HTML a tag for render_colored_bar compatibility
-                 label = f'<a href="/?page=Appellation+Detail&id={aid_int}" target="_self" style="text-decoration:none; color:inherit;">{row["Appellation"]}</a>'
+                 label = f'<a href="/?page=Appellation+Detail&id={aid_int}" target="_self" style="text-decoration:none; color:inherit;">{row["label"]}</a>'
             
-            render_colored_bar(label, row["Count"], df.shape[0], color)
+            render_colored_bar(label, int(row["count"]), total_notes, color)
 
     with c2:
         st.subheader("Distribution by Region")
-        counts = df["Region"].value_counts().reset_index()
-        counts.columns = ["Region", "count"]
+        counts = stat_rows(stats, "region")
         total = counts["count"].sum()
         for _, row in counts.iterrows():
-            render_colored_bar(row["Region"], row["count"], total, region_colors.get(row["Region"], "#7b68ee"))
+            render_colored_bar(row["label"], int(row["count"]), total, region_colors.get(row["label"], "#7b68ee"))
 
     st.write("")
     st.subheader("Vintage Distribution")
-    vintages = sorted(df["Vintage"].unique().tolist(), key=sort_vintage)
-    v_counts = df["Vintage"].value_counts().reindex(vintages).reset_index(name="Count")
-    st.bar_chart(v_counts.set_index("Vintage"))
+    st.bar_chart(vintage_counts(stats, "count", "Count"))
 
 def render_cellar_summary():
-    session = get_session()
-    total_bottles = session.query(func.sum(Bottle.qty)).filter(Bottle.qty > 0).scalar() or 0
-    total_value = session.query(func.sum(Bottle.qty * Bottle.price)).filter(Bottle.qty > 0).scalar() or 0
-    unique_wines = session.query(func.count(func.distinct(Wine.id))).join(Bottle).filter(Bottle.qty > 0).scalar() or 0
+    # Pre-grouped cellar_inventory aggregates (see stats.py)
+    stats = load_stats("cellar")
+    totals = stats[stats["dimension"] == "all"].iloc[0]
+    total_bottles = int(totals["qty"]) if pd.notnull(totals["qty"]) else 0
+    total_value = totals["value"] if pd.notnull(totals["value"]) else 0
+    unique_wines = len(stat_rows(stats, "wine"))
     
     m1, m2, m3 = st.columns(3)
     m1.metric("Total Bottles", total_bottles)
     m2.metric("Unique Wines", unique_wines)
     m3.metric("Estimated Value", f"${total_value:,.0f}")
-    session.close()
     st.divider()
 
-    query = """
-        SELECT w.type as "Color", r.name as "Region", p.name as "Producer", p.id as "pid",
-               a.name as "Appellation", a.id as "aid", w.vintage as "Vintage", b.qty as "Qty", b.price as "Price"
-        FROM cellar b
-        JOIN wines w ON b.wine_id = w.id
-        JOIN producers p ON w.producer_id = p.id
-        LEFT JOIN regions r ON w.region_id = r.id
-        LEFT JOIN appellations a ON w.appellation_id = a.id
-        WHERE b.qty > 0
-    """
-    df = pd.read_sql(query, engine)
-    if df.empty:
+    if not totals["count"]:
         st.info("No bottles found in cellar.")
         return
 
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("Quantity by Color")
-        counts = df.groupby("Color")["Qty"].sum().reset_index()
+        counts = stat_rows(stats, "color")[["label", "qty"]]
+        counts.columns = ["Color", "Qty"]
         
         # Prepare color scale
         domain = [k for k in TYPE_COLORS.keys()]
@@ -210,29 +169,36 @@ def render_cellar_summary():
         
         st.write("")
         st.subheader("Top 10 Domaines (Inventory)")
-        # st.dataframe(df.groupby("Producer")["Qty"].sum().sort_values(ascending=False).head(10).reset_index(name="Bottles"), hide_index=True, width="stretch")
-        top_prods = df.groupby(["Producer", "pid", "Region"])["Qty"].sum().reset_index(name="Qty").sort_values("Qty", ascending=False).head(10)
-        total_btls = df["Qty"].sum()
+        top_prods = stat_rows(stats, "producer").sort_values("qty", ascending=False, kind="stable").head(10)
         
         for _, row in top_prods.iterrows():
-            color = region_colors.get(row["Region"], "#7b68ee")
-            label = row["Producer"]
-            pid_int = int(row["pid"]) if pd.notnull(row["pid"]) else 0
+            color = region_colors.get(row["region"], "#7b68ee")
+            label = row["label"]
+            pid_int = int(row["ref_id"]) if pd.notnull(row["ref_id"]) else 0
             if pid_int:
-                 label = f'<a href="/?page=Producer+Detail&id={pid_int}" target="_self" style="text-decoration:none; color:inherit;">{row["Producer"]}</a>'
+                 label = f'<a href="/?page=Producer+Detail&id={pid_int}" target="_self" style="text-decoration:none; color:inherit;">{row["label"]}</a>'
             
-            render_colored_bar(label, int(row["Qty"]), total_btls, color, suffix=" btls")
+            render_colored_bar(label, int(row["qty"]), total_bottles, color, suffix=" btls")
 
 
     with c2:
         st.subheader("Quantity by Region")
-        counts = df.groupby("Region")["Qty"].sum().sort_values(ascending=False).reset_index()
-        total = counts["Qty"].sum()
+        counts = stat_rows(stats, "region").sort_values("qty", ascending=False, kind="stable")
+        total = counts["qty"].sum()
         for _, row in counts.iterrows():
-            render_colored_bar(row["Region"], int(row["Qty"]), total, region_colors.get(row["Region"], "#7b68ee"), suffix=" btls")
+            render_colored_bar(row["label"], int(row["qty"]), total, region_colors.get(row["label"], "#7b68ee"), suffix=" btls")
 
     st.write("")
     st.subheader("Vintage Distribution (Inventory)")
-    vintages = sorted(df["Vintage"].unique().tolist(), key=sort_vintage)
-    v_counts = df.groupby("Vintage")["Qty"].sum().reindex(vintages).reset_index(name="Bottles")
-    st.bar_chart(v_counts.set_index("Vintage"))
+    st.bar_chart(vintage_counts(stats, "qty", "Bottles"))
+
+    # Drinking window range query on wines (see stats.drink_window_select)
+    year = date.today().year
+    st.write("")
+    st.subheader(f"Ready to Drink in {year}")
+    ready = cached_query(drink_window_select(year))
+    if ready.empty:
+        st.caption("No bottles in stock with a drinking window covering this year.")
+    total = ready["bottles"].sum()
+    for _, row in ready.iterrows():
+        render_colored_bar(row["region"], int(row["bottles"]), total, region_colors.get(row["region"], "#7b68ee"), suffix=" btls")
@@ -1,19 +1,78 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from sqlalchemy import func
-from shared import get_session, engine
-from ui_utils import apply_colors, render_table, navigate_to
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, func, literal
+from shared import get_session, read_engine, fetch_page, keyset_window
+from ui_utils import apply_colors, render_table, navigate_to, pager_cursor, render_pager
+from ui_utils import link_column, url_label, cuvee_label, vintage_label
 from shared import (
-    TastingNote, Place, RestaurantVisit
+    TastingNote, Place, RestaurantVisit, Bottle, Wine, Producer, Region, Appellation, Varietal
 )
 
+# Tasting location: the place name, or the free-text location when no place is linked
+LOCATION = func.coalesce(Place.name, TastingNote.location)
+
+NOTE_COLUMNS = [
+    Wine.type.label("Color"),
+    Region.name.label("Region"),
+    Producer.name.label("Domaine"),
+    Wine.cuvee.label("Cuvee"),
+    Appellation.name.label("Appellation"),
+    Varietal.name.label("Varietal"),
+    Wine.blend.label("Blend"),
+    Wine.vintage.label("Vintage"),
+    Wine.disgorgement_date.label("Disgorgement"),
+    TastingNote.date.label("Date"),
+    TastingNote.sequence.label("Seq"),
+    Bottle.provenance.label("Provenance"),
+    Bottle.bottle_size.label("Format"),
+    Bottle.price.label("Price"),
+    TastingNote.glasses.label("Glasses"),
+    LOCATION.label("Location"),
+    TastingNote.notes.label("Notes"),
+    Wine.rp_score.label("RP"),
+    Place.city.label("City"), Place.michelin_stars.label("Stars"), Place.lat.label("Lat"), Place.lng.label("Lng"),
+    Producer.id.label("pid"), Wine.id.label("wid"), TastingNote.id.label("tid"), Place.id.label("plid"), Appellation.id.label("aid"),
+]
+
+# List order: newest first; the note id makes the keyset unique
+SORT_KEYS = [
+    (func.coalesce(TastingNote.date, literal(date.min)), True),
+    (TastingNote.id, True),
+]
+
+# Visits shown next to a page of notes: the same (date, id) keyset, so a visit on a page
+# boundary date lands on exactly one page (ids only break ties between dates)
+VISIT_KEYS = [
+    (func.coalesce(RestaurantVisit.date, literal(date.min)), True),
+    (RestaurantVisit.id, True),
+]
+
+def _notes_select(*columns):
+    """SELECT over tasting notes joined to their bottle, wine, producer, region, appellation, varietal and place."""
+    return (
+        select(*columns)
+        .select_from(TastingNote)
+        .join(Bottle, TastingNote.bottle_id == Bottle.id)
+        .join(Wine, Bottle.wine_id == Wine.id)
+        .join(Producer, Wine.producer_id == Producer.id)
+        .outerjoin(Region, Wine.region_id == Region.id)
+        .outerjoin(Appellation, Wine.appellation_id == Appellation.id)
+        .outerjoin(Varietal, Wine.varietal_id == Varietal.id)
+        .outerjoin(Place, TastingNote.place_id == Place.id)
+    )
+
+def _distinct(conn, column, base):
+    rows = conn.execute(_notes_select(column).where(*base).distinct())
+    return sorted(r[0] for r in rows if r[0] is not None)
+
 def view_tasting_notes():
     st.markdown('# :material/wine_bar: Tastings', unsafe_allow_html=True)
     
     session = get_session()
     total_notes = session.query(TastingNote).count()
     avg_score = session.query(func.avg(TastingNote.rating)).scalar() or 0
+    session.close()
     m1, m2 = st.columns(2)
     
     with st.container(border=True):
@@ -29,66 +88,36 @@ def view_tasting_notes():
 
 
     # Handle filtering by Wine ID
-
+    base = []
     wid = st.query_params.get("wid")
-    
-    query = """
-        SELECT 
-            w.type as "Color",
-            r.name as "Region",
-            p.name as "Domaine",
-            w.cuvee as "Cuvee",
-            a.name as "Appellation",
-            v.name as "Varietal",
-            w.blend as "Blend",
-            w.vintage as "Vintage",
-            w.disgorgement_date as "Disgorgement",
-            t.date as "Date",
-            t.sequence as "Seq",
-            b.provenance as "Provenance",
-            b.bottle_size as "Format",
-            b.price as "Price",
-            t.glasses as "Glasses",
-            pl.name as "Location",
-            t.location as "loc_raw",
-            t.notes as "Notes",
-            w.rp_score as "RP",
-            pl.city as "City", pl.michelin_stars as "Stars", pl.lat as "Lat", pl.lng as "Lng",
-            p.id as "pid", w.id as "wid", t.id as "tid", pl.id as "plid", a.id as "aid"
-        FROM tasting_notes t
-        JOIN cellar b ON t.bottle_id = b.id
-        JOIN wines w ON b.wine_id = w.id
-        JOIN producers p ON w.producer_id = p.id
-        LEFT JOIN regions r ON w.region_id = r.id
-        LEFT JOIN appellations a ON w.appellation_id = a.id
-        LEFT JOIN varietals v ON w.varietal_id = v.id
-        LEFT JOIN places pl ON t.place_id = pl.id
-    """
-    
     if wid:
-        query += f" WHERE w.id = {wid}"
-        
-    query += " ORDER BY t.date DESC"
-    
-    df = pd.read_sql(query, engine)
-    session.close()
-    
-    if not df.empty:
-        df['Location'] = df['Location'].fillna(df['loc_raw'])
-        df['Vintage'] = df.apply(lambda x: f"{x['Vintage']} - {x['Disgorgement']}" if (x['Vintage'] == "NV" and pd.notnull(x['Disgorgement']) and x['Disgorgement']) else x['Vintage'], axis=1)
+        try:
+            base.append(Wine.id == int(wid))
+        except ValueError:
+            pass
+
+    # Filter options and date bounds from SQL; only the visible page of notes is fetched
+    with read_engine.connect() as conn:
+        min_date, data_max_date = conn.execute(_notes_select(func.min(TastingNote.date), func.max(TastingNote.date)).where(*base)).one()
+        if min_date is not None:
+            options = {
+                "Color": _distinct(conn, Wine.type, base),
+                "Region": _distinct(conn, Region.name, base),
+                "Producer": _distinct(conn, Producer.name, base),
+                "Location": _distinct(conn, LOCATION, base),
+            }
         
+    if min_date is not None:
         # --- FILTERS ---
         with st.container(border=True):
             f1, f2, f3, f4, f5 = st.columns(5)
             
-            sel_color = f1.multiselect("Color", sorted(df["Color"].unique()))
-            sel_region = f2.multiselect("Region", sorted(df["Region"].unique().tolist()))
-            sel_prod = f3.multiselect("Producer", sorted(df["Domaine"].unique().tolist()))
-            sel_loc = f4.multiselect("Location", sorted(df["Location"].unique().tolist()))
+            sel_color = f1.multiselect("Color", options["Color"])
+            sel_region = f2.multiselect("Region", options["Region"])
+            sel_prod = f3.multiselect("Producer", options["Producer"])
+            sel_loc = f4.multiselect("Location", options["Location"])
         
             # Date range filter
-            min_date = pd.to_datetime(df["Date"]).min().date()
-            data_max_date = pd.to_datetime(df["Date"]).max().date()
             today = datetime.now().date()
             picker_max_date = max(data_max_date, today)
             ytd_start = datetime(today.year, 1, 1).date()
@@ -121,26 +150,33 @@ def view_tasting_notes():
                     start_date = init_start
                     end_date = picker_max_date
         
-        # Apply filtering
-        filtered_df = df.copy()
-        if sel_color: filtered_df = filtered_df[filtered_df["Color"].isin(sel_color)]
-        if sel_region: filtered_df = filtered_df[filtered_df["Region"].isin(sel_region)]
-        if sel_prod: filtered_df = filtered_df[filtered_df["Domaine"].isin(sel_prod)]
-        if sel_loc: filtered_df = filtered_df[filtered_df["Location"].isin(sel_loc)]
+        # Apply filtering (SQL WHERE)
+        conditions = list(base)
+        if sel_color: conditions.append(Wine.type.in_(sel_color))
+        if sel_region: conditions.append(Region.name.in_(sel_region))
+        if sel_prod: conditions.append(Producer.name.in_(sel_prod))
+        if sel_loc: conditions.append(LOCATION.in_(sel_loc))
         
         # Apply Date Filter
         if selected_period != "All":
-             filtered_df = filtered_df[
-                (pd.to_datetime(filtered_df["Date"]).dt.date >= start_date) & 
-                (pd.to_datetime(filtered_df["Date"]).dt.date <= end_date)
-            ]
+            conditions.append(TastingNote.date.between(start_date, end_date))
 
-        if filtered_df.empty:
+        with read_engine.connect() as conn:
+            total_rows = conn.execute(_notes_select(func.count(TastingNote.id)).where(*conditions)).scalar()
+
+        if not total_rows:
             st.info("No notes match the selected filters.")
             return
 
+        signature = (wid, tuple(sel_color), tuple(sel_region), tuple(sel_prod), tuple(sel_loc), selected_period, start_date, end_date)
+        cursor, page_size = pager_cursor("tasting_pager", signature)
+        filtered_df, next_cursor = fetch_page(_notes_select(*NOTE_COLUMNS).where(*conditions), SORT_KEYS, cursor, page_size)
+        render_pager("tasting_pager", total_rows, next_cursor)
+        filtered_df['Vintage'] = vintage_label(filtered_df['Vintage'], filtered_df['Disgorgement'])
+
+        # If any wine-specific filter is active, we skip visits as they don't have these attributes
+        wine_filters_active = any([sel_color, sel_region, sel_prod])
 
-        # Tabs
         # Tabs
         tab_cards, tab_list, tab_map = st.tabs(["Cards", "List", "Map"])
         
@@ -148,11 +184,11 @@ def view_tasting_notes():
             if filtered_df.empty:
                  st.info("No notes match the selected filters.")
             else:
-                filtered_df['Domaine_Link'] = filtered_df.apply(lambda x: f"/?page=Producer+Detail&id={x['pid']}&label={x['Domaine'].replace(' ', '+')}", axis=1)
-                filtered_df['Cuvee_Link'] = filtered_df.apply(lambda x: f"/?page=Wine+Detail&id={x['wid']}&label={x['Cuvee'].replace(' ', '+') if pd.notnull(x['Cuvee']) and x['Cuvee'].strip() else '-'}", axis=1)
-                filtered_df['Seq_Link'] = filtered_df.apply(lambda x: f"/?page=Edit_Tasting&id={x['tid']}&label={int(x['Seq']) if pd.notnull(x['Seq']) else 0}", axis=1)
-                filtered_df['Location_Link'] = filtered_df.apply(lambda x: f"/?page=Place+Detail&id={x['plid']}&label={str(x['Location']).replace(' ', '+')}" if pd.notnull(x['plid']) else None, axis=1)
-                filtered_df['Appellation_Link'] = filtered_df.apply(lambda x: f"/?page=Appellation+Detail&id={int(x['aid'])}&label={x['Appellation'].replace(' ', '+')}" if pd.notnull(x['aid']) else x['Appellation'], axis=1)
+                filtered_df['Domaine_Link'] = link_column("Producer+Detail", filtered_df['pid'], url_label(filtered_df['Domaine']))
+                filtered_df['Cuvee_Link'] = link_column("Wine+Detail", filtered_df['wid'], cuvee_label(filtered_df['Cuvee']))
+                filtered_df['Seq_Link'] = link_column("Edit_Tasting", filtered_df['tid'], filtered_df['Seq'].fillna(0).astype(int).astype(str))
+                filtered_df['Location_Link'] = link_column("Place+Detail", filtered_df['plid'], url_label(filtered_df['Location']))
+                filtered_df['Appellation_Link'] = link_column("Appellation+Detail", filtered_df['aid'], url_label(filtered_df['Appellation']), fallback=filtered_df['Appellation'])
                 
                 # Prepare columns and renames
                 display_df = filtered_df.drop(columns=["Seq", "Location", "Appellation"], errors="ignore")
@@ -188,9 +224,6 @@ def view_tasting_notes():
                 # 1. Fetch Restaurant Visits (if not filtered out by wine attributes)
                 visits_data = []
                 
-                # If any wine-specific filter is active, we skip visits as they don't have these attributes
-                wine_filters_active = any([sel_color, sel_region, sel_prod])
-                
                 if not wine_filters_active:
                     session = get_session()
                     from sqlalchemy.orm import joinedload
@@ -200,9 +233,12 @@ def view_tasting_notes():
                     if selected_period != "All":
                         v_query = v_query.filter(RestaurantVisit.date >= start_date, RestaurantVisit.date <= end_date)
                         
+                    # Only visits within this page's keyset window of notes
+                    v_query = v_query.filter(*keyset_window(VISIT_KEYS, cursor, next_cursor))
+
                     # Apply Location Filter (if active)
                     if sel_loc:
-                        v_query = v_query.filter(Place.name.in_(sel_loc))
+                        v_query = v_query.filter(RestaurantVisit.place.has(Place.name.in_(sel_loc)))
                         
                     visits = v_query.all()
                     
@@ -295,45 +331,40 @@ def view_tasting_notes():
                     session.close()
 
         with tab_map:
-            # Aggregate unique places with coordinates
+            # Aggregate unique places with coordinates over all matching notes (not just this page)
             unique_places = {}
+            geocoded = [Place.lat.isnot(None), Place.lng.isnot(None)]
 
+            with read_engine.connect() as conn:
             # 1. From Visits
-            if wine_filters_active == False:
-                 # visits are already fetched
-                 if 'visits' in locals():
-                     for v in visits:
-                         if v.place and v.place.lat and v.place.lng:
-                             unique_places[v.place.id] = {
-                                 "name": v.place.name,
-                                 "lat": v.place.lat,
-                                 "lng": v.place.lng,
-                                 "count": 1, 
-                                 "type": "Visit"
-                             }
-            
-            # 2. From filtered_df
-            if not filtered_df.empty:
-                # Iterate rows to find places
-                # ensure we have Lat/Lng columns
-                if "Lat" in filtered_df.columns and "Lng" in filtered_df.columns:
-                     for _, row in filtered_df.iterrows():
-                         if pd.notnull(row["Lat"]) and pd.notnull(row["Lng"]):
-                             pid = int(row["plid"])
-                             if pid not in unique_places:
-                                 unique_places[pid] = {
-                                     "name": row["Location"],
-                                     "lat": row["Lat"],
-                                     "lng": row["Lng"],
-                                     "count": 0,
-                                     "type": "Tasting"
-                                 }
-                             unique_places[pid]["count"] += 1
+                if not wine_filters_active:
+                    v_query = (
+                        select(Place.id, Place.name, Place.lat, Place.lng, func.count(RestaurantVisit.id))
+                        .join(Place, RestaurantVisit.place_id == Place.id)
+                        .where(*geocoded)
+                        .group_by(Place.id, Place.name, Place.lat, Place.lng)
+                    )
+                    if selected_period != "All":
+                        v_query = v_query.where(RestaurantVisit.date.between(start_date, end_date))
+                    if sel_loc:
+                        v_query = v_query.where(Place.name.in_(sel_loc))
+                    for pid, name, lat, lng, count in conn.execute(v_query):
+                        unique_places[pid] = {"name": name, "lat": lat, "lng": lng, "count": count, "type": "Visit"}
+
+                # 2. From matching tasting notes
+                t_query = (
+                    _notes_select(Place.id, Place.name, Place.lat, Place.lng, func.count(TastingNote.id))
+                    .where(*conditions, *geocoded)
+                    .group_by(Place.id, Place.name, Place.lat, Place.lng)
+                )
+                for pid, name, lat, lng, count in conn.execute(t_query):
+                    if pid not in unique_places:
+                        unique_places[pid] = {"name": name, "lat": lat, "lng": lng, "count": 0, "type": "Tasting"}
+                    unique_places[pid]["count"] += count
 
             if unique_places:
                 import folium
-                from streamlit_folium import st_folium
-                from geo_utils import add_tile_layers
+                from geo_utils import add_tile_layers, render_map
 
                 # Determine center
                 lats = [d['lat'] for d in unique_places.values()]
@@ -371,7 +402,7 @@ def view_tasting_notes():
                         icon=folium.Icon(color="red", icon="cutlery", prefix='fa')
                     ).add_to(m)
                 
-                st_folium(m, height=500, width="100%", returned_objects=[])
+                render_map(m, height=500, width="100%", returned_objects=[])
                 
             else:
                 st.info("No geocoded places data available for current selection.")